@@ -2,8 +2,14 @@
 import argparse
 import os
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import Manager
+from queue import Empty
 
-from slice_tools.slice_ops import boundary_slice
+from slice_tools.ffmpeg_utils import probe_media
+from slice_tools.manifest import MODES, Journal, load_manifest
+from slice_tools.slice_ops import accurate_cut, boundary_slice, make_gif
 from slice_tools.timecode import parse_timecode
 
 
@@ -13,20 +19,191 @@ def ensure_output_dir(path):
         os.makedirs(output_dir, exist_ok=True)
 
 
+def _init_worker(log_path):
+    # Workers' ffmpeg output would shred the progress line; send it (and the
+    # "Executing command:" echo) to the log instead. dup2 so ffmpeg children
+    # inherit it too.
+    fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+
+
+def _run_cut(cut, progress, chunks):
+    """Worker: one manifest row. Returns (row, method, error, seconds)."""
+    t0 = time.monotonic()
+
+    def on_progress(pct):
+        progress.put((cut.row, pct))
+
+    try:
+        if not os.path.isfile(cut.input):
+            raise FileNotFoundError(f"input not found: {cut.input}")
+        ensure_output_dir(cut.output)
+        print(f"--- row {cut.row}: {cut.mode} {cut.input} -> {cut.output}", flush=True)
+        if cut.mode == "gif":
+            make_gif(cut.input, cut.output, cut.start, cut.end, progress_cb=on_progress)
+            method = "gif"
+        elif cut.mode == "accurate":
+            method = accurate_cut(cut.input, cut.output, cut.start, cut.end,
+                                  progress_cb=on_progress, chunks=chunks)
+        else:
+            method = boundary_slice(cut.input, cut.output, cut.start, cut.end)
+        return cut.row, method, None, time.monotonic() - t0
+    except Exception as exc:
+        print(f"--- row {cut.row} FAILED: {exc}", flush=True)
+        return cut.row, None, str(exc), time.monotonic() - t0
+
+
+class _ProgressLine:
+    """One status line for the whole batch, redrawn in place on a terminal."""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.running = {}  # row -> pct, for cuts that report progress
+        self.active = 0
+        self.tty = sys.stderr.isatty()
+        self._last_width = 0
+
+    def draw(self, force=False):
+        if not self.tty and not force:
+            return
+        finished = self.skipped + self.done + self.failed
+        partial = sum(self.running.values()) / 100
+        pct = (finished + partial) / self.total * 100 if self.total else 100
+        text = (f"[{finished}/{self.total}] {pct:5.1f}%  "
+                f"{self.active} running, {self.failed} failed")
+        if self.tty:
+            sys.stderr.write("\r" + text.ljust(self._last_width))
+            self._last_width = len(text)
+        else:
+            sys.stderr.write(text + "\n")
+        sys.stderr.flush()
+
+    def note(self, message):
+        # Print above the status line rather than through it.
+        if self.tty:
+            sys.stderr.write("\r" + " " * self._last_width + "\r")
+        sys.stderr.write(message + "\n")
+        self.draw()
+
+
+def run_manifest(args):
+    if args.input_path and not os.path.isfile(args.input_path):
+        print(f"Input file not found: {args.input_path}", file=sys.stderr)
+        return 1
+
+    fps = args.fps
+    if fps is None and args.manifest.lower().endswith(".edl") and args.input_path:
+        fps = probe_media(args.input_path).fps
+    try:
+        cuts = load_manifest(args.manifest, default_input=args.input_path,
+                             output_dir=args.output_dir, default_mode=args.mode, fps=fps)
+    except (OSError, ValueError) as exc:
+        print(f"Bad manifest: {exc}", file=sys.stderr)
+        return 1
+
+    journal_path = args.journal or args.manifest + ".journal"
+    if args.restart and os.path.exists(journal_path):
+        os.remove(journal_path)
+    journal = Journal(journal_path)
+    todo = [c for c in cuts if not journal.is_done(c)]
+    log_path = os.path.splitext(journal_path)[0] + ".log"
+
+    display = _ProgressLine(len(cuts), len(cuts) - len(todo))
+    if display.skipped:
+        display.note(f"Resuming: {display.skipped} of {len(cuts)} cuts already done "
+                     f"(journal {journal_path})")
+    if not todo:
+        display.draw(force=True)
+        return 0
+    display.note(f"Cutting {len(todo)} clips with {args.jobs} worker(s); "
+                 f"ffmpeg output -> {log_path}")
+
+    # accurate_cut parallelises a long encode across the cores by itself; with
+    # several cuts already running side by side, one process each is enough.
+    chunks = 1 if args.jobs > 1 else None
+    by_row = {c.row: c for c in todo}
+    with Manager() as manager, ProcessPoolExecutor(
+            max_workers=args.jobs, initializer=_init_worker,
+            initargs=(log_path,)) as pool:
+        progress = manager.Queue()
+        pending = {pool.submit(_run_cut, c, progress, chunks) for c in todo}
+        while pending:
+            display.active = min(args.jobs, len(pending))
+            finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            while True:
+                try:
+                    row, pct = progress.get_nowait()
+                except Empty:
+                    break
+                display.running[row] = pct
+            for future in finished:
+                row, method, error, secs = future.result()
+                cut = by_row[row]
+                display.running.pop(row, None)
+                if error:
+                    display.failed += 1
+                    journal.record(cut, "failed", error=error)
+                    display.note(f"row {row} FAILED: {error}")
+                else:
+                    display.done += 1
+                    journal.record(cut, "done", method=method, seconds=round(secs, 2))
+            display.draw()
+    display.active = 0
+    display.draw(force=True)
+    if display.tty:
+        sys.stderr.write("\n")
+    return 1 if display.failed else 0
+
+
 def main():
     parser = argparse.ArgumentParser(
         description=(
-            "Slice videos with frame-accurate boundaries by transcoding "
-            "to an intraframe intermediate."
+            "Slice videos with frame-accurate boundaries by stream-copying "
+            "whole GOPs and re-encoding only up to the keyframes at each cut."
+        ),
+        epilog=(
+            "Time format: ss, mm:ss, or hh:mm:ss (fractions in seconds ok). "
+            "With --manifest, INPUT_PATH (optional) is the source for rows "
+            "that don't name one."
         ),
-        epilog="Time format: ss, mm:ss, or hh:mm:ss (fractions in seconds ok).",
     )
-    parser.add_argument("input_path", help="Input video file path.")
-    parser.add_argument("output_path", help="Output video file path.")
-    parser.add_argument("start", help="Start time (ss, mm:ss, or hh:mm:ss).")
-    parser.add_argument("stop", help="Stop time (ss, mm:ss, or hh:mm:ss).")
+    parser.add_argument("input_path", nargs="?", help="Input video file path.")
+    parser.add_argument("output_path", nargs="?", help="Output video file path.")
+    parser.add_argument("start", nargs="?", help="Start time (ss, mm:ss, or hh:mm:ss).")
+    parser.add_argument("stop", nargs="?", help="Stop time (ss, mm:ss, or hh:mm:ss).")
+    parser.add_argument("--manifest", metavar="CUTS",
+                        help="Cut list (.csv, .json or .edl) to run as a batch.")
+    parser.add_argument("--mode", choices=MODES, default="fast",
+                        help="Mode for manifest rows that don't set one (default: fast).")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Cuts to run at once in manifest mode (default: 1).")
+    parser.add_argument("--output-dir",
+                        help="Where manifest rows without an output go "
+                             "(default: next to the manifest).")
+    parser.add_argument("--journal",
+                        help="Resume journal (default: CUTS.journal).")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the journal and redo every cut.")
+    parser.add_argument("--fps", type=float,
+                        help="Frame rate for EDL timecodes (default: probed from INPUT_PATH).")
     args = parser.parse_args()
 
+    if args.manifest:
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        return run_manifest(args)
+
+    if not (args.input_path and args.output_path and args.start and args.stop):
+        parser.error("input_path, output_path, start and stop are required "
+                     "(or use --manifest)")
+
     if not os.path.isfile(args.input_path):
         print(f"Input file not found: {args.input_path}", file=sys.stderr)
         return 1
@@ -1,13 +1,12 @@
 # Written almost entirely by ChatGPT4
 
-import json
 import os
-import subprocess
 import sys
 import tempfile
 
 from apply_overlay import apply_overlay
 from generate_overlay import create_text_overlay
+from slice_tools.ffmpeg_utils import probe_media
 
 USAGE = """Usage:
   python overlay.py <video_file_path> <video_output_path> <overlay_text> [overlay_text_bottom_right]
@@ -20,23 +19,8 @@ Options:
 
 
 def get_video_dimensions(video_path):
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-select_streams",
-        "v:0",
-        "-show_entries",
-        "stream=width,height",
-        "-of",
-        "json",
-        video_path,
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
-    video_info = json.loads(result.stdout)
-    width = video_info["streams"][0]["width"]
-    height = video_info["streams"][0]["height"]
-    return width, height
+    media = probe_media(video_path)
+    return media.width, media.height
 
 
 def print_usage(exit_code):
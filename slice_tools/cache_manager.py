@@ -0,0 +1,197 @@
+"""Byte budgets for the directories slice_ui fills with derived files.
+
+Each managed directory (an "area": preview blocks, waveforms, uploads) gets a
+budget; when a new file pushes an area over it, the least recently used files
+go first. The access-time index is the files' own atime: touch() stamps it
+explicitly, so the order survives restarts and doesn't depend on how the
+filesystem is mounted, and a startup scan rebuilds the in-memory view from it.
+
+Files that are pinned (open in a response, read by a running job) or were used
+within the last `min_age` seconds (just built, about to be served) are never
+evicted, nor are in-progress temp files.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+# Stamping atime costs a syscall; once a minute per file is plenty for LRU.
+_TOUCH_INTERVAL = 60.0
+
+
+def parse_size(text):
+    """'20G', '512M', '1.5T', '1000000' -> bytes. 0 / 'none' means unlimited."""
+    value = str(text).strip().upper().removesuffix("B").removesuffix("I")
+    if value in ("", "0", "NONE", "UNLIMITED"):
+        return None
+    unit = value[-1] if value[-1] in _UNITS else ""
+    number = value[:-1] if unit else value
+    try:
+        size = float(number) * _UNITS[unit]
+    except ValueError:
+        raise ValueError(f"bad size {text!r} (use e.g. 512M, 20G)") from None
+    if size < 0:
+        raise ValueError(f"bad size {text!r}")
+    return int(size)
+
+
+def _is_temp(name):
+    return ".part." in name or name.endswith(".tmp")
+
+
+class _Area:
+    def __init__(self, name, directory, budget):
+        self.name = name
+        self.directory = os.path.abspath(directory)
+        self.budget = budget
+        self.entries = {}  # path -> [size, last_used, last_stamped]
+        self.bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+
+class CacheManager:
+    """LRU eviction over a few directories, each with its own byte budget."""
+
+    def __init__(self, min_age=60.0):
+        self.min_age = min_age
+        self._areas = {}
+        self._pins = {}  # path -> count
+        self._lock = threading.Lock()
+
+    def add_area(self, name, directory, budget=None):
+        with self._lock:
+            self._areas[name] = _Area(name, directory, budget)
+
+    def set_budget(self, name, budget):
+        with self._lock:
+            self._areas[name].budget = budget
+
+    def _area_for(self, path):
+        parent = os.path.dirname(os.path.abspath(path))
+        for area in self._areas.values():
+            if parent == area.directory:
+                return area
+        return None
+
+    def scan(self):
+        """Index what's already on disk (by atime), then enforce every budget."""
+        for area in list(self._areas.values()):
+            found = {}
+            try:
+                with os.scandir(area.directory) as it:
+                    for entry in it:
+                        if not entry.is_file(follow_symlinks=False) or _is_temp(entry.name):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        last = max(st.st_atime, st.st_mtime)
+                        found[entry.path] = [st.st_size, last, last]
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                # Keep anything touched while the scan ran.
+                found.update(area.entries)
+                area.entries = found
+                area.bytes = sum(e[0] for e in found.values())
+            self.enforce(area.name)
+
+    def start(self):
+        """Scan in the background so a big cache doesn't hold up startup."""
+        threading.Thread(target=self.scan, name="cache-scan", daemon=True).start()
+
+    def touch(self, path):
+        """Record a use of `path`; a new file also triggers its area's budget."""
+        area = self._area_for(path)
+        if area is None:
+            return
+        now = time.time()
+        with self._lock:
+            entry = area.entries.get(path)
+            is_new = entry is None
+            if is_new:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    return
+                entry = area.entries[path] = [size, now, 0.0]
+                area.bytes += size
+            entry[1] = now
+            stamp = now - entry[2] >= _TOUCH_INTERVAL
+            if stamp:
+                entry[2] = now
+        if stamp:
+            try:
+                st = os.stat(path)
+                os.utime(path, (now, st.st_mtime))
+            except OSError:
+                pass
+        if is_new:
+            self.enforce(area.name)
+
+    def acquire(self, path):
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def release(self, path):
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    @contextmanager
+    def pinned(self, path):
+        self.acquire(path)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def enforce(self, name):
+        """Evict least recently used files until area `name` fits its budget."""
+        with self._lock:
+            area = self._areas[name]
+            if area.budget is None or area.bytes <= area.budget:
+                return
+            cutoff = time.time() - self.min_age
+            victims = []
+            excess = area.bytes - area.budget
+            for path, (size, last_used, _) in sorted(area.entries.items(),
+                                                     key=lambda kv: kv[1][1]):
+                if excess <= 0:
+                    break
+                if last_used > cutoff or path in self._pins:
+                    continue
+                victims.append((path, size))
+                excess -= size
+            for path, size in victims:
+                del area.entries[path]
+                area.bytes -= size
+        for path, size in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            with self._lock:
+                area.evictions += 1
+                area.evicted_bytes += size
+
+    def stats(self):
+        with self._lock:
+            return {
+                area.name: {
+                    "path": area.directory,
+                    "budget": area.budget,
+                    "bytes": area.bytes,
+                    "entries": len(area.entries),
+                    "pinned": sum(1 for p in self._pins if self._area_for(p) is area),
+                    "evictions": area.evictions,
+                    "evicted_bytes": area.evicted_bytes,
+                }
+                for area in self._areas.values()
+            }
@@ -0,0 +1,173 @@
+"""What the local ffmpeg can do: its encoders, filters and hwaccels.
+
+Detected once per ffmpeg binary and kept in .working_copies/capabilities.json,
+keyed by the binary's path and mtime — an upgraded or swapped ffmpeg is
+re-queried, an unchanged one never is. Detection runs on a background thread so
+nothing waits on it at startup; the first lookup waits only if it is still
+running, and every later lookup is a set membership test.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+from slice_tools.fingerprint import WORKING_DIR
+
+CACHE_PATH = os.path.join(WORKING_DIR, "capabilities.json")
+_QUERY_TIMEOUT = 10
+
+
+def _run(binary, flag):
+    return subprocess.run([binary, "-hide_banner", flag], capture_output=True,
+                          text=True, timeout=_QUERY_TIMEOUT).stdout
+
+
+def _list_encoders(binary):
+    # A legend, a "------" rule, then " V....D libx264   description" rows.
+    out = _run(binary, "-encoders")
+    rows = out.split("------", 1)[1] if "------" in out else ""
+    return [line.split()[1] for line in rows.splitlines() if len(line.split()) >= 2]
+
+
+def _list_filters(binary):
+    # Rows are " TSC name  A->V  description"; legend lines have no "->".
+    return [parts[1] for parts in map(str.split, _run(binary, "-filters").splitlines())
+            if len(parts) >= 3 and "->" in parts[2]]
+
+
+def _list_hwaccels(binary):
+    # "Hardware acceleration methods:" then one name per line.
+    return [line.strip() for line in _run(binary, "-hwaccels").splitlines()[1:]
+            if line.strip()]
+
+
+class Capabilities:
+    """Encoder / filter / hwaccel availability for one ffmpeg binary."""
+
+    def __init__(self, binary="ffmpeg", cache_path=CACHE_PATH):
+        self.binary = binary
+        self.cache_path = cache_path
+        self.encoders = frozenset()
+        self.filters = frozenset()
+        self.hwaccels = frozenset()
+        self.source = None  # "disk", "ffmpeg" or "missing", once detected
+        self._ready = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def start(self, callback=None):
+        """Begin detection in the background (once); `callback(self)` runs when
+        it's done, straight away if it already is."""
+        with self._lock:
+            run_now = callback is not None and self._ready.is_set()
+            if callback is not None and not run_now:
+                self._callbacks.append(callback)
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._detect, name="ffmpeg-capabilities",
+                                 daemon=True).start()
+        if run_now:
+            callback(self)
+        return self
+
+    @property
+    def ready(self):
+        """Detection has finished; the lookups below won't block."""
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        self.start()
+        return self._ready.wait(timeout)
+
+    def has_encoder(self, name):
+        self.wait()
+        return name in self.encoders
+
+    def has_filter(self, name):
+        self.wait()
+        return name in self.filters
+
+    def has_hwaccel(self, name):
+        self.wait()
+        return name in self.hwaccels
+
+    def as_dict(self):
+        return {
+            "ready": self.ready,
+            "source": self.source,
+            "encoders": len(self.encoders),
+            "filters": len(self.filters),
+            "hwaccels": sorted(self.hwaccels),
+        }
+
+    def _detect(self):
+        try:
+            self._load()
+        except Exception as exc:
+            print(f"capabilities: detection failed ({exc})")
+        finally:
+            with self._lock:
+                self._ready.set()
+                callbacks, self._callbacks = self._callbacks, []
+            for cb in callbacks:
+                cb(self)
+
+    def _load(self):
+        path = shutil.which(self.binary)
+        if path is None:
+            self.source = "missing"
+            return
+        real = os.path.realpath(path)
+        key = f"{real}:{os.stat(real).st_mtime_ns}"
+
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        entry = cached.get(key)
+        if entry:
+            self._apply(entry)
+            self.source = "disk"
+            return
+
+        entry = {
+            "encoders": _list_encoders(real),
+            "filters": _list_filters(real),
+            "hwaccels": _list_hwaccels(real),
+        }
+        self._apply(entry)
+        self.source = "ffmpeg"
+        # Only one binary is ever current; an old key is just a stale entry.
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({key: entry}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _apply(self, entry):
+        self.encoders = frozenset(entry.get("encoders", ()))
+        self.filters = frozenset(entry.get("filters", ()))
+        self.hwaccels = frozenset(entry.get("hwaccels", ()))
+
+
+capabilities = Capabilities()
+
+
+def has_encoder(name):
+    return capabilities.has_encoder(name)
+
+
+def has_filter(name):
+    return capabilities.has_filter(name)
+
+
+def has_hwaccel(name):
+    return capabilities.has_hwaccel(name)
+
+
+def has_nvenc():
+    """True if ffmpeg exposes the NVENC encoders."""
+    return capabilities.has_encoder("h264_nvenc")
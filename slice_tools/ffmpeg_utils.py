@@ -1,11 +1,118 @@
 import json
+import os
 import shlex
+import shutil
+import signal
 import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
+from slice_tools.probe_cache import ProbeCache
 
-def run_cmd(cmd, check=True):
+
+class Cancelled(Exception):
+    """The CancelToken a command was running under fired."""
+
+
+class CancelToken:
+    """Lets another thread stop a running job and every ffmpeg it has started.
+
+    run_cmd / run_cmd_with_progress register their Popen here while it runs.
+    Children are started in their own session, so cancel() can signal the whole
+    process group — ffmpeg plus anything it spawned — with SIGTERM, then SIGKILL
+    whatever is still alive after `grace` seconds. Commands started after the
+    token fired never launch.
+    """
+
+    def __init__(self, grace=3.0):
+        self.grace = grace
+        self.cancelled = False
+        self._procs = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            procs = list(self._procs)
+        for proc in procs:
+            _terminate_group(proc, self.grace)
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled("cancelled")
+
+    def register(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+            fired = self.cancelled
+        if fired:
+            _terminate_group(proc, self.grace)
+
+    def unregister(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+
+def _terminate_group(proc, grace):
+    def signal_group(sig):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    if proc.poll() is not None:
+        return
+    signal_group(signal.SIGTERM)
+
+    def reap():
+        try:
+            proc.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            signal_group(signal.SIGKILL)
+
+    threading.Thread(target=reap, daemon=True).start()
+
+
+def _popen(cmd, cancel, **kwargs):
+    """Popen `cmd`, tracked by `cancel` when there is one.
+
+    Only cancellable commands get their own session: a plain CLI run should stay
+    in the terminal's process group so Ctrl-C still reaches ffmpeg.
+    """
+    if cancel is not None:
+        cancel.check()
+        kwargs["start_new_session"] = True
+    proc = subprocess.Popen(cmd, **kwargs)
+    if cancel is not None:
+        cancel.register(proc)
+    return proc
+
+
+def idle_prefix():
+    """nice/ionice wrappers, where the OS has them: a background encode only
+    gets the CPU and disk nobody interactive wants."""
+    prefix = []
+    if shutil.which("nice"):
+        prefix += ["nice", "-n", "19"]
+    if shutil.which("ionice"):
+        prefix += ["ionice", "-c", "3"]
+    return prefix
+
+
+def run_cmd(cmd, check=True, cancel=None):
     print("Executing command:", " ".join(shlex.quote(arg) for arg in cmd))
-    return subprocess.run(cmd, check=check)
+    if cancel is None:
+        return subprocess.run(cmd, check=check)
+    proc = _popen(cmd, cancel)
+    try:
+        proc.wait()
+    finally:
+        cancel.unregister(proc)
+    cancel.check()
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return subprocess.CompletedProcess(cmd, proc.returncode)
 
 
 def _parse_ffmpeg_time(value):
@@ -17,163 +124,217 @@ def _parse_ffmpeg_time(value):
         return None
 
 
-def run_cmd_with_progress(cmd, duration, progress_cb):
+def run_cmd_with_progress(cmd, duration, progress_cb, cancel=None):
     """Run ffmpeg, reporting 0-100 progress via progress_cb(pct).
 
     '-progress pipe:1 -nostats' is appended here, so callers pass a plain command.
     A rolling tail of the log is kept so a non-zero exit can raise something more
-    useful than "ffmpeg failed".
+    useful than "ffmpeg failed". Raises Cancelled if `cancel` fires mid-run.
     """
     cmd = list(cmd)
     # -progress must come before the output path, which is always last.
     cmd[-1:-1] = ["-progress", "pipe:1", "-nostats"]
     print("Executing command:", " ".join(shlex.quote(arg) for arg in cmd))
 
-    proc = subprocess.Popen(
-        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+    proc = _popen(
+        cmd, cancel,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
     )
     tail = []
-    for line in proc.stdout:
-        line = line.rstrip("\n")
-        if line:
-            tail.append(line)
-            if len(tail) > 40:
-                tail.pop(0)
-        if duration and progress_cb and line.startswith("out_time="):
-            secs = _parse_ffmpeg_time(line.split("=", 1)[1])
-            if secs is not None:
-                progress_cb(max(0.0, min(100.0, secs / duration * 100)))
-    proc.wait()
+    try:
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            if line:
+                tail.append(line)
+                if len(tail) > 40:
+                    tail.pop(0)
+            if duration and progress_cb and line.startswith("out_time="):
+                secs = _parse_ffmpeg_time(line.split("=", 1)[1])
+                if secs is not None:
+                    progress_cb(max(0.0, min(100.0, secs / duration * 100)))
+        proc.wait()
+    finally:
+        if cancel is not None:
+            cancel.unregister(proc)
+    if cancel is not None:
+        cancel.check()
     if proc.returncode != 0:
         msg = next((l for l in reversed(tail) if "=" not in l and l.strip()),
                    "ffmpeg failed")
         raise RuntimeError(msg)
 
 
-_nvenc_cache = None
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class AudioTrack:
+    """One audio stream. `index` is audio-relative (0, 1, ...), usable as ffmpeg
+    `0:a:N`."""
+    index: int
+    codec: Optional[str] = None
+    channels: Optional[int] = None
+    language: Optional[str] = None
+    title: Optional[str] = None
 
 
-def has_nvenc():
-    """True if ffmpeg exposes the NVENC encoders (cached after the first call)."""
-    global _nvenc_cache
-    if _nvenc_cache is None:
-        try:
-            out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
-                                 capture_output=True, text=True, timeout=10).stdout
-            _nvenc_cache = "h264_nvenc" in out
-        except Exception:
-            _nvenc_cache = False
-    return _nvenc_cache
-
-
-def probe_stream_types(path):
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "stream=codec_type",
-        "-of",
-        "json",
-        path,
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
-    data = json.loads(result.stdout) if result.stdout else {}
-    streams = data.get("streams", [])
-    return [
-        stream.get("codec_type")
-        for stream in streams
-        if stream.get("codec_type")
-    ]
-
-
-def has_audio(path):
-    return "audio" in probe_stream_types(path)
-
-
-def probe_audio_codec(path):
-    """codec_name of the first audio stream, or None if there is no audio."""
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "a:0",
-        "-show_entries", "stream=codec_name",
-        "-of", "json", path,
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
-    data = json.loads(result.stdout) if result.stdout else {}
-    streams = data.get("streams", [])
-    return streams[0].get("codec_name") if streams else None
-
-
-def probe_audio_tracks(path):
-    """List the audio streams: [{index, codec, channels, language, title}].
-
-    `index` is the audio-relative index (0, 1, ...) usable as ffmpeg `0:a:N`.
+@dataclass(frozen=True)
+class MediaInfo:
+    """Everything the slicer and the UI need to know about a source, from one
+    ffprobe run.
+
+    The video fields describe the first video stream. `bit_rate` falls back to
+    the container's overall bit rate when the stream doesn't report its own
+    (common for MKV), which is what the encoders want to match.
     """
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "a",
-        "-show_entries",
-        "stream=codec_name,channels:stream_tags=language,title",
-        "-of", "json", path,
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
-    data = json.loads(result.stdout) if result.stdout else {}
+    path: str
+    duration: Optional[float] = None
+    codec_name: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    bit_rate: Optional[int] = None
+    r_frame_rate: Optional[str] = None
+    pix_fmt: Optional[str] = None
+    profile: Optional[str] = None
+    level: Optional[int] = None
+    has_b_frames: Optional[int] = None
+    color_range: Optional[str] = None
+    color_space: Optional[str] = None
+    color_transfer: Optional[str] = None
+    color_primaries: Optional[str] = None
+    audio_tracks: Tuple[AudioTrack, ...] = ()
+
+    @property
+    def has_audio(self):
+        return bool(self.audio_tracks)
+
+    @property
+    def audio_codec(self):
+        """codec_name of the first audio stream, or None if there is no audio."""
+        return self.audio_tracks[0].codec if self.audio_tracks else None
+
+    @property
+    def fps(self):
+        """r_frame_rate as a float, or None if it's missing or degenerate."""
+        rate = self.r_frame_rate or ""
+        if "/" in rate:
+            num, den = rate.split("/", 1)
+            try:
+                if float(den):
+                    return float(num) / float(den)
+            except ValueError:
+                return None
+            return None
+        return _float_or_none(rate) or None
+
+    def as_dict(self):
+        """JSON-ready form (what /api/probe has always returned, plus audio)."""
+        return {
+            "codec_name": self.codec_name,
+            "width": self.width,
+            "height": self.height,
+            "bit_rate": self.bit_rate,
+            "r_frame_rate": self.r_frame_rate,
+            "pix_fmt": self.pix_fmt,
+            "duration": self.duration,
+            "has_audio": self.has_audio,
+            "audio_codec": self.audio_codec,
+            "audio_tracks": [
+                {"index": t.index, "codec": t.codec, "channels": t.channels,
+                 "language": t.language, "title": t.title}
+                for t in self.audio_tracks
+            ],
+        }
+
+
+# One ffprobe for the lot: every stream's codec/geometry/rate plus the audio tags,
+# and the container's duration and bit rate.
+_PROBE_ENTRIES = (
+    "format=duration,bit_rate"
+    ":stream=index,codec_type,codec_name,width,height,bit_rate,r_frame_rate,"
+    "pix_fmt,profile,level,has_b_frames,color_range,color_space,color_transfer,"
+    "color_primaries,channels"
+    ":stream_tags=language,title"
+)
+
+
+def _parse_probe(path, data):
+    streams = data.get("streams", []) or []
+    fmt = data.get("format", {}) or {}
+
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+
     tracks = []
-    for i, s in enumerate(data.get("streams", [])):
+    for i, s in enumerate(audio):
         tags = s.get("tags", {}) or {}
-        tracks.append({
-            "index": i,
-            "codec": s.get("codec_name"),
-            "channels": s.get("channels"),
-            "language": tags.get("language"),
-            "title": tags.get("title"),
-        })
-    return tracks
-
-
-def probe_video_info(path):
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-select_streams",
-        "v:0",
-        "-show_entries",
-        "stream=codec_name,width,height,bit_rate,r_frame_rate,pix_fmt",
-        "-show_entries",
-        "format=bit_rate",
-        "-of",
-        "json",
-        path,
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
-    data = json.loads(result.stdout) if result.stdout else {}
-    stream = data.get("streams", [{}])[0]
-    fmt = data.get("format", {})
-    bitrate = stream.get("bit_rate") or fmt.get("bit_rate")
-    return {
-        "codec_name": stream.get("codec_name"),
-        "width": stream.get("width"),
-        "height": stream.get("height"),
-        "bit_rate": int(bitrate) if bitrate else None,
-        "r_frame_rate": stream.get("r_frame_rate"),
-        "pix_fmt": stream.get("pix_fmt"),
-    }
-
-
-def probe_duration(path):
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "format=duration",
-        "-of",
-        "json",
-        path,
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
-    data = json.loads(result.stdout) if result.stdout else {}
-    duration = data.get("format", {}).get("duration")
-    return float(duration) if duration else None
+        tracks.append(AudioTrack(
+            index=i,
+            codec=s.get("codec_name"),
+            channels=_int_or_none(s.get("channels")),
+            language=tags.get("language"),
+            title=tags.get("title"),
+        ))
+
+    bitrate = video.get("bit_rate") or fmt.get("bit_rate")
+    return MediaInfo(
+        path=path,
+        duration=_float_or_none(fmt.get("duration")),
+        codec_name=video.get("codec_name"),
+        width=_int_or_none(video.get("width")),
+        height=_int_or_none(video.get("height")),
+        bit_rate=_int_or_none(bitrate),
+        r_frame_rate=video.get("r_frame_rate"),
+        pix_fmt=video.get("pix_fmt"),
+        profile=video.get("profile"),
+        level=_int_or_none(video.get("level")),
+        has_b_frames=_int_or_none(video.get("has_b_frames")),
+        color_range=video.get("color_range"),
+        color_space=video.get("color_space"),
+        color_transfer=video.get("color_transfer"),
+        color_primaries=video.get("color_primaries"),
+        audio_tracks=tuple(tracks),
+    )
+
+
+_probe_cache = ProbeCache()
+
+
+def probe_media(path, use_cache=True):
+    """Probe `path` once and return a MediaInfo.
+
+    Replaces the old per-field helpers (video info, duration, audio codec, audio
+    tracks, has-audio), each of which was its own ffprobe process — on a NAS
+    mount that's a few hundred ms apiece, paid 6-8 times per open-and-cut.
+
+    Results are cached on disk by file fingerprint (see probe_cache), so a file
+    that hasn't changed since it was last probed skips ffprobe entirely.
+    """
+    data = _probe_cache.get(path, _PROBE_ENTRIES) if use_cache else None
+    if data is None:
+        cmd = [
+            "ffprobe", "-v", "error",
+            "-show_entries", _PROBE_ENTRIES,
+            "-of", "json", path,
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
+        data = json.loads(result.stdout) if result.stdout else {}
+        if use_cache:
+            _probe_cache.put(path, _PROBE_ENTRIES, data)
+    return _parse_probe(path, data)
+
+
+def probe_cache_stats():
+    """Hit/miss counters for the probe cache (this process) plus its size."""
+    return _probe_cache.stats()
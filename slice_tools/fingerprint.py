@@ -0,0 +1,30 @@
+"""Where slice_tools keeps its caches, and how a cached entry recognises its source."""
+import hashlib
+import os
+from collections import namedtuple
+
+# Same place slice_ui keeps its preview blocks, so every derived-from-a-source
+# artefact lives under one directory.
+WORKING_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".working_copies"
+)
+
+Fingerprint = namedtuple("Fingerprint", "realpath size mtime_ns inode")
+
+
+def file_fingerprint(path):
+    """(realpath, size, mtime_ns, inode) for `path`.
+
+    Anything that rewrites the file — a re-download, a re-export over the top, a
+    copy into the same name — changes at least one of these, so a cache keyed on
+    all four never serves results for a file that has since changed.
+    """
+    real = os.path.realpath(path)
+    st = os.stat(real)
+    return Fingerprint(real, st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def fingerprint_key(fp):
+    """A short, filename-safe digest of a Fingerprint."""
+    raw = f"{fp.realpath}\0{fp.size}\0{fp.mtime_ns}\0{fp.inode}"
+    return hashlib.sha1(raw.encode("utf-8", "surrogateescape")).hexdigest()[:20]
@@ -0,0 +1,165 @@
+"""What the per-file binary indexes (keyframes, peaks, scenes) have in common.
+
+Each is one flat file per file fingerprint, built by one streaming ffmpeg or
+ffprobe pass, written atomically and read back as an mmap. IndexLoader keeps a
+few recently used ones mapped, runs one build per file however many callers
+ask for it, and remembers a build that failed: its path is keyed by
+fingerprint, so a file that won't decode isn't decoded again until it changes
+(or the server restarts).
+"""
+import mmap
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+@contextmanager
+def streaming(cmd, text=False, failed=None):
+    """Run `cmd`, giving the caller its stdout to read as it's produced.
+
+    stderr goes to a temporary file rather than a pipe: a damaged stream can log
+    more than a pipe holds while the caller is still reading stdout, and the
+    process would block on it. A non-zero exit raises RuntimeError with the end
+    of that log (or `failed` if it's empty).
+    """
+    print("Executing command:", " ".join(shlex.quote(arg) for arg in cmd))
+    errors = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors, text=text,
+                            bufsize=1 << 16)
+    try:
+        yield proc.stdout
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        errors.seek(0)
+        err = errors.read().decode(errors="replace")
+        errors.close()
+    if proc.returncode != 0:
+        # The end of the log says why; a damaged stream can log megabytes first.
+        raise RuntimeError(err.strip()[-1000:]
+                           or failed or f"{cmd[0]} exited with {proc.returncode}")
+
+
+def ffmpeg_lines(cmd, failed=None):
+    """The lines of `cmd`'s stdout, as `streaming` runs it."""
+    with streaming(cmd, text=True, failed=failed) as out:
+        yield from out
+
+
+def write_atomic(out_path, write):
+    """Create `out_path` through a temp file and a rename; `write(f)` fills it."""
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, out_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def map_index(index_path, header, kind):
+    """mmap a stored index -> (mapping, file size, unpacked header). Raises
+    ValueError if the file is too short to hold `header`."""
+    with open(index_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < header.size:
+            raise ValueError(f"truncated {kind}: {index_path}")
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return buf, size, header.unpack_from(buf, 0)
+
+
+class Build:
+    """An index being built: `done` is set once it's stored or has failed."""
+
+    def __init__(self):
+        self.error = None
+        self.done = threading.Event()
+        self.started = time.monotonic()
+
+
+class IndexLoader:
+    """Mapped indexes by path, built on a background thread on first use.
+
+    `read(path)` maps a stored index, raising OSError or ValueError if there
+    isn't a usable one.
+    """
+
+    def __init__(self, name, read, keep=16):
+        self.name = name
+        self.read = read
+        self.keep = keep
+        self._loaded = OrderedDict()
+        self._building = {}  # out_path -> Build
+        self._failed = {}  # out_path -> error
+        self._guard = threading.Lock()
+
+    def load(self, out_path, build_fn, new_build=Build, wait=True):
+        """The index stored at `out_path`, or, if there isn't one, the result of
+        `build_fn(build)` writing it, with `build` from `new_build()`.
+
+        Concurrent callers share one build, and a build that failed raises its
+        error again rather than running again. With wait=False a build in
+        progress is returned instead of waited for.
+        """
+        with self._guard:
+            if out_path in self._failed:
+                raise RuntimeError(self._failed[out_path])
+            index = self._loaded.get(out_path)
+            if index is not None and os.path.isfile(out_path):
+                self._loaded.move_to_end(out_path)
+                return index
+            build = self._building.get(out_path)
+            if build is None:
+                try:
+                    index = self.read(out_path)
+                except (OSError, ValueError):
+                    build = self._building[out_path] = new_build()
+                    threading.Thread(target=self._run, args=(out_path, build, build_fn),
+                                     name=self.name, daemon=True).start()
+                else:
+                    self._remember(out_path, index)
+                    return index
+
+        if not wait:
+            if build.error is not None:
+                raise RuntimeError(build.error)
+            return build
+        build.done.wait()
+        if build.error is not None:
+            raise RuntimeError(build.error)
+        with self._guard:
+            return self._loaded.get(out_path) or self.read(out_path)
+
+    def _remember(self, out_path, index):
+        """Keep `index` mapped (lock held)."""
+        self._loaded[out_path] = index
+        self._loaded.move_to_end(out_path)
+        while len(self._loaded) > self.keep:
+            self._loaded.popitem(last=False)
+
+    def _run(self, out_path, build, build_fn):
+        try:
+            build_fn(build)
+            index = self.read(out_path)
+        except Exception as exc:
+            build.error = str(exc) or exc.__class__.__name__
+            with self._guard:
+                self._failed[out_path] = build.error
+                self._building.pop(out_path, None)
+            build.done.set()
+            return
+        with self._guard:
+            self._remember(out_path, index)
+            self._building.pop(out_path, None)
+        build.done.set()
@@ -0,0 +1,223 @@
+"""Slice job queue: a bounded backlog worked by a few threads per lane.
+
+Cuts wait in one of two lanes — "gpu" for encodes NVENC can take, "cpu" for
+everything else — each with its own fixed number of workers, so a pile of GIF
+exports can't start a dozen ffmpegs at once, and a GPU cut doesn't wait
+behind CPU work it doesn't compete with. Within a lane, INTERACTIVE jobs (a cut
+someone is waiting on) go before BULK ones (GIFs, batches), oldest first.
+
+Job records are plain dicts in `jobs`, guarded by `lock`, as slice_ui has
+always kept them; every status change is also written to SQLite, so after a
+restart /api/job/<id> still answers. Changes are announced on `bus` (see
+ProgressBus): whoever changes a record publishes its id with the lock held.
+A job that was queued or running when the server stopped comes back as an
+error, since nothing resumes it. Finished jobs are dropped from both after
+`ttl` seconds.
+"""
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from slice_tools.ffmpeg_utils import CancelToken
+from slice_tools.fingerprint import WORKING_DIR
+from slice_tools.progress_bus import ProgressBus
+
+JOBS_DB = os.path.join(WORKING_DIR, "jobs.sqlite3")
+
+INTERACTIVE = 0
+BULK = 1
+
+FINISHED = ("complete", "error", "cancelled")
+# The parts of a record worth keeping; the rest (cancel token, watcher count)
+# only means anything to this process.
+_SAVED = ("kind", "status", "message", "error", "progress", "output_path", "ranges")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL
+)
+"""
+
+
+class QueueFull(Exception):
+    """Too many jobs already waiting."""
+
+
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB, max_queued=32, ttl=24 * 3600):
+        self.db_path = db_path
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs = {}  # job_id -> record
+        self.lock = threading.Lock()
+        self._wake = threading.Condition(self.lock)
+        self.bus = ProgressBus(self.lock)
+        self._lanes = {}  # lane -> worker count
+        self._pending = {}  # lane -> heap of (priority, seq, job_id)
+        self._work = {}  # job_id -> (fn, running message, release)
+        self._seq = itertools.count()
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    def start(self, lanes):
+        """Open the database and start `lanes` ({lane: worker count}) workers."""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._db_lock, self._db:
+            self._db.execute(_SCHEMA)
+        self._restore()
+        with self.lock:
+            for lane, count in lanes.items():
+                if count > 0:
+                    self._lanes[lane] = count
+                    self._pending[lane] = []
+        for lane, count in self._lanes.items():
+            for n in range(count):
+                threading.Thread(target=self._worker, args=(lane,),
+                                 name=f"job-{lane}-{n}", daemon=True).start()
+
+    def _restore(self):
+        now = time.time()
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                             (now - self.ttl,))
+            rows = self._db.execute("SELECT id, record, created, finished FROM jobs").fetchall()
+        interrupted = []
+        with self.lock:
+            for job_id, text, created, finished in rows:
+                record = json.loads(text)
+                if record["status"] not in FINISHED:
+                    record["status"] = "error"
+                    record["message"] = record["error"] = "Interrupted by a server restart"
+                    finished = now
+                    interrupted.append(job_id)
+                record.update(cancel=CancelToken(), watchers=0, created=created,
+                              finished=finished)
+                self.jobs[job_id] = record
+        for job_id in interrupted:
+            self._save(job_id)
+
+    def submit(self, job_id, record, fn, lane="cpu", priority=INTERACTIVE, release=None):
+        """Queue `fn` (no arguments) as job `job_id`.
+
+        `record` is the job's initial dict; its message is shown once the job
+        starts ("Queued" until then). `release` runs once the job is finished
+        with, whether it ran or was cancelled while waiting. Raises QueueFull.
+        """
+        self._expire()
+        now = time.time()
+        with self.lock:
+            if sum(job["status"] == "queued" for job in self.jobs.values()) >= self.max_queued:
+                raise QueueFull(f"{self.max_queued} jobs are already waiting")
+            if lane not in self._lanes:
+                lane = "cpu"
+            record.update(status="queued", cancel=CancelToken(), watchers=0,
+                          created=now, finished=None)
+            self._work[job_id] = (fn, record.get("message"), release)
+            record["message"] = "Queued"
+            self.jobs[job_id] = record
+            heapq.heappush(self._pending[lane], (priority, next(self._seq), job_id))
+            self._wake.notify_all()
+            self.bus.publish(job_id)
+        self._save(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancel a waiting or running job; returns its status (None if unknown)."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = job["status"]
+            work = None
+            if status == "queued":
+                job["status"] = "cancelled"
+                job["message"] = "Cancelled"
+                job["finished"] = time.time()
+                work = self._work.pop(job_id, None)
+                self.bus.publish(job_id)
+        if status == "running":
+            job["cancel"].cancel()
+        elif work is not None:
+            self._save(job_id)
+            if work[2] is not None:
+                work[2]()
+        return status
+
+    def stats(self):
+        with self.lock:
+            by_status = {}
+            for job in self.jobs.values():
+                by_status[job["status"]] = by_status.get(job["status"], 0) + 1
+            return {"lanes": dict(self._lanes), "jobs": by_status,
+                    "max_queued": self.max_queued, "ttl": self.ttl}
+
+    def _worker(self, lane):
+        heap = self._pending[lane]
+        while True:
+            with self.lock:
+                while True:
+                    while not heap:
+                        self._wake.wait()
+                    _, _, job_id = heapq.heappop(heap)
+                    job = self.jobs.get(job_id)
+                    work = self._work.pop(job_id, None)
+                    # Cancelled (or expired) while it waited.
+                    if job is not None and work is not None and job["status"] == "queued":
+                        break
+                fn, message, release = work
+                job["status"] = "running"
+                job["message"] = message or "Running..."
+                self.bus.publish(job_id)
+            self._save(job_id)
+            try:
+                fn()
+            except Exception as exc:
+                with self.lock:
+                    job["status"] = "error"
+                    job["message"] = job["error"] = str(exc) or exc.__class__.__name__
+                    self.bus.publish(job_id)
+            finally:
+                with self.lock:
+                    if job["status"] not in FINISHED:
+                        job["status"] = "error"
+                        job["message"] = job["error"] = "Job ended without a result"
+                        self.bus.publish(job_id)
+                    job["finished"] = time.time()
+                self._save(job_id)
+                if release is not None:
+                    release()
+
+    def _save(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            record = json.dumps({k: job.get(k) for k in _SAVED})
+            row = (job_id, record, job.get("created") or time.time(), job.get("finished"))
+        if self._db is None:
+            return
+        with self._db_lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO jobs (id, record, created, finished) "
+                             "VALUES (?, ?, ?, ?)", row)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            stale = [job_id for job_id, job in self.jobs.items()
+                     if job["status"] in FINISHED and (job.get("finished") or 0) < cutoff
+                     and not job["watchers"]]
+            for job_id in stale:
+                del self.jobs[job_id]
+                self.bus.forget(job_id)
+        if stale and self._db is not None:
+            with self._db_lock, self._db:
+                self._db.executemany("DELETE FROM jobs WHERE id = ?",
+                                     [(job_id,) for job_id in stale])
@@ -0,0 +1,183 @@
+"""Per-file keyframe index: where a source's video keyframes actually are.
+
+Built with one streaming ffprobe pass over the video packets and stored beside
+the preview window cache as a flat binary file — a small header, then the
+keyframe PTS (float64), their byte offsets and their packet ordinals (int64).
+Loading is an mmap plus three memoryview casts, so even a 3-hour VOD's index
+opens in microseconds and is never re-derived while the file is unchanged.
+
+Queries (prev_keyframe / next_keyframe / gop_at) are bisects over the mapped PTS.
+"""
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+from slice_tools.fingerprint import WORKING_DIR, file_fingerprint, fingerprint_key
+from slice_tools.index_store import IndexLoader, ffmpeg_lines, map_index, write_atomic
+
+KEYFRAME_DIR = os.path.join(WORKING_DIR, "keyframes")
+
+# magic, version, keyframe count, duration (end of the last packet), packet count.
+# 32 bytes, so the float64/int64 arrays that follow stay 8-byte aligned.
+_HEADER = struct.Struct("<4sIQdQ")
+_MAGIC = b"KFI1"
+_VERSION = 1
+
+# Timestamps come back from ffprobe in microseconds and cut points from the UI in
+# milliseconds; anything this close to a keyframe is that keyframe.
+EPSILON = 0.0005
+
+
+class KeyframeIndex:
+    """Sorted keyframe positions for one source's first video stream.
+
+    `pts` are seconds, `pos` byte offsets in the file (-1 when the demuxer doesn't
+    know), `frames` the packet ordinal (decode order) of each keyframe — the
+    difference between two of them is the exact number of packets between those
+    keyframes, which is what a frame-exact stream copy needs.
+    """
+
+    def __init__(self, pts, pos, frames, duration, packet_count, _buffer=None):
+        self.pts = pts
+        self.pos = pos
+        self.frames = frames
+        self.duration = duration
+        self.packet_count = packet_count
+        self._buffer = _buffer  # keeps the mmap alive as long as its views
+
+    def __len__(self):
+        return len(self.pts)
+
+    def prev_keyframe(self, t):
+        """The last keyframe at or before `t` — where decoding `t` has to start.
+
+        Times before the first keyframe clamp to it; None if there are none.
+        """
+        if not len(self.pts):
+            return None
+        i = bisect_right(self.pts, t + EPSILON) - 1
+        return self.pts[max(i, 0)]
+
+    def next_keyframe(self, t):
+        """The first keyframe at or after `t`, or None if `t` is past the last."""
+        i = bisect_left(self.pts, t - EPSILON)
+        return self.pts[i] if i < len(self.pts) else None
+
+    def next_keyframe_after(self, t):
+        """The first keyframe strictly after `t`, or None."""
+        i = bisect_right(self.pts, t + EPSILON)
+        return self.pts[i] if i < len(self.pts) else None
+
+    def is_keyframe(self, t):
+        k = self.next_keyframe(t)
+        return k is not None and abs(k - t) <= EPSILON
+
+    def gop_at(self, t):
+        """(start, end) of the GOP containing `t`; the last GOP ends at `duration`."""
+        start = self.prev_keyframe(t)
+        if start is None:
+            return None
+        end = self.next_keyframe_after(start)
+        return start, (end if end is not None else self.duration)
+
+    def frame_number(self, keyframe_pts):
+        """Packet ordinal of the keyframe at `keyframe_pts` (must be a keyframe)."""
+        i = bisect_left(self.pts, keyframe_pts - EPSILON)
+        if i >= len(self.pts) or abs(self.pts[i] - keyframe_pts) > EPSILON:
+            raise ValueError(f"{keyframe_pts} is not a keyframe")
+        return self.frames[i]
+
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "N/A"
+
+
+def scan_keyframes(path):
+    """One streaming ffprobe pass over the video packets -> (pts, pos, frames,
+    duration, packet_count), with the arrays as array('d') / array('q')."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,dts_time,duration_time,pos,flags",
+        "-of", "csv=p=0", path,
+    ]
+    pts, pos, frames = array("d"), array("q"), array("q")
+    count = 0
+    end = 0.0
+    for line in ffmpeg_lines(cmd, failed=f"keyframe scan failed for {path}"):
+        # ffprobe prints fields in its own order: pts, dts, duration, pos, flags.
+        fields = line.rstrip("\n").split(",")
+        if len(fields) < 5:
+            continue
+        t = _parse_time(fields[0])
+        if t is None:
+            t = _parse_time(fields[1])
+        if t is not None:
+            dur = _parse_time(fields[2]) or 0.0
+            end = max(end, t + dur)
+            if "K" in fields[4]:
+                pts.append(t)
+                try:
+                    pos.append(int(fields[3]))
+                except ValueError:
+                    pos.append(-1)
+                frames.append(count)
+        count += 1
+
+    # Keyframes come out in decode order, which is PTS order for any sane stream;
+    # sort defensively so bisect is always valid.
+    if any(pts[i] > pts[i + 1] for i in range(len(pts) - 1)):
+        order = sorted(range(len(pts)), key=pts.__getitem__)
+        pts = array("d", (pts[i] for i in order))
+        pos = array("q", (pos[i] for i in order))
+        frames = array("q", (frames[i] for i in order))
+    return pts, pos, frames, end, count
+
+
+def write_index(out_path, pts, pos, frames, duration, packet_count):
+    """Write the binary index atomically (temp file + rename)."""
+    def write(f):
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(pts), duration, packet_count))
+        pts.tofile(f)
+        pos.tofile(f)
+        frames.tofile(f)
+
+    write_atomic(out_path, write)
+
+
+def read_index(index_path):
+    """mmap a stored index; the arrays are zero-copy views into the mapping."""
+    buf, size, header = map_index(index_path, _HEADER, "keyframe index")
+    magic, version, n, duration, packet_count = header
+    if magic != _MAGIC or version != _VERSION or size != _HEADER.size + 24 * n:
+        raise ValueError(f"bad keyframe index: {index_path}")
+    view = memoryview(buf)
+    off = _HEADER.size
+    pts = view[off:off + 8 * n].cast("d")
+    pos = view[off + 8 * n:off + 16 * n].cast("q")
+    frames = view[off + 16 * n:off + 24 * n].cast("q")
+    return KeyframeIndex(pts, pos, frames, duration, packet_count, _buffer=buf)
+
+
+# A handful of recently used indexes stay mapped; reopening one is cheap anyway.
+_indexes = IndexLoader("keyframes", read_index, keep=32)
+
+
+def index_path(path, directory=KEYFRAME_DIR):
+    return os.path.join(directory, f"{fingerprint_key(file_fingerprint(path))}.kfi")
+
+
+def load_keyframe_index(path):
+    """The KeyframeIndex for `path`, building and storing it on first use.
+
+    Keyed by file fingerprint, so an edited or replaced file gets a fresh index.
+    Concurrent callers for the same file share one build, and a scan that failed
+    raises its error again rather than scanning again.
+    """
+    out_path = index_path(path)
+    return _indexes.load(out_path, lambda build: write_index(
+        out_path, *scan_keyframes(os.path.realpath(path))))
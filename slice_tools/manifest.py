@@ -0,0 +1,180 @@
+"""Cut lists for batch slicing: CSV / JSON / EDL manifests and a resume journal.
+
+Every format loads into the same list of Cut rows. CSV and JSON rows carry
+`input`, `output`, `start`, `stop` and an optional `mode` (fast / accurate /
+gif); `input` and `output` may be left out when a default source and output
+directory are given. EDLs (CMX 3600) contribute each event's source in/out and
+its "* FROM CLIP NAME:" (when present) as the input.
+"""
+import csv
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from slice_tools.timecode import format_seconds, parse_timecode
+
+MODES = ("fast", "accurate", "gif")
+
+Cut = namedtuple("Cut", "row input output start end mode")
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def _resolve(base_dir, path):
+    path = os.path.expanduser(path)
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+
+def _default_output(input_path, output_dir, row, start, end, mode):
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    ext = ".gif" if mode == "gif" else os.path.splitext(input_path)[1] or ".mp4"
+    span = f"{format_seconds(start)}-{format_seconds(end)}".replace(".", "_")
+    return os.path.join(output_dir, f"{stem}_{row:03d}_{span}{ext}")
+
+
+def _make_cut(row, fields, base_dir, default_input, output_dir, default_mode):
+    input_path = fields.get("input") or default_input
+    if not input_path:
+        raise ManifestError(f"row {row}: no input file (and no default source)")
+    input_path = _resolve(base_dir, str(input_path))
+
+    try:
+        start = fields["start"]
+        end = fields["stop"] if "stop" in fields else fields["end"]
+        start = start if isinstance(start, (int, float)) else parse_timecode(str(start))
+        end = end if isinstance(end, (int, float)) else parse_timecode(str(end))
+    except KeyError as exc:
+        raise ManifestError(f"row {row}: missing {exc.args[0]!r}") from None
+    except ValueError as exc:
+        raise ManifestError(f"row {row}: {exc}") from None
+    if end <= start:
+        raise ManifestError(f"row {row}: stop must be after start")
+
+    mode = str(fields.get("mode") or default_mode).strip().lower()
+    if mode not in MODES:
+        raise ManifestError(f"row {row}: unknown mode {mode!r} (use {', '.join(MODES)})")
+
+    output = fields.get("output")
+    if output:
+        output = _resolve(base_dir, str(output))
+    else:
+        output = _default_output(input_path, output_dir or base_dir, row,
+                                 float(start), float(end), mode)
+    return Cut(row, input_path, output, float(start), float(end), mode)
+
+
+def _edl_seconds(tc, fps):
+    """HH:MM:SS:FF (or ;FF drop-frame) -> seconds. Drop-frame is read as nominal
+    frames, which is what the source timecode of a file-based EDL means."""
+    parts = tc.replace(";", ":").split(":")
+    if len(parts) != 4:
+        raise ValueError(f"bad EDL timecode {tc!r}")
+    h, m, s, f = (int(p) for p in parts)
+    return h * 3600 + m * 60 + s + f / fps
+
+
+def _read_edl(path, fps):
+    """[(fields dict), ...] from a CMX 3600 EDL."""
+    rows = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0].isdigit() and len(parts) >= 8:
+                # event reel track transition [duration] src_in src_out rec_in rec_out
+                if fps is None:
+                    raise ManifestError("EDL timecodes are in frames: pass the frame rate")
+                try:
+                    rows.append({"start": _edl_seconds(parts[-4], fps),
+                                 "stop": _edl_seconds(parts[-3], fps)})
+                except ValueError as exc:
+                    raise ManifestError(f"event {parts[0]}: {exc}") from None
+            elif rows and line.startswith("* FROM CLIP NAME:"):
+                rows[-1]["input"] = line.split(":", 1)[1].strip()
+    return rows
+
+
+def load_manifest(path, default_input=None, output_dir=None, default_mode="fast",
+                  fps=None):
+    """Load a .csv, .json or .edl cut list into Cut rows (numbered from 1).
+
+    Relative paths are resolved against the manifest's directory, which is also
+    where outputs without an explicit name go unless `output_dir` is given. `fps`
+    is only needed for EDLs, whose timecodes count frames.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = [{k.strip().lower(): (v or "").strip() for k, v in r.items() if k}
+                    for r in csv.DictReader(f)]
+    elif ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rows = data.get("cuts", []) if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise ManifestError("JSON manifest must be a list of cuts or {\"cuts\": [...]}")
+    elif ext == ".edl":
+        rows = _read_edl(path, fps)
+    else:
+        raise ManifestError(f"unknown manifest type {ext!r} (use .csv, .json or .edl)")
+
+    cuts = []
+    for n, fields in enumerate(rows, 1):
+        if not isinstance(fields, dict):
+            raise ManifestError(f"row {n}: expected an object with start and stop, "
+                                f"not {type(fields).__name__}")
+        cuts.append(_make_cut(n, fields, base_dir, default_input, output_dir, default_mode))
+    outputs = [c.output for c in cuts]
+    if len(set(outputs)) != len(outputs):
+        raise ManifestError("two rows write the same output file")
+    return cuts
+
+
+def cut_key(cut):
+    """Identity of a cut for the journal: what it reads, writes and how."""
+    raw = f"{cut.input}\0{cut.output}\0{cut.start!r}\0{cut.end!r}\0{cut.mode}"
+    return hashlib.sha1(raw.encode("utf-8", "surrogateescape")).hexdigest()[:20]
+
+
+class Journal:
+    """Append-only JSON-lines record of finished cuts, so a re-run skips them.
+
+    A cut counts as done only while its output still exists; a row whose start,
+    stop, mode or paths changed gets a different key and runs again. Each line
+    is flushed and fsynced as it's written, so a crash loses at most the cuts
+    that were still running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line torn by the crash we're recovering from
+                    if entry.get("status") == "done":
+                        self.done[entry["key"]] = entry
+        except OSError:
+            pass
+
+    def is_done(self, cut):
+        entry = self.done.get(cut_key(cut))
+        return entry is not None and os.path.isfile(cut.output)
+
+    def record(self, cut, status, **extra):
+        entry = dict(key=cut_key(cut), row=cut.row, output=cut.output,
+                     status=status, **extra)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if status == "done":
+            self.done[entry["key"]] = entry
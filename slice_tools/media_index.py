@@ -0,0 +1,246 @@
+"""Index of the video files under a few roots, for finding a dropped file.
+
+A browser drop gives a file's name and size, never its path. Walking every
+likely directory per drop is slow, and a miss costs the whole walk, so this
+keeps (directory, name, size, mtime) for every video file in SQLite and
+refreshes it in the background.
+
+A refresh re-lists only directories whose mtime has changed since the last one
+(adding, removing or renaming an entry changes its directory's mtime). An
+unchanged directory costs one stat(), and its subdirectories come from the
+index rather than a listing. Lookups go by name, then by size plus a SHA-256 of
+the file's first and last HASH_SPAN bytes, which also finds a file renamed
+since it was indexed. Every hit is checked against the disk before it's
+returned.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from slice_tools.fingerprint import WORKING_DIR
+
+MEDIA_INDEX_DB = os.path.join(WORKING_DIR, "media_index.sqlite3")
+
+HASH_SPAN = 64 << 10
+REFRESH_SEC = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    head_hash TEXT,
+    PRIMARY KEY (dir, name)
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+"""
+
+
+def partial_hash(path, size):
+    """Hex SHA-256 of the first HASH_SPAN bytes and the last HASH_SPAN bytes
+    after them (the same bytes the page hashes from the dropped File)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        h.update(f.read(HASH_SPAN))
+        if size > HASH_SPAN:
+            f.seek(max(HASH_SPAN, size - HASH_SPAN))
+            h.update(f.read(HASH_SPAN))
+    return h.hexdigest()
+
+
+def _subtree(path):
+    """SQL bounds matching every path strictly under `path` ('0' sorts right
+    after '/'), without LIKE's wildcard escaping."""
+    prefix = path.rstrip("/")
+    return prefix + "/", prefix + "0"
+
+
+class MediaIndex:
+    def __init__(self, extensions, db_path=MEDIA_INDEX_DB, interval=REFRESH_SEC):
+        self.extensions = {e.lower() for e in extensions}
+        self.db_path = db_path
+        self.interval = interval
+        self.ready = False  # a full refresh has finished (this run or a past one)
+        self.refreshes = 0
+        self.last_refresh = None  # seconds the last one took
+        self._db = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._finished = threading.Condition()
+        self._finished_start = 0.0  # when the last finished refresh started
+
+    def start(self, roots):
+        """Open the index and keep it fresh in the background. `roots()` gives
+        the directories to cover; it's asked again on every refresh, so drives
+        mounted later are picked up."""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+            # An index from an earlier run answers straight away; the refresh
+            # below only fixes up what changed since.
+            self.ready = self._db.execute("SELECT 1 FROM dirs LIMIT 1").fetchone() is not None
+        threading.Thread(target=self._loop, args=(roots,), name="media-index",
+                         daemon=True).start()
+
+    def refresh_now(self, timeout):
+        """Have the background thread refresh now, and wait up to `timeout`
+        seconds for a refresh started after this call to finish. Returns
+        whether one did."""
+        asked = time.monotonic()
+        with self._finished:
+            self._wake.set()
+            return self._finished.wait_for(lambda: self._finished_start >= asked, timeout)
+
+    def _loop(self, roots):
+        while True:
+            started = time.monotonic()
+            try:
+                self.refresh(roots())
+            except Exception as exc:
+                print(f"media index: refresh failed: {exc}")
+            with self._finished:
+                self._finished_start = started
+                self._finished.notify_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self, roots):
+        started = time.monotonic()
+        roots = [os.path.realpath(r) for r in roots]
+        with self._lock, self._db:
+            # Roots that went away (an unplugged drive) take their files along.
+            known = [row[0] for row in self._db.execute(
+                "SELECT path FROM dirs WHERE parent = ''")]
+            for path in known:
+                if path not in roots:
+                    self._drop_tree(path)
+        stack = list(roots)
+        while stack:
+            path = stack.pop()
+            try:
+                st = os.stat(path)
+            except OSError:
+                with self._lock, self._db:
+                    self._drop_tree(path)
+                continue
+            with self._lock:
+                row = self._db.execute("SELECT mtime_ns FROM dirs WHERE path = ?",
+                                       (path,)).fetchone()
+                if row is not None and row[0] == st.st_mtime_ns:
+                    stack.extend(r[0] for r in self._db.execute(
+                        "SELECT path FROM dirs WHERE parent = ?", (path,)))
+                    continue
+            parent = "" if path in roots else os.path.dirname(path)
+            stack.extend(self._relist(path, parent, st.st_mtime_ns))
+        self.ready = True
+        self.refreshes += 1
+        self.last_refresh = round(time.monotonic() - started, 2)
+
+    def _relist(self, path, parent, mtime_ns):
+        """Re-read one changed directory; returns its subdirectories."""
+        files = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    # Hidden trees: .git, .cache, our own .working_copies, ...
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif (os.path.splitext(entry.name)[1].lower() in self.extensions
+                              and entry.is_file()):
+                            st = entry.stat()
+                            files[entry.name] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            with self._lock, self._db:
+                self._drop_tree(path)
+            return []
+
+        with self._lock, self._db:
+            old = {name: (size, mtime) for name, size, mtime in self._db.execute(
+                "SELECT name, size, mtime_ns FROM files WHERE dir = ?", (path,))}
+            self._db.executemany("DELETE FROM files WHERE dir = ? AND name = ?",
+                                 [(path, name) for name in old if name not in files])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files (dir, name, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                [(path, name, size, mtime) for name, (size, mtime) in files.items()
+                 if old.get(name) != (size, mtime)])
+            for (gone,) in self._db.execute("SELECT path FROM dirs WHERE parent = ?",
+                                            (path,)).fetchall():
+                if gone not in subdirs:
+                    self._drop_tree(gone)
+            self._db.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) "
+                             "VALUES (?, ?, ?)", (path, parent, mtime_ns))
+        return subdirs
+
+    def _drop_tree(self, path):
+        """Forget `path` and everything under it (lock and transaction held)."""
+        lo, hi = _subtree(path)
+        self._db.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                         (path, lo, hi))
+        self._db.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)",
+                         (path, lo, hi))
+
+    def find(self, name, size=None, head_hash=None):
+        """Path of the file called `name` with `size` bytes — or, failing that,
+        any file of `size` bytes whose partial_hash is `head_hash` — or None."""
+        with self._lock:
+            rows = self._db.execute("SELECT dir, name FROM files WHERE name = ?",
+                                    (name,)).fetchall()
+        for directory, filename in rows:
+            candidate = os.path.join(directory, filename)
+            try:
+                if size is None or os.path.getsize(candidate) == size:
+                    return candidate
+            except OSError:
+                continue
+        if size is None or not head_hash:
+            return None
+
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT dir, name, mtime_ns, head_hash FROM files WHERE size = ?",
+                (size,)).fetchall()
+        for directory, filename, mtime_ns, stored in rows:
+            candidate = os.path.join(directory, filename)
+            try:
+                st = os.stat(candidate)
+                if st.st_size != size:
+                    continue
+                digest = stored if st.st_mtime_ns == mtime_ns else None
+                if digest is None:
+                    digest = partial_hash(candidate, size)
+                    with self._lock, self._db:
+                        self._db.execute(
+                            "UPDATE files SET head_hash = ?, mtime_ns = ? "
+                            "WHERE dir = ? AND name = ?",
+                            (digest, st.st_mtime_ns, directory, filename))
+            except OSError:
+                continue
+            if digest == head_hash:
+                return candidate
+        return None
+
+    def stats(self):
+        if self._db is None:
+            return {"ready": False}
+        with self._lock:
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            dirs = self._db.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+        return {"ready": self.ready, "files": files, "dirs": dirs,
+                "refreshes": self.refreshes, "last_refresh_sec": self.last_refresh}
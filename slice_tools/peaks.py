@@ -0,0 +1,318 @@
+"""Waveform peak pyramid: min/max envelopes of a source's audio at every zoom.
+
+Streaming ffmpeg decodes to low-rate mono PCM are reduced on the fly into
+buckets of BASE_BUCKET samples (level 0, 10 ms each); every further level
+halves the resolution by merging neighbouring pairs, down to a level that fits
+on screen whole. A long source is split into time ranges decoded side by side
+(input seeking), and while they run a PeakBuild answers the same queries from
+whatever has been decoded so far, so a waveform can fill in as it's built.
+
+Stored as one flat binary file per (file fingerprint, audio track): a small
+header, a table of levels, then each level's buckets as int8 (min, max) pairs.
+Loading is an mmap; a slice of any level is a memoryview.
+
+Needs NumPy for the reduction; without it `available()` is False and callers
+fall back to the showwavespic PNG.
+"""
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # optional: only the peak pyramid needs it
+    np = None
+
+from slice_tools.fingerprint import WORKING_DIR, file_fingerprint, fingerprint_key
+from slice_tools.index_store import Build, IndexLoader, map_index, streaming, write_atomic
+
+# Next to slice_ui's waveform PNGs, under the same cache budget.
+PEAKS_DIR = os.path.join(WORKING_DIR, "waves")
+
+# 4 kHz keeps everything below 2 kHz, which is where a waveform's loud parts
+# are, at 1/11 of the samples of a 44.1 kHz decode.
+SAMPLE_RATE = 4000
+BASE_BUCKET = 40  # samples per level-0 bucket: 100 buckets a second
+# Stop halving once a level is this short; it draws the whole file at once.
+MIN_LEVEL_BUCKETS = 1024
+# Decoding is one core per ffmpeg, so a multi-hour VOD is cut into ranges of at
+# least MIN_RANGE_SECONDS decoded PARALLEL_DECODES at a time.
+PARALLEL_DECODES = max(1, min(8, os.cpu_count() or 1))
+MIN_RANGE_SECONDS = 300
+BUCKETS_PER_SECOND = SAMPLE_RATE // BASE_BUCKET
+
+# magic, version, sample rate, samples per level-0 bucket, level count, duration.
+_HEADER = struct.Struct("<4sIIIId")
+_LEVEL = struct.Struct("<QQ")  # byte offset, bucket count
+_MAGIC = b"PKS1"
+_VERSION = 1
+_READ_SIZE = BASE_BUCKET * 2 * 4096  # whole buckets of s16le per read
+
+
+def available():
+    return np is not None
+
+
+class PeakPyramid:
+    """A loaded pyramid. Level n has buckets of `bucket_seconds(n)`."""
+
+    def __init__(self, sample_rate, base_bucket, duration, levels, _buffer=None):
+        self.sample_rate = sample_rate
+        self.base_bucket = base_bucket
+        self.duration = duration
+        self.levels = levels  # [memoryview of int8 min/max pairs] per level
+        self._buffer = _buffer
+
+    def bucket_seconds(self, level):
+        return self.base_bucket * (1 << level) / self.sample_rate
+
+    def count(self, level):
+        return len(self.levels[level]) // 2
+
+    def describe(self):
+        return {
+            "duration": self.duration,
+            "complete": True,
+            "progress": 100.0,
+            "levels": [{"bucket_seconds": self.bucket_seconds(n), "count": self.count(n)}
+                       for n in range(len(self.levels))],
+        }
+
+    def slice(self, level, start, end):
+        """(first bucket index, bytes of int8 min/max pairs) covering seconds
+        [start, end) of `level`."""
+        step = self.bucket_seconds(level)
+        count = self.count(level)
+        first = min(count, max(0, int(start / step)))
+        last = min(count, max(first, int(-(-end // step))))
+        return first, bytes(self.levels[level][2 * first:2 * last])
+
+
+def _reduce(samples):
+    """int16 samples (a whole number of buckets) -> int8 [min, max, ...]."""
+    buckets = samples.reshape(-1, BASE_BUCKET)
+    out = np.empty((len(buckets), 2), dtype=np.int8)
+    out[:, 0] = buckets.min(axis=1) >> 8
+    out[:, 1] = buckets.max(axis=1) >> 8
+    return out
+
+
+def _halve(level):
+    """Merge neighbouring buckets of an (n, 2) int8 level."""
+    if len(level) % 2:
+        level = np.concatenate([level, level[-1:]])
+    pairs = level.reshape(-1, 2, 2)
+    return np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+
+
+def decode_peaks(path, audio_track=0, start=None, duration=None, on_chunk=None):
+    """Level-0 buckets ((n, 2) int8) of one audio track, from one streaming
+    decode; `start`/`duration` (seconds) limit it to part of the file.
+    `on_chunk(offset, buckets)` sees each batch as it's reduced."""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if start:
+        cmd += ["-ss", f"{start:.3f}"]
+    cmd += ["-i", path]
+    if duration is not None:
+        cmd += ["-t", f"{duration:.3f}"]
+    cmd += ["-map", f"0:a:{audio_track}", "-vn", "-sn", "-dn",
+            "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"]
+    chunks = []
+    pending = b""
+    done = 0
+
+    def emit(buckets):
+        nonlocal done
+        chunks.append(buckets)
+        if on_chunk is not None:
+            on_chunk(done, buckets)
+        done += len(buckets)
+
+    with streaming(cmd, failed="audio decode failed") as out:
+        while True:
+            data = out.read(_READ_SIZE)
+            if not data:
+                break
+            data = pending + data
+            whole = len(data) - len(data) % (BASE_BUCKET * 2)
+            pending = data[whole:]
+            if whole:
+                emit(_reduce(np.frombuffer(data, dtype="<i2", count=whole // 2)))
+    if len(pending) >= 2:
+        tail = np.frombuffer(pending, dtype="<i2", count=len(pending) // 2)
+        tail = np.concatenate([tail, np.full(BASE_BUCKET - len(tail), tail[-1], "<i2")])
+        emit(_reduce(tail))
+    if not chunks:
+        return np.empty((0, 2), dtype=np.int8)
+    return np.concatenate(chunks)
+
+
+def build_levels(base):
+    levels = [base]
+    while len(levels[-1]) > MIN_LEVEL_BUCKETS:
+        levels.append(_halve(levels[-1]))
+    return levels
+
+
+def _level_counts(count):
+    counts = [count]
+    while counts[-1] > MIN_LEVEL_BUCKETS:
+        counts.append((counts[-1] + 1) // 2)
+    return counts
+
+
+def split_ranges(duration, parts=PARALLEL_DECODES, min_seconds=MIN_RANGE_SECONDS):
+    """[(start, length)] cutting `duration` into up to `parts` ranges of whole
+    seconds (so every range is a whole number of buckets); the last runs on to
+    the end of the stream."""
+    parts = max(1, min(parts, int(duration // min_seconds)))
+    size = int(-(-duration // parts))
+    ranges = [(i * size, size) for i in range(parts) if i * size < duration]
+    start, _ = ranges[-1]
+    ranges[-1] = (start, None)
+    return ranges
+
+
+class PeakBuild(Build):
+    """A pyramid still being decoded, answering queries from what's in so far.
+
+    Level 0 is preallocated for the whole duration (silence where nothing has
+    arrived yet); coarser levels are reduced from it per query.
+    """
+
+    def __init__(self, duration):
+        super().__init__()
+        self.sample_rate = SAMPLE_RATE
+        self.base_bucket = BASE_BUCKET
+        self.duration = duration
+        self.base = np.zeros((max(1, int(-(-duration * BUCKETS_PER_SECOND // 1))), 2),
+                             dtype=np.int8)
+        self.counts = _level_counts(len(self.base))
+        self.filled = 0
+
+    def bucket_seconds(self, level):
+        return self.base_bucket * (1 << level) / self.sample_rate
+
+    def count(self, level):
+        return self.counts[level]
+
+    @property
+    def levels(self):
+        return self.counts  # only its length is used, as for PeakPyramid
+
+    def progress(self):
+        return min(100.0, self.filled / len(self.base) * 100)
+
+    def describe(self):
+        return {
+            "duration": self.duration,
+            "complete": False,
+            "progress": round(self.progress(), 1),
+            "levels": [{"bucket_seconds": self.bucket_seconds(n), "count": c}
+                       for n, c in enumerate(self.counts)],
+        }
+
+    def put(self, offset, buckets):
+        """Place decoded level-0 buckets at `offset` (clipped to the duration)."""
+        end = min(len(self.base), offset + len(buckets))
+        if end > offset:
+            self.base[offset:end] = buckets[:end - offset]
+            self.filled += end - offset
+
+    def slice(self, level, start, end):
+        step = self.bucket_seconds(level)
+        count = self.counts[level]
+        first = min(count, max(0, int(start / step)))
+        last = min(count, max(first, int(-(-end // step))))
+        factor = 1 << level
+        base = self.base[first * factor:last * factor]
+        if not len(base):
+            return first, b""
+        if len(base) % factor:
+            pad = factor - len(base) % factor
+            base = np.concatenate([base, np.repeat(base[-1:], pad, axis=0)])
+        groups = base.reshape(-1, factor, 2)
+        out = np.stack([groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1)], axis=1)
+        return first, out.tobytes()
+
+
+def _build(path, audio_track, build, out_path):
+    """Decode every range of `path` into `build`, then store the pyramid."""
+    ranges = split_ranges(build.duration)
+
+    def decode(rng):
+        start, length = rng
+        offset = start * BUCKETS_PER_SECOND
+        decode_peaks(path, audio_track, start, length,
+                     on_chunk=lambda at, buckets: build.put(offset + at, buckets))
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        for _ in pool.map(decode, ranges):
+            pass
+    write_pyramid(out_path, build_levels(build.base), build.duration)
+    print(f"peaks: {os.path.basename(path)} track {audio_track} in "
+          f"{time.monotonic() - build.started:.1f}s")
+
+
+def write_pyramid(out_path, levels, duration):
+    """Write the pyramid atomically (temp file + rename)."""
+    offset = _HEADER.size + _LEVEL.size * len(levels)
+    table = []
+    for level in levels:
+        table.append(_LEVEL.pack(offset, len(level)))
+        offset += level.nbytes
+    def write(f):
+        f.write(_HEADER.pack(_MAGIC, _VERSION, SAMPLE_RATE, BASE_BUCKET, len(levels),
+                             duration))
+        f.write(b"".join(table))
+        for level in levels:
+            f.write(np.ascontiguousarray(level).tobytes())
+
+    write_atomic(out_path, write)
+
+
+def read_pyramid(pyramid_path):
+    """mmap a stored pyramid; each level is a zero-copy int8 view."""
+    buf, size, header = map_index(pyramid_path, _HEADER, "peak pyramid")
+    magic, version, rate, base, n, duration = header
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"bad peak pyramid: {pyramid_path}")
+    view = memoryview(buf)
+    levels = []
+    for i in range(n):
+        offset, count = _LEVEL.unpack_from(buf, _HEADER.size + i * _LEVEL.size)
+        if offset + 2 * count > size:
+            raise ValueError(f"truncated peak pyramid: {pyramid_path}")
+        levels.append(view[offset:offset + 2 * count].cast("b"))
+    return PeakPyramid(rate, base, duration, levels, _buffer=buf)
+
+
+def pyramid_path(path, audio_track=0, directory=PEAKS_DIR):
+    key = fingerprint_key(file_fingerprint(path))
+    return os.path.join(directory, f"{key}_a{audio_track}.peaks")
+
+
+_pyramids = IndexLoader("peaks", read_pyramid)
+
+
+def load_peaks(path, audio_track=0, duration=None, directory=PEAKS_DIR, wait=True):
+    """The PeakPyramid for one audio track of `path`, built on first use.
+
+    Keyed by file fingerprint, so an edited or replaced file gets a fresh one.
+    Concurrent callers for the same track share one build, and a build that
+    failed raises its error again rather than decoding again. With wait=False a
+    build in progress is returned as its PeakBuild instead of waited for.
+    `duration` (seconds) is needed to start a build.
+    """
+    if np is None:
+        raise RuntimeError("numpy is not installed")
+    out_path = pyramid_path(path, audio_track, directory)
+
+    def new_build():
+        if not duration:
+            raise ValueError("duration unknown: can't split the decode")
+        return PeakBuild(duration)
+
+    return _pyramids.load(out_path, lambda build: _build(path, audio_track, build, out_path),
+                          new_build, wait=wait)
@@ -0,0 +1,137 @@
+"""On-disk cache of ffprobe results, keyed by file fingerprint.
+
+Reopening a file in slice_ui, re-running accurate_slice, or a batch job over the
+same sources would otherwise pay a fresh ffprobe (150-400 ms on a NAS) every time.
+Rows are keyed by realpath and carry the rest of the fingerprint, so a changed
+file misses and gets re-probed; the table is bounded with LRU eviction.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from slice_tools.fingerprint import WORKING_DIR, file_fingerprint
+
+DEFAULT_DB_PATH = os.path.join(WORKING_DIR, "probe_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class ProbeCache:
+    """A bounded LRU of raw ffprobe JSON in SQLite.
+
+    `schema` identifies what was asked of ffprobe; a row probed with different
+    entries is treated as a miss, so widening the probe never serves stale shapes.
+    Any SQLite failure (read-only disk, locked file) degrades to a miss — the
+    cache must never be the reason a probe fails.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call: cheap for SQLite, and safe across the threads
+        # and worker processes that share this cache.
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            if not self._ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS probes ("
+                    " realpath TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+                    " inode INTEGER, schema TEXT, data TEXT, last_used REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS probes_lru ON probes(last_used)")
+                self._ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, path, schema):
+        """Cached ffprobe JSON for `path`, or None on a miss."""
+        try:
+            fp = file_fingerprint(path)
+        except OSError:
+            self._count("misses")
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT size, mtime_ns, inode, schema, data FROM probes"
+                    " WHERE realpath = ?", (fp.realpath,),
+                ).fetchone()
+                if row is None:
+                    self._count("misses")
+                    return None
+                if tuple(row[:4]) != (fp.size, fp.mtime_ns, fp.inode, schema):
+                    self._count("stale")
+                    self._count("misses")
+                    return None
+                conn.execute("UPDATE probes SET last_used = ? WHERE realpath = ?",
+                             (time.time(), fp.realpath))
+            self._count("hits")
+            return json.loads(row[4])
+        except (sqlite3.Error, OSError, ValueError):
+            self._count("errors")
+            self._count("misses")
+            return None
+
+    def put(self, path, schema, data):
+        try:
+            fp = file_fingerprint(path)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (fp.realpath, fp.size, fp.mtime_ns, fp.inode, schema,
+                     json.dumps(data), time.time()),
+                )
+                (count,) = conn.execute("SELECT COUNT(*) FROM probes").fetchone()
+                excess = count - self.max_entries
+                if excess > 0:
+                    conn.execute(
+                        "DELETE FROM probes WHERE realpath IN (SELECT realpath FROM"
+                        " probes ORDER BY last_used LIMIT ?)", (excess,),
+                    )
+                    with self._lock:
+                        self.evictions += excess
+        except (sqlite3.Error, OSError):
+            self._count("errors")
+
+    def stats(self):
+        entries = None
+        try:
+            if os.path.isfile(self.db_path):
+                with self._connect() as conn:
+                    (entries,) = conn.execute("SELECT COUNT(*) FROM probes").fetchone()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "path": self.db_path,
+            }
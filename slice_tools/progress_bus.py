@@ -0,0 +1,51 @@
+"""Change notification for state kept in dicts behind one lock.
+
+Whoever changes an entry calls publish(key) with the lock held; whoever wants
+to follow it calls wait(key, seen) with the lock held, which sleeps on a
+condition variable (releasing the lock) until the key's version moves past
+`seen`. A follower costs nothing while nothing happens, and wakes as soon as
+something does, instead of re-reading the state on a timer.
+
+Versions only count changes, so a follower that was busy when several landed
+wakes once and reads the latest state: bursts coalesce by themselves.
+"""
+import threading
+
+
+class ProgressBus:
+    def __init__(self, lock):
+        self.lock = lock
+        self._versions = {}  # key -> change count
+        self._conds = {}  # key -> [Condition, waiter count]
+
+    def version(self, key):
+        """Current version of `key` (lock held)."""
+        return self._versions.get(key, 0)
+
+    def publish(self, key):
+        """Record a change to `key` and wake its followers (lock held)."""
+        self._versions[key] = self._versions.get(key, 0) + 1
+        entry = self._conds.get(key)
+        if entry is not None:
+            entry[0].notify_all()
+
+    def wait(self, key, seen, timeout=None):
+        """Block until `key` has changed since version `seen`, or `timeout`
+        seconds pass (lock held). Returns the current version."""
+        if self._versions.get(key, 0) != seen:
+            return self._versions.get(key, 0)
+        entry = self._conds.get(key)
+        if entry is None:
+            entry = self._conds[key] = [threading.Condition(self.lock), 0]
+        entry[1] += 1
+        try:
+            entry[0].wait_for(lambda: self._versions.get(key, 0) != seen, timeout)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._conds.pop(key, None)
+        return self._versions.get(key, 0)
+
+    def forget(self, key):
+        """Drop `key` once nothing will change it again (lock held)."""
+        self._versions.pop(key, None)
@@ -0,0 +1,225 @@
+"""Per-file scene-score index: how different every frame is from the one before.
+
+Built with one low-resolution decode of the first video stream through ffmpeg's
+select filter, which scores each frame 0..1 against its predecessor (the same
+`scene` value `select='gt(scene,T)'` compares). Every frame's score is kept, not
+just the cuts above one threshold, so a query at any threshold — a hard 0.3 or
+a soft 0.15 for screen captures — is a bisect over the frame times plus a short
+scan, with no decode at all.
+
+Stored as one flat binary file per file fingerprint: a small header, the frame
+PTS (float64), their scores (float32), then the highest score in each block of
+BLOCK frames (float32), which lets next/previous-cut searches skip whole
+stretches of one shot. Loading is an mmap plus three memoryview casts.
+"""
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from slice_tools.ffmpeg_utils import idle_prefix
+from slice_tools.fingerprint import WORKING_DIR, file_fingerprint, fingerprint_key
+from slice_tools.index_store import (
+    Build, IndexLoader, ffmpeg_lines, map_index, write_atomic,
+)
+
+SCENE_DIR = os.path.join(WORKING_DIR, "scenes")
+
+# Scores are a mean absolute difference, so a 160 px wide frame scores a cut
+# about as a full-size one does, at a small fraction of the scaling and compare.
+SCAN_WIDTH = 160
+BLOCK = 256  # frames per block maximum
+
+# Thresholds as slice_ui's window detection uses them: 0.3 is a hard cut.
+HARD_CUT = 0.3
+SOFT_CUT = 0.15
+
+# magic, version, frame count, duration (seconds scanned). 24 bytes, so the
+# float64 PTS that follow stay 8-byte aligned.
+_HEADER = struct.Struct("<4sIQd")
+_MAGIC = b"SCN1"
+_VERSION = 1
+
+
+class SceneIndex:
+    """Frame times and scene scores for one source's first video stream.
+
+    A frame whose score is above a threshold is the first frame of a new shot;
+    "the cut" below means that frame's PTS.
+    """
+
+    def __init__(self, pts, scores, block_max, duration, _buffer=None):
+        self.pts = pts
+        self.scores = scores
+        self.block_max = block_max
+        self.duration = duration
+        self._buffer = _buffer  # keeps the mmap alive as long as its views
+
+    def __len__(self):
+        return len(self.pts)
+
+    def cuts_between(self, start, end, threshold=HARD_CUT):
+        """Cuts (seconds) in [start, end] scoring above `threshold`."""
+        lo = bisect_left(self.pts, start)
+        hi = bisect_right(self.pts, end)
+        return [self.pts[i] for i in range(lo, hi) if self.scores[i] > threshold]
+
+    def next_cut(self, t, threshold=HARD_CUT):
+        """The first cut strictly after `t`, or None."""
+        i = bisect_right(self.pts, t)
+        n = len(self.pts)
+        while i < n:
+            block = i // BLOCK
+            if self.block_max[block] <= threshold:
+                i = (block + 1) * BLOCK
+                continue
+            end = min(n, (block + 1) * BLOCK)
+            for j in range(i, end):
+                if self.scores[j] > threshold:
+                    return self.pts[j]
+            i = end
+        return None
+
+    def prev_cut(self, t, threshold=HARD_CUT):
+        """The last cut strictly before `t`, or None."""
+        i = bisect_left(self.pts, t) - 1
+        while i >= 0:
+            block = i // BLOCK
+            if self.block_max[block] <= threshold:
+                i = block * BLOCK - 1
+                continue
+            for j in range(i, block * BLOCK - 1, -1):
+                if self.scores[j] > threshold:
+                    return self.pts[j]
+            i = block * BLOCK - 1
+        return None
+
+    def frame_before(self, t):
+        """PTS of the last frame strictly before `t` (the last frame of the shot
+        a cut at `t` ends), or None."""
+        i = bisect_left(self.pts, t) - 1
+        return self.pts[i] if i >= 0 else None
+
+    def frame_after(self, t):
+        """PTS of the first frame strictly after `t`, or None."""
+        i = bisect_right(self.pts, t)
+        return self.pts[i] if i < len(self.pts) else None
+
+
+def _block_max(scores):
+    return array("f", (max(scores[i:i + BLOCK]) for i in range(0, len(scores), BLOCK)))
+
+
+def scan_scenes(path, progress=None):
+    """One low-resolution decode of the video -> (pts array('d'), scores
+    array('f'), duration). `progress(seconds)` sees the scan advance.
+
+    It's a whole-file decode nobody is waiting on frame by frame, so it runs at
+    idle priority, behind the preview encodes."""
+    vf = (f"scale={SCAN_WIDTH}:-2:flags=fast_bilinear,select='gte(scene,0)',"
+          "metadata=print:key=lavfi.scene_score:file=-")
+    cmd = idle_prefix() + [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", path, "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-vf", vf, "-f", "null", "-",
+    ]
+    pts, scores = array("d"), array("f")
+    t = None
+    reported = 0.0
+    # metadata=print writes "frame:N pts:P pts_time:T" then "key=value".
+    for line in ffmpeg_lines(cmd, failed=f"scene scan failed for {path}"):
+        if line.startswith("frame:"):
+            t = None
+            if "pts_time:" in line:
+                try:
+                    t = float(line.split("pts_time:")[1].split()[0])
+                except (ValueError, IndexError):
+                    pass
+        elif t is not None and line.startswith("lavfi.scene_score="):
+            try:
+                score = float(line.split("=", 1)[1])
+            except ValueError:
+                score = 0.0
+            pts.append(t)
+            scores.append(score if score == score else 0.0)  # NaN -> 0
+            t = None
+            if progress is not None and pts[-1] - reported >= 1.0:
+                reported = pts[-1]
+                progress(reported)
+
+    if any(pts[i] > pts[i + 1] for i in range(len(pts) - 1)):
+        order = sorted(range(len(pts)), key=pts.__getitem__)
+        pts = array("d", (pts[i] for i in order))
+        scores = array("f", (scores[i] for i in order))
+    return pts, scores, (pts[-1] if pts else 0.0)
+
+
+def write_index(out_path, pts, scores, duration):
+    """Write the binary index atomically (temp file + rename)."""
+    def write(f):
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(pts), duration))
+        pts.tofile(f)
+        scores.tofile(f)
+        _block_max(scores).tofile(f)
+
+    write_atomic(out_path, write)
+
+
+def read_index(index_path):
+    """mmap a stored index; the arrays are zero-copy views into the mapping."""
+    buf, size, header = map_index(index_path, _HEADER, "scene index")
+    magic, version, n, duration = header
+    blocks = -(-n // BLOCK)
+    if magic != _MAGIC or version != _VERSION or size != _HEADER.size + 12 * n + 4 * blocks:
+        raise ValueError(f"bad scene index: {index_path}")
+    view = memoryview(buf)
+    off = _HEADER.size
+    pts = view[off:off + 8 * n].cast("d")
+    scores = view[off + 8 * n:off + 12 * n].cast("f")
+    block_max = view[off + 12 * n:off + 12 * n + 4 * blocks].cast("f")
+    return SceneIndex(pts, scores, block_max, duration, _buffer=buf)
+
+
+def index_path(path, directory=SCENE_DIR):
+    return os.path.join(directory, f"{fingerprint_key(file_fingerprint(path))}.scn")
+
+
+class SceneBuild(Build):
+    """A scan in progress: how far through the file it has got."""
+
+    def __init__(self, duration=None):
+        super().__init__()
+        self.duration = duration
+        self.scanned = 0.0
+
+    def progress(self):
+        if not self.duration:
+            return None
+        return round(min(100.0, self.scanned / self.duration * 100), 1)
+
+
+_indexes = IndexLoader("scenes", read_index)
+
+
+def load_scene_index(path, duration=None, directory=SCENE_DIR, wait=True):
+    """The SceneIndex for `path`, scanned in the background on first use.
+
+    Keyed by file fingerprint, so an edited or replaced file gets a fresh index.
+    Concurrent callers share one scan, and a scan that failed raises its error
+    again rather than decoding again. With wait=False a scan in progress is
+    returned as its SceneBuild instead of waited for; `duration` (seconds) only
+    feeds its progress.
+    """
+    out_path = index_path(path, directory)
+
+    def build(scan):
+        def progress(seconds):
+            scan.scanned = seconds
+
+        pts, scores, scanned = scan_scenes(path, progress)
+        write_index(out_path, pts, scores, scanned)
+        print(f"scenes: {os.path.basename(path)} ({len(pts)} frames) in "
+              f"{time.monotonic() - scan.started:.1f}s")
+
+    return _indexes.load(out_path, build, lambda: SceneBuild(duration), wait=wait)
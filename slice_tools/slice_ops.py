@@ -1,21 +1,55 @@
 import os
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from slice_tools.capabilities import has_nvenc
 from slice_tools.ffmpeg_utils import (
-    has_audio,
-    has_nvenc,
-    probe_duration,
-    probe_video_info,
+    Cancelled,
+    probe_media,
     run_cmd,
     run_cmd_with_progress,
 )
+from slice_tools.keyframes import load_keyframe_index
 from slice_tools.timecode import format_seconds
 
 
-def convert_to_intraframe(input_path, output_path):
+# Cap on how many ffmpeg children one cut runs side by side. The stages are the
+# two boundary pieces, the stream-copied middle and (smart cut) the audio.
+MAX_PARALLEL_STAGES = 4
+
+
+def thread_budget(parallel):
+    """Threads each of `parallel` concurrent ffmpeg children may use, so running
+    them side by side doesn't oversubscribe the CPU."""
+    return max(1, (os.cpu_count() or 1) // max(1, parallel))
+
+
+def _threads_args(threads):
+    return ["-threads", str(threads)] if threads else []
+
+
+def run_stages(stages, max_workers=MAX_PARALLEL_STAGES):
+    """Run independent zero-argument callables concurrently on a bounded pool.
+
+    Every stage is its own ffmpeg process, so threads are enough to keep them all
+    busy. Waits for all of them; the first failure is re-raised.
+    """
+    if len(stages) <= 1:
+        for stage in stages:
+            stage()
+        return
+    with ThreadPoolExecutor(max_workers=min(len(stages), max_workers)) as pool:
+        futures = [pool.submit(stage) for stage in stages]
+        for future in futures:
+            future.result()
+
+
+def convert_to_intraframe(input_path, output_path, threads=None, cancel=None):
     cmd = [
         "ffmpeg",
         "-y",
+    ] + _threads_args(threads) + [
         "-i",
         input_path,
         "-map",
@@ -30,15 +64,19 @@ def convert_to_intraframe(input_path, output_path):
         "flac",
         "-sn",
         "-dn",
+    ] + _threads_args(threads) + [
         output_path,
     ]
-    run_cmd(cmd)
+    run_cmd(cmd, cancel=cancel)
 
 
-def slice_precise(input_path, output_path, start_seconds, end_seconds):
+def slice_precise(input_path, output_path, start_seconds, end_seconds, media=None,
+                  cancel=None):
+    if media is None:
+        media = probe_media(input_path)
     start_ts = format_seconds(start_seconds)
     end_ts = format_seconds(end_seconds)
-    audio = has_audio(input_path)
+    audio = media.has_audio
 
     if audio:
         filter_complex = (
@@ -90,7 +128,7 @@ def slice_precise(input_path, output_path, start_seconds, end_seconds):
             output_path,
         ]
 
-    run_cmd(cmd)
+    run_cmd(cmd, cancel=cancel)
 
 
 CODEC_MAP = {
@@ -102,18 +140,18 @@ CODEC_MAP = {
 }
 
 
-def build_encoder_args(video_info):
-    codec = video_info.get("codec_name") or ""
+def build_encoder_args(media):
+    codec = media.codec_name or ""
     encoder = CODEC_MAP.get(codec, "libx264")
     args = ["-c:v", encoder]
-    bitrate = video_info.get("bit_rate")
+    bitrate = media.bit_rate
     if bitrate:
         args += ["-b:v", str(bitrate)]
     else:
         args += ["-crf", "18"]
     if encoder in ("libx264", "libx265"):
         args += ["-preset", "medium"]
-    pix_fmt = video_info.get("pix_fmt")
+    pix_fmt = media.pix_fmt
     if pix_fmt:
         args += ["-pix_fmt", pix_fmt]
     return args
@@ -133,48 +171,53 @@ NVENC_PIX_FMT = {
 }
 
 
-def build_gpu_encoder_args(video_info):
+def build_gpu_encoder_args(media):
     """NVENC equivalent of build_encoder_args, or None if the codec has no NVENC
     encoder (in which case the caller should stay on the CPU)."""
-    codec = video_info.get("codec_name") or ""
+    codec = media.codec_name or ""
     cpu_encoder = CODEC_MAP.get(codec, "libx264")
     encoder = NVENC_MAP.get(cpu_encoder)
     if encoder is None:
         return None
 
     args = ["-c:v", encoder, "-preset", "p5"]
-    bitrate = video_info.get("bit_rate")
+    bitrate = media.bit_rate
     if bitrate:
         args += ["-b:v", str(bitrate), "-maxrate", str(int(bitrate * 1.5)),
                  "-bufsize", str(int(bitrate * 2))]
     else:
         args += ["-cq", "19"]
 
-    pix_fmt = video_info.get("pix_fmt")
+    pix_fmt = media.pix_fmt
     if pix_fmt:
         args += ["-pix_fmt", NVENC_PIX_FMT.get(pix_fmt, pix_fmt)]
     return args
 
 
 def accurate_cut(input_path, output_path, start_seconds, end_seconds,
-                 video_info=None, prefer_gpu=True, progress_cb=None,
-                 audio_track=None):
+                 media=None, prefer_gpu=True, progress_cb=None,
+                 audio_track=None, chunks=None, cancel=None):
     """Frame-accurate cut by re-encoding the selected span with an accurate seek.
 
     ``-ss`` before ``-i`` seeks to the preceding keyframe, then decodes and
     discards up to the exact start, so the output begins precisely at
     ``start_seconds`` no matter how sparse the keyframes are. The whole span is
-    re-encoded, which is exact — unlike boundary_slice, whose stream-copied
-    middle snaps to keyframe boundaries and can run a couple of frames long.
+    re-encoded, which is exact and needs no keyframe index — boundary_slice is
+    faster, but relies on smart_cut's stream-copied GOPs joining cleanly.
 
     Re-encoding every frame is the expensive part, so try NVENC first and fall
     back to the CPU encoder if the GPU path fails for any reason (no NVENC, an
     unsupported pixel format, a busy card).
+
+    On the CPU a single libx264/libx265 stops scaling at around 8 threads, so a
+    long span is split at source keyframes into `chunks` pieces encoded side by
+    side (see encode_in_chunks). chunks=None picks a count from the core count
+    and span length; chunks=1 keeps the single-process encode.
     """
-    if video_info is None:
-        video_info = probe_video_info(input_path)
+    if media is None:
+        media = probe_media(input_path)
     duration = max(0.0, end_seconds - start_seconds)
-    audio = has_audio(input_path)
+    audio = media.has_audio
 
     def build(encoder_args):
         cmd = [
@@ -194,21 +237,41 @@ def accurate_cut(input_path, output_path, start_seconds, end_seconds,
         cmd += ["-map_chapters", "-1", "-avoid_negative_ts", "make_zero", output_path]
         return cmd
 
+    def runner(cmd):
+        if progress_cb:
+            return lambda: run_cmd_with_progress(cmd, duration, progress_cb,
+                                                 cancel=cancel)
+        return lambda: run_cmd(cmd, cancel=cancel)
+
     attempts = []
     if prefer_gpu and has_nvenc():
-        gpu_args = build_gpu_encoder_args(video_info)
+        gpu_args = build_gpu_encoder_args(media)
         if gpu_args:
-            attempts.append(("gpu", build(gpu_args)))
-    attempts.append(("cpu", build(build_encoder_args(video_info))))
+            attempts.append(("gpu", runner(build(gpu_args))))
+
+    if chunks is None:
+        chunks = auto_chunk_count(duration)
+    if chunks > 1:
+        try:
+            splits = chunk_splits(load_keyframe_index(input_path), start_seconds,
+                                  end_seconds, chunks)
+        except Exception as exc:
+            print(f"accurate_cut: no keyframe index ({exc}) — encoding in one piece")
+            splits = []
+        if splits:
+            attempts.append(("cpu-parallel", lambda: encode_in_chunks(
+                input_path, output_path, start_seconds, end_seconds, splits,
+                media=media, audio_track=audio_track, progress_cb=progress_cb,
+                cancel=cancel)))
+    attempts.append(("cpu", runner(build(build_encoder_args(media)))))
 
     last_err = None
-    for i, (kind, cmd) in enumerate(attempts):
+    for i, (kind, attempt) in enumerate(attempts):
         try:
-            if progress_cb:
-                run_cmd_with_progress(cmd, duration, progress_cb)
-            else:
-                run_cmd(cmd)
+            attempt()
             return kind
+        except Cancelled:
+            raise
         except Exception as exc:
             last_err = exc
             if i + 1 < len(attempts):
@@ -217,8 +280,131 @@ def accurate_cut(input_path, output_path, start_seconds, end_seconds,
     raise RuntimeError(f"accurate_cut failed: {last_err}")
 
 
+# A CPU encoder keeps getting faster up to about this many threads, then flattens
+# out. Parallel chunks get this many each.
+CHUNK_THREADS = 8
+# Below this a chunk isn't worth its own seek, decoder spin-up and concat join.
+MIN_CHUNK_SECONDS = 15.0
+
+
+def auto_chunk_count(duration):
+    """How many parallel chunks a CPU encode of `duration` seconds should use."""
+    by_cores = (os.cpu_count() or 1) // CHUNK_THREADS
+    by_length = int(duration // MIN_CHUNK_SECONDS)
+    return max(1, min(by_cores, by_length))
+
+
+def chunk_splits(index, start_seconds, end_seconds, chunks):
+    """Up to `chunks - 1` keyframe times that divide (start, end) into roughly
+    equal pieces. Splitting on source keyframes means every chunk after the
+    first starts decoding right where it begins, with no pre-roll to discard."""
+    splits = []
+    span = end_seconds - start_seconds
+    for i in range(1, chunks):
+        k = index.next_keyframe(start_seconds + span * i / chunks)
+        if k is None or k >= end_seconds - MIN_CHUNK_SECONDS / 2:
+            break
+        if k > start_seconds + MIN_CHUNK_SECONDS / 2 and (not splits or k > splits[-1]):
+            splits.append(k)
+    return splits
+
+
+def _segment_ext(media):
+    """Intermediate container for pieces that get concatenated: MPEG-TS for
+    H.264/HEVC, so each piece carries its own parameter sets across the joins."""
+    return ".ts" if media.codec_name in ("h264", "hevc") else ".mkv"
+
+
+def _closed_gop_args(encoder_args):
+    """Force closed GOPs, so no chunk's frames reference a neighbour's."""
+    encoder = encoder_args[encoder_args.index("-c:v") + 1]
+    if encoder == "libx265":
+        return ["-x265-params", "open-gop=0"]
+    if encoder == "libx264":
+        return ["-x264-params", "open-gop=0"]
+    return []
+
+
+def _mux_concat(segments, audio_path, output_path, tmpdir, cancel=None):
+    """Concatenate video-only `segments` and mux `audio_path` (if any) over them."""
+    list_file = _write_concat_list(segments, tmpdir)
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a?"]
+    cmd += ["-c", "copy", "-map_chapters", "-1",
+            "-avoid_negative_ts", "make_zero"] + _mux_flags(output_path) + [output_path]
+    run_cmd(cmd, cancel=cancel)
+
+
+def encode_in_chunks(input_path, output_path, start_seconds, end_seconds, splits,
+                     media=None, audio_track=None, progress_cb=None, cancel=None):
+    """CPU re-encode of [start, end) as parallel chunks split at `splits`.
+
+    Each chunk is its own ffmpeg process with CHUNK_THREADS threads and closed
+    GOPs, encoded with build_encoder_args; chunk i covers exactly the source
+    frames in [split i, split i+1) — it stops half a frame short of the next
+    split so the keyframe there lands in the next chunk only. The audio is one
+    separate pass over the whole span. The chunks are joined with the concat
+    demuxer and the audio muxed on top. Progress from all chunks is summed into
+    one 0-100 figure for progress_cb.
+    """
+    if media is None:
+        media = probe_media(input_path)
+    bounds = [start_seconds] + list(splits) + [end_seconds]
+    half_frame = 0.5 / (media.fps or 30.0)
+    encoder_args = build_encoder_args(media)
+    encoder_args += _closed_gop_args(encoder_args)
+    audio_map = f"0:a:{audio_track}?" if audio_track is not None else "0:a?"
+    seg_ext = _segment_ext(media)
+    total = end_seconds - start_seconds
+
+    done = [0.0] * (len(bounds) - 1)
+    done_lock = threading.Lock()
+
+    def chunk_progress(i, length):
+        def cb(pct):
+            with done_lock:
+                done[i] = length * pct / 100
+                overall = sum(done) / total * 100 if total else 0.0
+            progress_cb(overall)
+        return cb
+
+    with tempfile.TemporaryDirectory(prefix="chunked_cut_") as tmpdir:
+        segments, stages = [], []
+        for i, (a, b) in enumerate(zip(bounds, bounds[1:])):
+            last = i == len(bounds) - 2
+            length = (b - a) if last else (b - a - half_frame)
+            seg = os.path.join(tmpdir, f"chunk_{i:03d}{seg_ext}")
+            cmd = [
+                "ffmpeg", "-y", "-threads", str(CHUNK_THREADS),
+                "-ss", format_seconds(a), "-i", input_path,
+                "-t", format_seconds(length),
+                "-map", "0:v:0", "-an", "-sn", "-dn",
+            ] + encoder_args + ["-threads", str(CHUNK_THREADS), seg]
+            segments.append(seg)
+            if progress_cb:
+                stages.append(lambda cmd=cmd, cb=chunk_progress(i, length):
+                              run_cmd_with_progress(cmd, length, cb, cancel=cancel))
+            else:
+                stages.append(lambda cmd=cmd: run_cmd(cmd, cancel=cancel))
+
+        audio_path = None
+        if media.has_audio:
+            audio_path = os.path.join(tmpdir, "audio.mka")
+            audio_cmd = [
+                "ffmpeg", "-y",
+                "-ss", format_seconds(start_seconds), "-i", input_path,
+                "-t", format_seconds(total),
+                "-map", audio_map, "-vn", "-sn", "-dn",
+            ] + audio_encoder_args(output_path) + [audio_path]
+            stages.append(lambda: run_cmd(audio_cmd, cancel=cancel))
+
+        run_stages(stages, max_workers=len(stages))
+        _mux_concat(segments, audio_path, output_path, tmpdir, cancel=cancel)
+
+
 def make_gif(input_path, output_path, start_seconds, end_seconds,
-             fps=15, width=640, progress_cb=None):
+             fps=15, width=640, progress_cb=None, cancel=None):
     """Cut a range to an animated GIF via a two-pass palette for decent color.
 
     A single-pass GIF quantizes to a generic 256-colour table and bands badly.
@@ -236,7 +422,7 @@ def make_gif(input_path, output_path, start_seconds, end_seconds,
             "-i", input_path,
             "-vf", f"{filters},palettegen=stats_mode=diff",
             palette,
-        ])
+        ], cancel=cancel)
         gen = [
             "ffmpeg", "-y",
             "-ss", format_seconds(start_seconds), "-t", format_seconds(duration),
@@ -245,12 +431,13 @@ def make_gif(input_path, output_path, start_seconds, end_seconds,
             "-loop", "0", output_path,
         ]
         if progress_cb:
-            run_cmd_with_progress(gen, duration, progress_cb)
+            run_cmd_with_progress(gen, duration, progress_cb, cancel=cancel)
         else:
-            run_cmd(gen)
+            run_cmd(gen, cancel=cancel)
 
 
-def stream_copy_segment(input_path, output_path, start, end, audio_track=None):
+def stream_copy_segment(input_path, output_path, start, end, audio_track=None,
+                        cancel=None):
     audio_map = f"0:a:{audio_track}?" if audio_track is not None else "0:a?"
     cmd = [
         "ffmpeg",
@@ -271,15 +458,19 @@ def stream_copy_segment(input_path, output_path, start, end, audio_track=None):
         "make_zero",
         output_path,
     ]
-    run_cmd(cmd)
+    run_cmd(cmd, cancel=cancel)
 
 
-def cut_and_encode_segment(input_path, output_path, start, end, video_info):
+def cut_and_encode_segment(input_path, output_path, start, end, media, threads=None,
+                           cancel=None):
+    """Re-encode [start, end) of `input_path` with encoder settings matching
+    `media` — the ORIGINAL source's info. `input_path` is usually an intermediate
+    cut from that source, so it carries audio exactly when the source does."""
     start_ts = format_seconds(start)
     end_ts = format_seconds(end)
-    audio = has_audio(input_path)
+    audio = media.has_audio
 
-    encoder_args = build_encoder_args(video_info)
+    encoder_args = build_encoder_args(media) + _threads_args(threads)
 
     if audio:
         filter_complex = (
@@ -321,14 +512,19 @@ def cut_and_encode_segment(input_path, output_path, start, end, video_info):
             output_path,
         ]
 
-    run_cmd(cmd)
+    run_cmd(cmd, cancel=cancel)
 
 
-def concat_segments(segment_paths, output_path, tmpdir):
+def _write_concat_list(segment_paths, tmpdir):
     list_file = os.path.join(tmpdir, "concat_list.txt")
     with open(list_file, "w") as f:
         for seg in segment_paths:
             f.write(f"file {seg!r}\n")
+    return list_file
+
+
+def concat_segments(segment_paths, output_path, tmpdir, cancel=None):
+    list_file = _write_concat_list(segment_paths, tmpdir)
     cmd = [
         "ffmpeg",
         "-y",
@@ -342,75 +538,531 @@ def concat_segments(segment_paths, output_path, tmpdir):
         "copy",
         output_path,
     ]
-    run_cmd(cmd)
+    run_cmd(cmd, cancel=cancel)
 
 
-def boundary_slice(input_path, output_path, start_seconds, end_seconds,
-                   audio_track=None):
-    video_info = probe_video_info(input_path)
-    duration = probe_duration(input_path)
+# ffprobe profile names -> the encoder's own spelling. Anything not listed is left
+# for the encoder to pick from the pixel format.
+X264_PROFILES = {
+    "baseline": "baseline", "constrained baseline": "baseline", "main": "main",
+    "high": "high", "high 10": "high10", "high 4:2:2": "high422",
+    "high 4:4:4 predictive": "high444",
+}
+X265_PROFILES = {"main": "main", "main 10": "main10", "main still picture": "mainstillpicture"}
+
+
+def build_matching_encoder_args(media):
+    """build_encoder_args plus the stream properties a smart cut has to match.
+
+    Re-encoded boundary pieces get concatenated onto stream-copied source GOPs,
+    so on top of codec, bit rate and pixel format they should carry the source's
+    profile, level and colour tagging — otherwise the player sees a stream whose
+    parameters change mid-file.
+    """
+    args = build_encoder_args(media)
+    encoder = args[args.index("-c:v") + 1]
+    profile = (media.profile or "").lower()
+    if encoder == "libx264":
+        if profile in X264_PROFILES:
+            args += ["-profile:v", X264_PROFILES[profile]]
+        if media.level and media.level > 0:
+            args += ["-level:v", f"{media.level / 10:.1f}"]
+    elif encoder == "libx265" and profile in X265_PROFILES:
+        args += ["-profile:v", X265_PROFILES[profile]]
+    for opt, value in (("-color_range", media.color_range),
+                       ("-colorspace", media.color_space),
+                       ("-color_trc", media.color_transfer),
+                       ("-color_primaries", media.color_primaries)):
+        if value and value != "unknown":
+            args += [opt, value]
+    return args
+
+
+def audio_encoder_args(output_path):
+    """AAC everywhere except WebM, which only takes Vorbis/Opus."""
+    if output_path.lower().endswith(".webm"):
+        return ["-c:a", "libopus", "-b:a", "160k"]
+    return ["-c:a", "aac", "-b:a", "192k"]
+
+
+def _mux_flags(output_path):
+    ext = os.path.splitext(output_path)[1].lower()
+    return ["-movflags", "+faststart"] if ext in (".mp4", ".m4v", ".mov") else []
+
+
+# How far past a keyframe to aim a stream-copy seek. ffmpeg seeks to the keyframe
+# at or BEFORE the target, and a keyframe time that ffprobe rounded down by a
+# microsecond would otherwise land one whole GOP early. Well under a frame.
+SEEK_NUDGE = 0.001
+
+
+def smart_cut(input_path, output_path, start_seconds, end_seconds, media=None,
+              index=None, audio_track=None, cancel=None):
+    """Frame-exact cut that re-encodes only the partial GOPs at either end.
+
+    With K1 the first keyframe at/after the in-point and K2 the last at/before
+    the out-point:
+
+    - [start, K1) is re-encoded with the source's encoder settings (skipped when
+      the in-point is already a keyframe);
+    - [K1, K2) is stream-copied as exactly the packets between those keyframes
+      (``-frames:v`` from the index's packet ordinals), so no frame is repeated
+      or dropped at the joins;
+    - [K2, end) is re-encoded — unless the out-point is a keyframe, or the
+      stream has no B-frames, in which case decode order is display order and
+      the copy can simply run on to the out-point.
+
+    A cut whose in-point is a keyframe and whose tail needs no re-encode is one
+    stream copy, audio included. Otherwise the audio for the whole span is
+    re-encoded in one cheap pass and muxed over the concatenated video. Video
+    pieces go through MPEG-TS (for H.264/HEVC) so each carries its own parameter
+    sets across the joins. Open-GOP sources whose leading B-frames reference the
+    previous GOP can still show a glitch on the first copied frames.
+
+    The re-encoded pieces have to be the source's codec, so a source CODEC_MAP
+    has no encoder for (MPEG-2, ProRes, VC-1, ...) is re-encoded whole by
+    accurate_cut instead.
+
+    Returns "copy" or "smart" for the caller to log, or accurate_cut's result.
+    """
+    if media is None:
+        media = probe_media(input_path)
+    if index is None:
+        index = load_keyframe_index(input_path)
+    if not len(index):
+        raise ValueError("smart_cut needs at least one keyframe")
+
+    audio_map = f"0:a:{audio_track}?" if audio_track is not None else "0:a?"
+    half_frame = 0.5 / (media.fps or 30.0)
+    no_b_frames = media.has_b_frames == 0
+
+    k1 = index.next_keyframe(start_seconds)
+    k2 = index.prev_keyframe(end_seconds)
+    head = not index.is_keyframe(start_seconds)
+    whole_gop = k1 is not None and k1 < end_seconds and (k2 > k1 or no_b_frames)
+    if whole_gop and no_b_frames:
+        k2 = end_seconds  # the copy runs all the way to the out-point
+    tail = whole_gop and end_seconds - k2 > half_frame
+
+    if whole_gop and not head and not tail:
+        # Nothing to re-encode: one stream copy of video and audio together.
+        run_cmd([
+            "ffmpeg", "-y",
+            "-ss", format_seconds(k1 + SEEK_NUDGE), "-to", format_seconds(end_seconds),
+            "-i", input_path,
+            "-map", "0:v:0", "-map", audio_map, "-c", "copy",
+            "-map_chapters", "-1", "-avoid_negative_ts", "make_zero",
+        ] + _mux_flags(output_path) + [output_path], cancel=cancel)
+        return "copy"
+
+    if media.codec_name not in CODEC_MAP:
+        # build_encoder_args would fall back to libx264, and H.264 pieces
+        # concatenated onto copied MPEG-2 or ProRes GOPs make a broken file.
+        print(f"smart_cut: no {media.codec_name} encoder to match — "
+              "re-encoding the whole span")
+        return accurate_cut(input_path, output_path, start_seconds, end_seconds,
+                            media=media, audio_track=audio_track, cancel=cancel)
+
+    seg_ext = _segment_ext(media)
+    encoder_args = build_matching_encoder_args(media)
+    # Head and tail are the only heavy stages (the copy and the audio are cheap),
+    # so they split the cores between them.
+    encoders = 1 if not whole_gop else int(head) + int(tail)
+    threads = thread_budget(encoders)
+
+    def encode_span(out, start, duration):
+        run_cmd([
+            "ffmpeg", "-y", "-threads", str(threads),
+            "-ss", format_seconds(start), "-i", input_path,
+            "-t", format_seconds(duration),
+            "-map", "0:v:0", "-an", "-sn", "-dn",
+        ] + encoder_args + ["-threads", str(threads), out], cancel=cancel)
+
+    def copy_span(out, k_from, k_to):
+        cmd = [
+            "ffmpeg", "-y",
+            "-ss", format_seconds(k_from + SEEK_NUDGE),
+        ]
+        if no_b_frames:
+            cmd += ["-to", format_seconds(k_to), "-i", input_path]
+        else:
+            frames = index.frame_number(k_to) - index.frame_number(k_from)
+            cmd += ["-i", input_path, "-frames:v", str(frames)]
+        cmd += ["-map", "0:v:0", "-an", "-sn", "-dn", "-c", "copy",
+                "-avoid_negative_ts", "make_zero", out]
+        run_cmd(cmd, cancel=cancel)
+
+    def encode_audio(out):
+        run_cmd([
+            "ffmpeg", "-y",
+            "-ss", format_seconds(start_seconds), "-i", input_path,
+            "-t", format_seconds(end_seconds - start_seconds),
+            "-map", audio_map, "-vn", "-sn", "-dn",
+        ] + audio_encoder_args(output_path) + [out], cancel=cancel)
+
+    with tempfile.TemporaryDirectory(prefix="smart_cut_") as tmpdir:
+        # Every piece reads the source independently, so they all run at once
+        # and the cut costs roughly its slowest piece rather than the sum.
+        segments, stages = [], []
+
+        def add(name, fn, *args):
+            seg = os.path.join(tmpdir, name + seg_ext)
+            segments.append(seg)
+            stages.append(lambda: fn(seg, *args))
+
+        if not whole_gop:
+            # No complete GOP inside the selection: the whole thing is boundary.
+            add("span", encode_span, start_seconds, end_seconds - start_seconds)
+        else:
+            if head:
+                # Stop half a frame short of K1 so rounding can't pull K1 itself
+                # into the head as well as the copy.
+                add("head", encode_span, start_seconds, k1 - start_seconds - half_frame)
+            add("middle", copy_span, k1, k2)
+            if tail:
+                add("tail", encode_span, k2, end_seconds - k2)
+
+        audio_path = None
+        if media.has_audio:
+            audio_path = os.path.join(tmpdir, "audio.mka")
+            stages.append(lambda: encode_audio(audio_path))
+
+        run_stages(stages)
+        _mux_concat(segments, audio_path, output_path, tmpdir, cancel=cancel)
+    return "smart"
+
+
+def _boundary_regions(index, start_seconds, end_seconds, duration):
+    """Where boundary_slice's re-encoded chunks and stream-copied middle go.
+
+    Returns (chunk_a, middle, chunk_b) as (start, end) pairs; chunk_a/chunk_b are
+    the stream-copied regions that get trimmed down to the cut points, and any of
+    the three may be None. With a keyframe index, chunk A runs from the keyframe
+    before the in-point to the first keyframe at/after it, the middle is whole
+    GOPs from there to the last keyframe at/before the out-point, and chunk B
+    runs from that keyframe to the next one. Without one (no video, a scan that
+    failed) fall back to a blind margin either side of each cut.
+    """
+    if index is not None and len(index):
+        k1 = index.next_keyframe(start_seconds)
+        k2 = index.prev_keyframe(end_seconds)
+        tail_end = index.next_keyframe_after(end_seconds) or duration or end_seconds
+        if k1 is None or k2 <= k1:
+            # No whole GOP inside the selection — one region covers both cuts.
+            return (index.prev_keyframe(start_seconds), tail_end), None, None
+        chunk_a = None if index.is_keyframe(start_seconds) else (
+            index.prev_keyframe(start_seconds), k1)
+        chunk_b = None if index.is_keyframe(end_seconds) else (k2, tail_end)
+        return chunk_a, (k1, k2), chunk_b
 
     margin = 2.0
     chunk_a_start = max(0, start_seconds - margin)
     chunk_a_end = min(start_seconds + margin, end_seconds)
     chunk_b_start = max(end_seconds - margin, start_seconds)
     chunk_b_end = min(end_seconds + margin, duration) if duration else end_seconds + margin
+    if chunk_a_end >= chunk_b_start:
+        return (chunk_a_start, chunk_b_end), None, None
+    middle = (start_seconds + margin, end_seconds - margin)
+    return (chunk_a_start, chunk_a_end), middle, (chunk_b_start, chunk_b_end)
+
+
+def boundary_slice(input_path, output_path, start_seconds, end_seconds,
+                   audio_track=None, media=None, smart=True, cancel=None):
+    """Fast cut: stream-copy the bulk, re-encode only around the cut points.
+
+    With `smart` (the default) and a usable keyframe index this is smart_cut,
+    which re-encodes straight from the source and only up to the neighbouring
+    keyframes. The older path — stream-copy a chunk around each cut, convert it
+    to an FFV1 intermediate, then trim and re-encode that — is kept for sources
+    without an index, or when asked for with smart=False.
+
+    Returns which path ran: "copy", "smart" or "intraframe", or accurate_cut's
+    result when smart_cut hands the cut over to it.
+    """
+    if media is None:
+        media = probe_media(input_path)
+    duration = media.duration
+
+    try:
+        index = load_keyframe_index(input_path)
+    except Exception as exc:
+        print(f"boundary_slice: no keyframe index ({exc}) — using a fixed margin")
+        index = None
 
-    boundaries_overlap = chunk_a_end >= chunk_b_start
+    if smart and index is not None and len(index):
+        return smart_cut(input_path, output_path, start_seconds, end_seconds,
+                         media=media, index=index, audio_track=audio_track,
+                         cancel=cancel)
+
+    chunk_a, middle, chunk_b = _boundary_regions(
+        index, start_seconds, end_seconds, duration)
+    boundaries_overlap = middle is None
 
     with tempfile.TemporaryDirectory(prefix="accurate_slice_") as tmpdir:
         if boundaries_overlap:
             # Short clip — single region re-encode
-            region_start = chunk_a_start
-            region_end = chunk_b_end
+            region_start, region_end = chunk_a
             chunk_raw = os.path.join(tmpdir, "chunk_raw.mkv")
             chunk_intra = os.path.join(tmpdir, "chunk_intra.mkv")
 
-            stream_copy_segment(input_path, chunk_raw, region_start, region_end, audio_track)
-            convert_to_intraframe(chunk_raw, chunk_intra)
+            stream_copy_segment(input_path, chunk_raw, region_start, region_end, audio_track,
+                                cancel=cancel)
+            convert_to_intraframe(chunk_raw, chunk_intra, cancel=cancel)
 
             # Cut positions relative to the extracted chunk
             rel_start = start_seconds - region_start
             rel_end = end_seconds - region_start
-            cut_and_encode_segment(chunk_intra, output_path, rel_start, rel_end, video_info)
+            cut_and_encode_segment(chunk_intra, output_path, rel_start, rel_end, media,
+                                   cancel=cancel)
         else:
-            segments = []
+            segments, stages = [], []
+            # The two boundary chunks each run three ffmpeg passes, so they split
+            # the cores; the middle is a stream copy and needs next to none.
+            threads = thread_budget(int(chunk_a is not None) + int(chunk_b is not None))
+
+            # Chunk A: boundary around start point. Skipped when the in-point
+            # already sits on a keyframe — the middle starts there.
+            if chunk_a is not None:
+                chunk_a_start, chunk_a_end = chunk_a
+                chunk_a_raw = os.path.join(tmpdir, "chunk_a_raw.mkv")
+                chunk_a_intra = os.path.join(tmpdir, "chunk_a_intra.mkv")
+                chunk_a_cut = os.path.join(tmpdir, "chunk_a_cut.mkv")
 
-            # Chunk A: boundary around start point
-            chunk_a_raw = os.path.join(tmpdir, "chunk_a_raw.mkv")
-            chunk_a_intra = os.path.join(tmpdir, "chunk_a_intra.mkv")
-            chunk_a_cut = os.path.join(tmpdir, "chunk_a_cut.mkv")
+                def stage_a():
+                    stream_copy_segment(input_path, chunk_a_raw, chunk_a_start, chunk_a_end, audio_track,
+                                        cancel=cancel)
+                    convert_to_intraframe(chunk_a_raw, chunk_a_intra, threads=threads, cancel=cancel)
 
-            stream_copy_segment(input_path, chunk_a_raw, chunk_a_start, chunk_a_end, audio_track)
-            convert_to_intraframe(chunk_a_raw, chunk_a_intra)
+                    rel_start_a = start_seconds - chunk_a_start
+                    rel_end_a = chunk_a_end - chunk_a_start
+                    cut_and_encode_segment(chunk_a_intra, chunk_a_cut, rel_start_a, rel_end_a,
+                                           media, threads=threads, cancel=cancel)
 
-            rel_start_a = start_seconds - chunk_a_start
-            rel_end_a = chunk_a_end - chunk_a_start
-            cut_and_encode_segment(chunk_a_intra, chunk_a_cut, rel_start_a, rel_end_a, video_info)
-            segments.append(chunk_a_cut)
+                stages.append(stage_a)
+                segments.append(chunk_a_cut)
 
-            # Middle: stream-copy the bulk
-            middle_start = start_seconds + margin
-            middle_end = end_seconds - margin
+            # Middle: stream-copy the bulk. Aimed just past its first keyframe,
+            # as smart_cut does, so a rounded-down keyframe time can't pull in
+            # the GOP before it.
+            middle_start, middle_end = middle
             if middle_end > middle_start:
                 middle_seg = os.path.join(tmpdir, "middle.mkv")
-                stream_copy_segment(input_path, middle_seg, middle_start, middle_end, audio_track)
+                stages.append(lambda: stream_copy_segment(
+                    input_path, middle_seg, middle_start + SEEK_NUDGE, middle_end,
+                    audio_track, cancel=cancel))
                 segments.append(middle_seg)
 
             # Chunk B: boundary around stop point
-            chunk_b_raw = os.path.join(tmpdir, "chunk_b_raw.mkv")
-            chunk_b_intra = os.path.join(tmpdir, "chunk_b_intra.mkv")
-            chunk_b_cut = os.path.join(tmpdir, "chunk_b_cut.mkv")
+            if chunk_b is not None:
+                chunk_b_start, chunk_b_end = chunk_b
+                chunk_b_raw = os.path.join(tmpdir, "chunk_b_raw.mkv")
+                chunk_b_intra = os.path.join(tmpdir, "chunk_b_intra.mkv")
+                chunk_b_cut = os.path.join(tmpdir, "chunk_b_cut.mkv")
+
+                def stage_b():
+                    stream_copy_segment(input_path, chunk_b_raw, chunk_b_start, chunk_b_end, audio_track,
+                                        cancel=cancel)
+                    convert_to_intraframe(chunk_b_raw, chunk_b_intra, threads=threads, cancel=cancel)
 
-            stream_copy_segment(input_path, chunk_b_raw, chunk_b_start, chunk_b_end, audio_track)
-            convert_to_intraframe(chunk_b_raw, chunk_b_intra)
+                    rel_start_b = 0
+                    rel_end_b = end_seconds - chunk_b_start
+                    cut_and_encode_segment(chunk_b_intra, chunk_b_cut, rel_start_b, rel_end_b,
+                                           media, threads=threads, cancel=cancel)
 
-            rel_start_b = 0
-            rel_end_b = end_seconds - chunk_b_start
-            cut_and_encode_segment(chunk_b_intra, chunk_b_cut, rel_start_b, rel_end_b, video_info)
-            segments.append(chunk_b_cut)
+                stages.append(stage_b)
+                segments.append(chunk_b_cut)
+
+            # Independent stages: run them side by side, then stitch in order.
+            run_stages(stages)
 
             if len(segments) == 1:
-                os.replace(segments[0], output_path)
+                # One piece (typically both cuts on keyframes). It's Matroska
+                # whatever the output is, so remux it rather than rename it.
+                run_cmd([
+                    "ffmpeg", "-y", "-i", segments[0], "-map", "0", "-c", "copy",
+                    "-map_chapters", "-1",
+                ] + _mux_flags(output_path) + [output_path], cancel=cancel)
             else:
-                concat_segments(segments, output_path, tmpdir)
+                concat_segments(segments, output_path, tmpdir, cancel=cancel)
+    return "intraframe"
+
+
+# Ranges closer together than this share one decode: decoding the gap costs less
+# than a second seek and decoder spin-up.
+BATCH_GAP_SECONDS = 30.0
+# Outputs per ffmpeg process. Each is its own encoder fed from one split decode.
+BATCH_MAX_OUTPUTS = 8
+# In a fast batch, ranges at least this long go through smart_cut (mostly stream
+# copy) instead of a shared re-encode.
+BATCH_SMART_MIN_SECONDS = 20.0
+
+
+def group_ranges(ranges, gap=BATCH_GAP_SECONDS, max_outputs=BATCH_MAX_OUTPUTS):
+    """Split `ranges` — (start, end, output) tuples — into groups that can share
+    one decode. Returns lists of indices into `ranges`, each sorted by start."""
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    groups = []
+    group_end = None
+    for i in order:
+        start, end = ranges[i][0], ranges[i][1]
+        if (groups and start - group_end <= gap
+                and len(groups[-1]) < max_outputs):
+            groups[-1].append(i)
+            group_end = max(group_end, end)
+        else:
+            groups.append([i])
+            group_end = end
+    return groups
+
+
+def encode_range_group(input_path, ranges, media, audio_track=None, threads=None,
+                       progress_cb=None, cancel=None):
+    """Re-encode several (start, end, output) ranges with a single ffmpeg.
+
+    The source is decoded once from the first start to the last end; split/asplit
+    fan it out and trim/atrim cut each output's span, so a cluster of nearby
+    clips costs one seek and one decode instead of one per clip. Trims are
+    frame-exact, like accurate_cut. progress_cb(i, pct) reports per range.
+
+    Audio is `audio_track` if the source has it, or every track when it's None,
+    as the per-range cuts map `0:a?`.
+    """
+    group_start = min(r[0] for r in ranges)
+    group_end = max(r[1] for r in ranges)
+    length = group_end - group_start
+    n = len(ranges)
+    tracks = [t.index for t in media.audio_tracks
+              if audio_track is None or t.index == audio_track]
+    audio = bool(tracks)
+    encoder_args = build_encoder_args(media)
+
+    graph = [f"[0:v:0]split={n}" + "".join(f"[v{i}]" for i in range(n))]
+    for t in tracks:
+        graph.append(f"[0:a:{t}]asplit={n}" + "".join(f"[a{t}_{i}]" for i in range(n)))
+    for i, (start, end, _) in enumerate(ranges):
+        rel_start, rel_end = start - group_start, end - group_start
+        graph.append(f"[v{i}]trim=start={rel_start:.6f}:end={rel_end:.6f},"
+                     f"setpts=PTS-STARTPTS[vo{i}]")
+        for t in tracks:
+            graph.append(f"[a{t}_{i}]atrim=start={rel_start:.6f}:end={rel_end:.6f},"
+                         f"asetpts=PTS-STARTPTS[ao{t}_{i}]")
+
+    cmd = [
+        "ffmpeg", "-y",
+    ] + _threads_args(threads) + [
+        "-ss", format_seconds(group_start), "-t", format_seconds(length),
+        "-i", input_path,
+        "-filter_complex", ";".join(graph),
+    ]
+    for i, (_, _, out) in enumerate(ranges):
+        cmd += ["-map", f"[vo{i}]"]
+        for t in tracks:
+            cmd += ["-map", f"[ao{t}_{i}]"]
+        cmd += encoder_args
+        if audio:
+            cmd += audio_encoder_args(out)
+        cmd += ["-map_chapters", "-1"] + _mux_flags(out) + [out]
+
+    if progress_cb is None:
+        run_cmd(cmd, cancel=cancel)
+        return
+
+    def on_group_progress(pct):
+        # Decode position in the group -> how far through each range it is.
+        t = group_start + length * pct / 100
+        for i, (start, end, _) in enumerate(ranges):
+            span = end - start
+            progress_cb(i, max(0.0, min(100.0, (t - start) / span * 100)) if span else 100.0)
+
+    run_cmd_with_progress(cmd, length, on_group_progress, cancel=cancel)
+
+
+def batch_cut(input_path, ranges, media=None, smart=True, audio_track=None,
+              progress_cb=None, cancel=None):
+    """Cut many (start, end, output) ranges from one source.
+
+    Nearby ranges are grouped (group_ranges) and each group is re-encoded by one
+    ffmpeg (encode_range_group). With `smart`, ranges long enough for a stream
+    copy to pay off go through smart_cut on their own instead. A group that fails
+    falls back to accurate_cut per range, so one bad range can't sink the rest.
+
+    progress_cb(i, pct) reports per range (i indexes `ranges`). Returns one dict
+    per range, in order: {"output", "start", "end", "method", "error"}; method is
+    what smart_cut / accurate_cut returned or "batch", error is None on success.
+    """
+    if media is None:
+        media = probe_media(input_path)
+    ranges = [(float(s), float(e), out) for s, e, out in ranges]
+    results = [{"output": out, "start": s, "end": e, "method": None, "error": None}
+               for s, e, out in ranges]
+
+    def report(i, pct):
+        if progress_cb:
+            progress_cb(i, pct)
+
+    index = None
+    if smart:
+        try:
+            index = load_keyframe_index(input_path)
+        except Exception as exc:
+            print(f"batch_cut: no keyframe index ({exc}) — re-encoding every range")
+
+    solo, shared = [], []
+    for i, (start, end, _) in enumerate(ranges):
+        if index is not None and len(index) and end - start >= BATCH_SMART_MIN_SECONDS:
+            solo.append(i)
+        else:
+            shared.append(i)
+    groups = group_ranges([ranges[i] for i in shared])
+    groups = [[shared[j] for j in group] for group in groups]
+
+    def run_solo(i):
+        start, end, out = ranges[i]
+        try:
+            results[i]["method"] = smart_cut(input_path, out, start, end, media=media,
+                                             index=index, audio_track=audio_track,
+                                             cancel=cancel)
+        except Cancelled:
+            raise
+        except Exception as exc:
+            results[i]["error"] = str(exc)
+        report(i, 100.0)
+
+    def run_single(i):
+        start, end, out = ranges[i]
+        try:
+            results[i]["method"] = accurate_cut(
+                input_path, out, start, end, media=media, audio_track=audio_track,
+                progress_cb=lambda pct: report(i, pct), chunks=1, cancel=cancel)
+        except Cancelled:
+            raise
+        except Exception as exc:
+            results[i]["error"] = str(exc)
+
+    def run_group(members, threads):
+        if len(members) == 1:
+            run_single(members[0])
+            return
+        try:
+            encode_range_group(
+                input_path, [ranges[i] for i in members], media,
+                audio_track=audio_track, threads=threads,
+                progress_cb=lambda j, pct: report(members[j], pct), cancel=cancel)
+            for i in members:
+                results[i]["method"] = "batch"
+                report(i, 100.0)
+        except Cancelled:
+            raise
+        except Exception as exc:
+            print(f"batch_cut: shared encode failed ({exc}) — cutting one at a time")
+            for i in members:
+                run_single(i)
+
+    # Groups and smart cuts read different parts of the source independently, so
+    # they run side by side like the stages of a single cut, and share the cores.
+    stages = [lambda i=i: run_solo(i) for i in solo]
+    workers = min(MAX_PARALLEL_STAGES, len(solo) + len(groups)) or 1
+    threads = thread_budget(workers)
+    stages += [lambda g=g: run_group(g, threads) for g in groups]
+    run_stages(stages)
+    return results
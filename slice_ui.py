@@ -1,19 +1,46 @@
 #!/usr/bin/env python3
 import argparse
 import hashlib
+import heapq
+import itertools
+import json
 import logging
+import math
+import mimetypes
 import os
 import shutil
+import signal
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 import uuid
+from urllib.parse import quote, urlencode
 
-from flask import Flask, jsonify, request, render_template, send_file, Response
+from flask import Flask, jsonify, request, render_template, Response
 
-from slice_tools.slice_ops import accurate_cut, boundary_slice, make_gif
-from slice_tools.ffmpeg_utils import probe_video_info, probe_duration, has_audio, probe_audio_codec, probe_audio_tracks
+from slice_tools.cache_manager import CacheManager, parse_size
+from slice_tools.capabilities import (
+    capabilities, has_encoder, has_filter, has_hwaccel, has_nvenc,
+)
+from slice_tools.slice_ops import (
+    SEEK_NUDGE,
+    accurate_cut,
+    batch_cut,
+    boundary_slice,
+    make_gif,
+    thread_budget,
+)
+from slice_tools.ffmpeg_utils import (
+    CancelToken, Cancelled, idle_prefix, probe_cache_stats, probe_media, run_cmd,
+    run_cmd_with_progress,
+)
+from slice_tools.fingerprint import file_fingerprint, fingerprint_key
+from slice_tools.job_queue import BULK, FINISHED, INTERACTIVE, JobQueue, QueueFull
+from slice_tools.keyframes import load_keyframe_index
+from slice_tools.media_index import MediaIndex
+from slice_tools import peaks, scenes
 from slice_tools.timecode import parse_timecode
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,8 +48,20 @@ OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output")
 WORKING_DIR = os.path.join(SCRIPT_DIR, ".working_copies")
 WAVE_DIR = os.path.join(WORKING_DIR, "waves")
 WINDOW_DIR = os.path.join(WORKING_DIR, "windows")
+REMUX_DIR = os.path.join(WORKING_DIR, "remux")
 UPLOAD_DIR = os.path.join(SCRIPT_DIR, ".uploads")
 
+# Byte budget per cache directory (see CacheManager); --cache-budget overrides.
+# Preview blocks are ~20 MB a minute per audio track; uploads and remuxes are
+# whole files.
+CACHE_BUDGETS = {
+    "windows": 10 << 30,
+    "waves": 1 << 30,
+    "hls": 10 << 30,
+    "remux": 20 << 30,
+    "uploads": 20 << 30,
+}
+
 # Preview windows: rather than transcoding a whole 45-minute HEVC episode up
 # front (~1 min on GPU) just to play one frame, transcode a short block around
 # wherever the user actually is. Blocks are grid-aligned so they cache and can
@@ -30,6 +69,27 @@ UPLOAD_DIR = os.path.join(SCRIPT_DIR, ".uploads")
 # into the next block without a visible gap.
 WINDOW_SEC = 60
 WINDOW_OVERLAP = 2
+
+# HLS preview: the whole file as one VOD playlist of short fMP4 segments, each
+# encoded on demand. A cold seek pays for one segment rather than a whole block,
+# and segments butt together exactly, so no overlap is needed. "windows" keeps
+# the block preview (also the fallback when a browser can't play HLS).
+HLS_SEGMENT_SEC = 3
+HLS_LOOKAHEAD = 4
+HLS_DIR = os.path.join(WORKING_DIR, "hls")
+# Segment audio is 48 kHz AAC, cut on its own 1024-sample frame grid rather
+# than at the segment's exact seconds (see _encode_segment).
+HLS_AUDIO_RATE = 48000
+AAC_FRAME = 1024
+HLS_AUDIO_PREROLL = 2  # frames encoded ahead of a segment's audio and dropped
+
+# Background proxy: once a file is being previewed through transcoded blocks,
+# the rest of it is encoded too, at idle CPU/IO priority and a few threads, so a
+# long session on one file stops paying for cold seeks after a few minutes.
+PROXY_DIR = os.path.join(WORKING_DIR, "proxy")
+PROXY_THREADS = max(1, (os.cpu_count() or 4) // 4)
+PROXY_KEEP_STATES = 16  # finished builds remembered for /api/proxy
+PREVIEW_MODES = ("hls", "windows")
 LOG_DIR = os.path.join(SCRIPT_DIR, "logs")
 LOG_FILE = os.path.join(LOG_DIR, "slice_ui.log")
 
@@ -46,19 +106,11 @@ logging.basicConfig(
 log = logging.getLogger("slice_ui")
 
 
-def _detect_nvenc():
-    """True if ffmpeg has CUDA hwaccel + the h264_nvenc encoder available."""
-    try:
-        enc = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
-                             capture_output=True, text=True, timeout=10).stdout
-        hw = subprocess.run(["ffmpeg", "-hide_banner", "-hwaccels"],
-                            capture_output=True, text=True, timeout=10).stdout
-        return "h264_nvenc" in enc and "cuda" in hw
-    except Exception:
-        return False
-
+def gpu_preview_available():
+    """True if ffmpeg has CUDA hwaccel + the h264_nvenc encoder (and scale_cuda)."""
+    return (has_encoder("h264_nvenc") and has_hwaccel("cuda")
+            and has_filter("scale_cuda"))
 
-HAS_NVENC = _detect_nvenc()
 
 VIDEO_EXTENSIONS = {
     ".mp4", ".mkv", ".mov", ".avi", ".webm", ".flv", ".wmv", ".m4v", ".ts", ".mts",
@@ -76,11 +128,48 @@ BROWSER_AUDIO = {"aac", "mp3", "opus", "vorbis", "flac"}
 # Containers the browser can demux
 BROWSER_CONTAINERS = {".mp4", ".m4v", ".webm", ".mov"}
 
+# What a preview block can carry untouched in MP4. A WEB-DL with H.264 video and
+# E-AC-3 audio only needs its audio converted: copying the video makes a block
+# build mostly I/O, and keeps the source resolution. (VP8 has no MP4 mapping.)
+PREVIEW_COPY_VIDEO = {"h264", "vp9", "av1"}
+PREVIEW_COPY_AUDIO = {"aac", "mp3"}
+
 app = Flask(__name__, template_folder=os.path.join(SCRIPT_DIR, "templates"))
 
-# In-memory job store: job_id -> {status, message, output_path, error, progress}
-jobs = {}
-jobs_lock = threading.Lock()
+cache = CacheManager()
+cache.add_area("windows", WINDOW_DIR, CACHE_BUDGETS["windows"])
+cache.add_area("waves", WAVE_DIR, CACHE_BUDGETS["waves"])
+cache.add_area("hls", HLS_DIR, CACHE_BUDGETS["hls"])
+cache.add_area("remux", REMUX_DIR, CACHE_BUDGETS["remux"])
+cache.add_area("uploads", UPLOAD_DIR, CACHE_BUDGETS["uploads"])
+
+# Slice jobs: job_id -> {status, message, output_path, error, progress}, run by
+# job_queue's workers and kept in SQLite until JOB_TTL_SEC after they finish.
+# Interactive cuts go ahead of GIF exports and batches.
+CPU_JOBS = 2
+GPU_JOBS = 2
+MAX_QUEUED_JOBS = 32
+JOB_TTL_SEC = 24 * 3600
+job_queue = JobQueue(max_queued=MAX_QUEUED_JOBS, ttl=JOB_TTL_SEC)
+jobs = job_queue.jobs
+jobs_lock = job_queue.lock
+# Anything that changes a job record publishes its id here, lock held; the SSE
+# streams sleep on it rather than polling.
+job_bus = job_queue.bus
+
+# With --cancel-orphaned-jobs, a running job whose last SSE watcher went away
+# (tab closed, page reloaded into a new cut) is cancelled after this long, which
+# is enough for a reload to reconnect first.
+ORPHAN_GRACE_SEC = 5
+# SSE comment sent while nothing changes, so a dropped client surfaces as a
+# failed write (and the watcher count drops) instead of lingering forever.
+SSE_KEEPALIVE_SEC = 5
+# Progress events closer together than this collapse into the latest one.
+SSE_MIN_INTERVAL = 0.25
+
+# Request threads under --production. Open SSE and live-block streams each hold
+# one (asleep), so this is comfortably more than a few tabs need.
+PRODUCTION_THREADS = 32
 
 
 def sanitize_timecode_for_filename(tc):
@@ -105,20 +194,38 @@ def resolve_output_dir(input_path):
     return src_dir
 
 
+def stream_actions(path, codec, audio_codec=None):
+    """How each stream reaches the player: {"video": action, "audio": action}.
+
+    'copy'      — the original file plays as-is.
+    'remux'     — the file can't play as-is (container, or the other stream), but
+                  this stream is stream-copied into the preview blocks.
+    'transcode' — the preview re-encodes it to a browser codec.
+    "audio" is None for a file without sound.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    codec = (codec or "").lower()
+    audio_codec = (audio_codec or "").lower()
+    if (codec in BROWSER_CODECS and ext in BROWSER_CONTAINERS
+            and (not audio_codec or audio_codec in BROWSER_AUDIO)):
+        return {"video": "copy", "audio": "copy" if audio_codec else None}
+    return {
+        "video": "remux" if codec in PREVIEW_COPY_VIDEO else "transcode",
+        "audio": None if not audio_codec else (
+            "remux" if audio_codec in PREVIEW_COPY_AUDIO else "transcode"),
+    }
+
+
 def check_format_status(path, codec, audio_codec=None):
     """Return 'ready' if the browser can play the file as-is, else 'windowed'.
 
     'ready'    — stream the original straight to the player.
     'windowed' — the browser can't decode the video OR the audio (or can't demux
                  the container), so preview it through on-demand blocks
-                 (see /media/window), which re-encode both to browser codecs.
+                 (see /media/window), which convert whatever needs it.
     """
-    ext = os.path.splitext(path)[1].lower()
-    codec = (codec or "").lower()
-    audio_codec = (audio_codec or "").lower()
-    video_ok = codec in BROWSER_CODECS and ext in BROWSER_CONTAINERS
-    audio_ok = not audio_codec or audio_codec in BROWSER_AUDIO
-    return "ready" if (video_ok and audio_ok) else "windowed"
+    actions = stream_actions(path, codec, audio_codec)
+    return "ready" if actions["video"] == "copy" else "windowed"
 
 
 def get_output_extension(codec):
@@ -175,6 +282,7 @@ def upload_file():
     base = os.path.basename(f.filename)
     saved_path = os.path.join(UPLOAD_DIR, f"{str(uuid.uuid4())[:8]}_{base}")
     f.save(saved_path)
+    cache.touch(saved_path)
     size_mb = os.path.getsize(saved_path) / 1e6
     log.info("UPLOAD %s (%.1f MB) -> %s", base, size_mb, saved_path)
     return jsonify({"path": saved_path})
@@ -195,21 +303,45 @@ def _locate_roots():
     return [r for r in roots if os.path.isdir(r)]
 
 
+# Every video file under _locate_roots(), kept fresh in the background.
+media_index = MediaIndex(VIDEO_EXTENSIONS)
+
+
 @app.route("/api/locate", methods=["POST"])
 def locate_file():
     """Find a dropped file on disk by name (+ size) so we can load it in place.
 
     A browser drop exposes only a blob, never a path — but it does give us the
-    filename and byte size. Searching for that beats copying gigabytes through
-    an upload just to learn where the file already lives.
+    filename and byte size, and the page can hash a little of it. Looking that
+    up beats copying gigabytes through an upload just to learn where the file
+    already lives. `hash` (see media_index.partial_hash) finds a file that has
+    been renamed since the index last saw it.
     """
     data = request.get_json(force=True)
     name = os.path.basename(data.get("name", "") or "")
     size = data.get("size")
+    head_hash = data.get("hash") or None
 
     if not name:
         return jsonify({"error": "No filename"}), 400
-
+    try:
+        size = int(size) if size is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Bad size"}), 400
+
+    if media_index.ready:
+        path = media_index.find(name, size, head_hash)
+        if not path and media_index.refresh_now(timeout=3.0):
+            # Maybe it arrived since the last refresh. An incremental one only
+            # re-lists changed directories, so it usually finishes in time.
+            path = media_index.find(name, size, head_hash)
+        if path:
+            log.info("LOCATE hit: %s -> %s", name, path)
+            return jsonify({"found": True, "path": path})
+        log.info("LOCATE miss: %s", name)
+        return jsonify({"found": False})
+
+    # Until the first index is built, walk for it.
     # Roots are ordered cheapest/likeliest first and we return on the first
     # size-verified hit — walking every mounted drive to completion takes ~8s,
     # and a name+size match is already the file.
@@ -227,7 +359,7 @@ def locate_file():
                 continue
             candidate = os.path.join(dirpath, name)
             try:
-                if size is None or os.path.getsize(candidate) == int(size):
+                if size is None or os.path.getsize(candidate) == size:
                     log.info("LOCATE hit: %s -> %s", name, candidate)
                     return jsonify({"found": True, "path": candidate})
             except OSError:
@@ -244,24 +376,32 @@ def probe():
         return jsonify({"error": "File not found"}), 404
 
     try:
-        info = probe_video_info(path)
-        duration = probe_duration(path)
-        audio_codec = probe_audio_codec(path)
-        audio_tracks = probe_audio_tracks(path)
+        media = probe_media(path)
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
-    codec = (info.get("codec_name") or "").lower()
-    format_status = check_format_status(path, codec, audio_codec)
+    codec = (media.codec_name or "").lower()
+    format_status = check_format_status(path, codec, media.audio_codec)
+    actions = stream_actions(path, codec, media.audio_codec)
 
-    info["duration"] = duration
-    info["has_audio"] = audio_codec is not None
-    info["audio_codec"] = audio_codec
-    info["audio_tracks"] = audio_tracks
+    info = media.as_dict()
     info["path"] = path
     info["filename"] = os.path.basename(path)
     info["playable"] = format_status == "ready"
     info["format_status"] = format_status
+    info["stream_actions"] = actions
+    # Blocks that copy the video build about as fast as the disk reads them,
+    # which beats encoding HLS segments; the JS fetches their keyframe-aligned
+    # grid from /api/window/grid.
+    info["preview_mode"] = ("windows" if actions["video"] == "remux"
+                            else app.config.get("PREVIEW_MODE", "hls"))
+    if remux_eligible(actions):
+        # Nothing to convert, only the container: remux the whole file in the
+        # background and play that (via /video) once it's there.
+        state = start_remux(path)
+        info["remux"] = state["status"]
+        if state["status"] == "ready":
+            info["playable"] = True
     return jsonify(info)
 
 
@@ -270,89 +410,976 @@ def serve_video():
     path = request.args.get("path", "")
     if not path or not os.path.isfile(path):
         return "Not found", 404
-    # Only browser-playable files reach here; anything else is previewed through
-    # /media/window instead.
-    return send_file(path, conditional=True)
+    # Browser-playable files, and files with a finished remux; anything else is
+    # previewed through /media/window instead.
+    remuxed = _remux_path(path)
+    if os.path.isfile(remuxed):
+        return _send_cached(remuxed)
+    return _send_cached(path)
+
+
+# Whole-file remuxes: fingerprint key -> {"status", "progress", "error"}. Only
+# files whose streams the browser already decodes get one, so it's a stream
+# copy — disk-bound, near-zero CPU.
+remuxes = {}
+remuxes_lock = threading.Lock()
+
+
+def remux_eligible(actions):
+    """True if the preview only needs a new container (see stream_actions)."""
+    return actions["video"] == "remux" and actions["audio"] in (None, "remux")
+
+
+def _remux_path(path):
+    """Cache file for the remux of `path`; keyed by fingerprint, so a changed
+    source never plays a stale copy."""
+    try:
+        key = fingerprint_key(file_fingerprint(path))
+    except OSError:
+        key = hashlib.md5(path.encode()).hexdigest()[:20]
+    return os.path.join(REMUX_DIR, f"{key}.mp4")
+
+
+def start_remux(path):
+    """Start (once) the background remux of `path`; returns a copy of its state."""
+    out_path = _remux_path(path)
+    key = os.path.basename(out_path)
+    with remuxes_lock:
+        state = remuxes.get(key)
+        if state is not None and state["status"] == "ready" and not os.path.isfile(out_path):
+            state = None  # evicted since; go again
+        if state is None:
+            if os.path.isfile(out_path):
+                state = remuxes[key] = {"status": "ready", "progress": 100, "error": None}
+            else:
+                state = remuxes[key] = {"status": "running", "progress": 0, "error": None}
+                threading.Thread(target=_run_remux, args=(path, out_path, state),
+                                 name="remux", daemon=True).start()
+        return dict(state)
+
+
+def remux_state(path):
+    out_path = _remux_path(path)
+    with remuxes_lock:
+        state = remuxes.get(os.path.basename(out_path))
+        if state is not None:
+            return dict(state)
+    if os.path.isfile(out_path):
+        return {"status": "ready", "progress": 100, "error": None}
+    return {"status": "none", "progress": 0, "error": None}
+
+
+def _run_remux(path, out_path, state):
+    os.makedirs(REMUX_DIR, exist_ok=True)
+    part_path = f"{out_path[:-4]}.{uuid.uuid4().hex[:8]}.part.mp4"
+
+    def on_progress(pct):
+        state["progress"] = round(pct, 1)
+
+    t0 = time.monotonic()
+    # Everything that can fail is in here, probe included: a state left at
+    # "running" would have the page polling it forever.
+    try:
+        media = probe_media(path)
+        # Every audio track the browser can play (an extra commentary track in
+        # AC-3 would only be dead weight).
+        audio_maps = []
+        for track in media.audio_tracks:
+            if (track.codec or "").lower() in PREVIEW_COPY_AUDIO:
+                audio_maps += ["-map", f"0:a:{track.index}"]
+        # Fragmented, with a sidx up front: the player can seek anywhere with
+        # range requests without a second faststart pass over the whole file.
+        cmd = [
+            "ffmpeg", "-y", "-i", path,
+            "-map", "0:v:0", *audio_maps,
+            "-c", "copy",
+            "-movflags", "frag_keyframe+empty_moov+default_base_moof+global_sidx",
+            "-f", "mp4", part_path,
+        ]
+        run_cmd_with_progress(cmd, media.duration, on_progress)
+        os.replace(part_path, out_path)
+    except Exception as exc:
+        log.info("REMUX [%s] failed: %s", os.path.basename(path), exc)
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        with remuxes_lock:
+            state.update(status="failed", error=str(exc))
+        return
+    cache.touch(out_path)
+    log.info("REMUX [%s] done in %.1fs", os.path.basename(path), time.monotonic() - t0)
+    with remuxes_lock:
+        state.update(status="ready", progress=100)
+
+
+@app.route("/api/remux")
+def remux_status():
+    """Progress of the background remux of `path` ("none" if it has none)."""
+    path = request.args.get("path", "")
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "File not found"}), 404
+    return jsonify(remux_state(path))
 
 
-def _window_bounds(idx):
-    """Absolute (start, length) seconds for grid block `idx`."""
-    return idx * WINDOW_SEC, WINDOW_SEC + WINDOW_OVERLAP
+# Read size for the body when the server can't sendfile() it.
+SEND_CHUNK = 1 << 20
 
 
-# One lock per (path, idx) so two players racing for the same block build it once.
-window_locks = {}
-window_locks_guard = threading.Lock()
+class _ServedFile:
+    """The byte range [start, end) of a file, as the body of one response.
 
+    Each response opens its own descriptor, so concurrent seeks into one file
+    never share an offset. The WSGI server closes it when the response is done
+    (or the client has gone), which runs `on_close` once.
+    """
 
-def _window_lock(key):
-    with window_locks_guard:
-        lock = window_locks.get(key)
-        if lock is None:
-            lock = threading.Lock()
-            window_locks[key] = lock
-        return lock
+    def __init__(self, path, start, end, on_close=None):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._left = end - start
+        self._on_close = on_close
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        if self._f.closed:
+            return
+        self._f.close()
+        if self._on_close is not None:
+            self._on_close()
+
+
+def _file_body(f):
+    """Servers with a wsgi.file_wrapper (gunicorn) sendfile() `f` straight from
+    the page cache, from its offset for Content-Length bytes; anything else
+    gets it in chunks."""
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        return wrapper(f, SEND_CHUNK)
+
+    def chunks():
+        try:
+            while True:
+                data = f.read(SEND_CHUNK)
+                if not data:
+                    break
+                yield data
+        finally:
+            f.close()
+    return chunks()
 
 
-def build_window(path, idx, atrack=0):
-    """Transcode one preview block, cached on disk. Returns its path.
+def send_media(path, mimetype=None, as_attachment=False, on_close=None):
+    """A file response with validators and single-range support.
 
-    `atrack` selects which audio stream (0:a:N) to carry. Track 0 keeps the
-    original cache filename so existing blocks are reused; other tracks get an
-    `_aN` suffix so each track's blocks cache independently.
+    `on_close` runs once the response is finished with. With --x-accel-redirect
+    only headers are sent and nginx delivers the file (ranges included).
+    """
+    st = os.stat(path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "no-cache"}
+    if as_attachment:
+        name = os.path.basename(path)
+        try:
+            name.encode("latin-1")
+            headers["Content-Disposition"] = f'attachment; filename="{name}"'
+        except UnicodeEncodeError:
+            headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(name)}"
+
+    def headers_only(response):
+        if on_close is not None:
+            response.call_on_close(on_close)
+        return response
+
+    accel = app.config.get("X_ACCEL_REDIRECT")
+    if accel:
+        headers["X-Accel-Redirect"] = accel.rstrip("/") + quote(os.path.realpath(path))
+        return headers_only(Response(b"", mimetype=mimetype, headers=headers))
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return headers_only(response)
+
+    size = st.st_size
+    start, end = 0, size
+    status = 200
+    rng = request.range
+    # A range against another version of the file (stale If-Range) gets the
+    # whole thing; so does a multi-range request.
+    if_range = request.if_range
+    fresh = (if_range.etag == etag if if_range.etag
+             else if_range.date is None or int(st.st_mtime) <= if_range.date.timestamp())
+    if rng is not None and fresh and len(rng.ranges) == 1:
+        bounds = rng.range_for_length(size)
+        if bounds is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return headers_only(Response(status=416, headers=headers))
+        start, end = bounds
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    f = _ServedFile(path, start, end, on_close)
+    try:
+        response = Response(_file_body(f), status=status, mimetype=mimetype,
+                            headers=headers, direct_passthrough=True)
+        response.content_length = end - start
+        response.set_etag(etag)
+        response.last_modified = st.st_mtime
+    except Exception:
+        f.close()
+        raise
+    # A HEAD response never touches the body; it's closed with the response.
+    response.call_on_close(f.close)
+    return response
+
+
+def _send_cached(path, **kwargs):
+    """send_media, with `path` marked as used and pinned against eviction until
+    the response has been fully sent. No-op bookkeeping for unmanaged paths."""
+    cache.touch(path)
+    cache.acquire(path)
+    try:
+        return send_media(path, on_close=lambda: cache.release(path), **kwargs)
+    except Exception:
+        cache.release(path)
+        raise
+
+
+def _preview_actions(path):
+    media = probe_media(path)
+    return stream_actions(path, media.codec_name, media.audio_codec)
+
+
+def _window_grid(path):
+    """Block start times for a preview that stream-copies the video, else None.
+
+    A copied block can only begin on a keyframe, so block `idx` starts at the
+    keyframe at or before idx * WINDOW_SEC (blocks a long GOP would make empty
+    are merged into the one before). None means blocks are transcoded and sit
+    on the plain WINDOW_SEC grid.
+    """
+    try:
+        if _preview_actions(path)["video"] != "remux":
+            return None
+        index = load_keyframe_index(path)
+        if not len(index):
+            return None
+        duration = probe_media(path).duration or index.duration
+    except Exception as exc:
+        log.info("WINDOW grid for %s unavailable (%s) — transcoding blocks",
+                 os.path.basename(path), exc)
+        return None
+    slots = max(1, int(math.ceil(duration / WINDOW_SEC)))
+    return sorted({index.prev_keyframe(i * WINDOW_SEC) for i in range(slots)})
+
+
+def _window_count(path):
+    grid = _window_grid(path)
+    if grid is not None:
+        return len(grid)
+    duration = probe_media(path).duration
+    return int(math.ceil(duration / WINDOW_SEC)) if duration else None
+
+
+def _window_bounds(idx, grid=None):
+    """Absolute (start, length) seconds for block `idx` (of `grid`, if copied)."""
+    if grid is None:
+        return idx * WINDOW_SEC, WINDOW_SEC + WINDOW_OVERLAP
+    start = grid[idx]
+    end = grid[idx + 1] if idx + 1 < len(grid) else start + WINDOW_SEC
+    return start, end - start + WINDOW_OVERLAP
+
+
+def _window_path(path, idx, atrack=0):
+    """Cache file for one preview block.
+
+    `atrack` selects which audio stream (0:a:N) the block carries. Track 0 keeps
+    the original cache filename so existing blocks are reused; other tracks get
+    an `_aN` suffix so each track's blocks cache independently. Blocks that copy
+    the video sit on a different grid, so they're cached as `_v` apart from any
+    transcoded ones.
     """
-    os.makedirs(WINDOW_DIR, exist_ok=True)
     path_hash = hashlib.md5(path.encode()).hexdigest()[:12]
     suffix = f"_a{atrack}" if atrack else ""
-    out_path = os.path.join(WINDOW_DIR, f"{path_hash}_{idx:05d}{suffix}.mp4")
-
-    with _window_lock((path, idx, atrack)):
-        if os.path.isfile(out_path):
-            return out_path
-
-        start, length = _window_bounds(idx)
-        # -ss BEFORE -i: seek to the preceding keyframe, then decode and discard
-        # up to the exact start. With a re-encode the block begins precisely at
-        # `start`, so proxy time 0 == start and the offset math stays honest.
-        gpu_cmd = [
-            "ffmpeg", "-y", "-hwaccel", "cuda", "-hwaccel_output_format", "cuda",
-            "-ss", f"{start:.3f}", "-i", path, "-t", f"{length:.3f}",
-            "-map", "0:v:0", "-map", f"0:a:{atrack}?",
-            "-vf", "scale_cuda=w=1280:h=-2:format=yuv420p",
-            "-c:v", "h264_nvenc", "-preset", "p4", "-cq", "28",
-            "-c:a", "aac", "-b:a", "128k", "-ac", "2",
-            "-movflags", "+faststart", out_path,
-        ]
-        cpu_cmd = [
-            "ffmpeg", "-y",
-            "-ss", f"{start:.3f}", "-i", path, "-t", f"{length:.3f}",
+    try:
+        if _preview_actions(path)["video"] == "remux":
+            suffix += "_v"
+    except Exception:
+        pass
+    return os.path.join(WINDOW_DIR, f"{path_hash}_{idx:05d}{suffix}.mp4")
+
+
+def _encode_window(path, idx, atrack, out_path, threads=None, cancel=None, live=None):
+    """Transcode one preview block to `out_path`.
+
+    Encodes to a .part file and renames it into place, so a build that's killed
+    or fails never leaves a half-written block in the cache. With `live` (a
+    _LiveFile) the block is written as fragmented MP4 piped through us, so
+    requests can stream it while it's still encoding (see serve_window).
+    """
+    os.makedirs(WINDOW_DIR, exist_ok=True)
+    # Unique per build: a killed build may still be exiting when its
+    # replacement starts writing.
+    part_path = f"{out_path[:-4]}.{uuid.uuid4().hex[:8]}.part.mp4"
+    grid = _window_grid(path)
+    if grid is not None:
+        if idx >= len(grid):
+            raise ValueError(f"block {idx} is past the end")
+        attempts = [_copy_window_cmd(path, atrack, *_window_bounds(idx, grid))]
+        video = "copy"
+    else:
+        attempts = _transcode_window_cmds(path, atrack, *_window_bounds(idx), threads)
+        video = "transcode"
+        if live is not None:
+            # Keyframe every 2s so the first fragment doesn't wait a whole GOP.
+            attempts = [cmd + ["-force_key_frames", "expr:gte(t,n_forced*2)"]
+                        for cmd in attempts]
+
+    t0 = time.monotonic()
+    if live is None:
+        attempts = [cmd + ["-movflags", "+faststart", part_path] for cmd in attempts]
+        _run_preview_encode(attempts, part_path, cancel)
+    else:
+        # A fragment per keyframe, moov up front with no sample tables: the
+        # player can start on the first fragment.
+        attempts = [cmd + ["-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                           "-f", "mp4", "pipe:1"] for cmd in attempts]
+        _stream_preview_encode(attempts, part_path, live, cancel)
+    os.replace(part_path, out_path)
+    cache.touch(out_path)
+    log.info("WINDOW [%s idx=%d video=%s] built in %.1fs", os.path.basename(path),
+             idx, video, time.monotonic() - t0)
+    return out_path
+
+
+def _copy_window_cmd(path, atrack, start, length):
+    """A block that stream-copies the video from keyframe `start`; only audio that
+    the browser can't play (or that isn't AAC/MP3) is converted."""
+    media = probe_media(path)
+    track = media.audio_tracks[atrack] if atrack < len(media.audio_tracks) else None
+    codec = (track.codec if track else media.audio_codec) or ""
+    if codec.lower() in PREVIEW_COPY_AUDIO:
+        audio = ["-c:a", "copy"]
+    else:
+        audio = ["-c:a", "aac", "-b:a", "160k", "-ac", "2"]
+    # Nudged past the keyframe so rounding can't land the seek on the one before.
+    return [
+        "ffmpeg", "-y",
+        "-ss", f"{start + SEEK_NUDGE:.6f}", "-i", path, "-t", f"{length:.3f}",
+        "-map", "0:v:0", "-map", f"0:a:{atrack}?",
+        "-c:v", "copy", *audio,
+        "-avoid_negative_ts", "make_zero",
+    ]
+
+
+def _transcode_window_cmds(path, atrack, start, length, threads=None):
+    """[GPU, CPU] (or just CPU) commands re-encoding a block to 720p-ish H.264."""
+    # -ss BEFORE -i: seek to the preceding keyframe, then decode and discard
+    # up to the exact start. With a re-encode the block begins precisely at
+    # `start`, so proxy time 0 == start and the offset math stays honest.
+    gpu_cmd = [
+        "ffmpeg", "-y", "-hwaccel", "cuda", "-hwaccel_output_format", "cuda",
+        "-ss", f"{start:.3f}", "-i", path, "-t", f"{length:.3f}",
+        "-map", "0:v:0", "-map", f"0:a:{atrack}?",
+        "-vf", "scale_cuda=w=1280:h=-2:format=yuv420p",
+        "-c:v", "h264_nvenc", "-preset", "p4", "-cq", "28",
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+    ]
+    cpu_cmd = [
+        "ffmpeg", "-y",
+    ] + (["-threads", str(threads)] if threads else []) + [
+        "-ss", f"{start:.3f}", "-i", path, "-t", f"{length:.3f}",
+        "-map", "0:v:0", "-map", f"0:a:{atrack}?",
+        "-vf", "scale='min(1280,iw)':-2",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+    ]
+    return [gpu_cmd, cpu_cmd] if gpu_preview_available() else [cpu_cmd]
+
+
+class _LiveFile:
+    """A cache file one thread is still writing while others read it as it grows.
+
+    Readers follow `size` and stop at `finished`. `generation` moves on if the
+    writer has to start over (a GPU attempt that failed part-way), which ends
+    any reader still holding the abandoned attempt's file.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.size = 0
+        self.generation = 0
+        self.finished = False
+        self.failed = False
+        self._cv = threading.Condition()
+
+    def begin(self, path):
+        with self._cv:
+            if self.path is not None:
+                self.generation += 1
+            self.path = path
+            self.size = 0
+            self._cv.notify_all()
+
+    def grew(self, n):
+        with self._cv:
+            self.size += n
+            self._cv.notify_all()
+
+    def finish(self, ok):
+        with self._cv:
+            self.finished = True
+            self.failed = not ok
+            self._cv.notify_all()
+
+    def wait(self, offset, generation, timeout=5.0):
+        """Block until there's data past `offset` (or the write ends); returns
+        (path, size, finished, ok) as of then."""
+        with self._cv:
+            self._cv.wait_for(lambda: (self.path is not None and self.size > offset)
+                              or self.finished or self.generation != generation,
+                              timeout)
+            ok = not self.failed and self.generation == generation
+            return self.path, self.size, self.finished, ok
+
+
+def _kill_group(proc):
+    """SIGKILL a preview encode and anything it spawned (it has its own session)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _stream_preview_encode(attempts, part_path, live, cancel=None, timeout=180):
+    """_run_preview_encode for commands writing to stdout: tee the bytes into
+    `part_path`, announcing each chunk on `live` so readers can follow.
+
+    The read blocks until ffmpeg writes, so the deadline is a timer that kills
+    the process group; a stalled encode ends like a finished one and is then
+    reported as timed out.
+    """
+    last_err = None
+    deadline = time.monotonic() + timeout
+    for cmd in attempts:
+        # stderr to a file, not a pipe nobody reads until the end.
+        errors = tempfile.TemporaryFile()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors,
+                                start_new_session=True)
+        if cancel is not None:
+            cancel.register(proc)
+        expired = threading.Event()
+
+        def expire(proc=proc, expired=expired):
+            expired.set()
+            _kill_group(proc)
+
+        watchdog = threading.Timer(max(0.0, deadline - time.monotonic()), expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            with open(part_path, "wb") as out:
+                live.begin(part_path)
+                while True:
+                    chunk = proc.stdout.read1(1 << 16)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    out.flush()  # readers open the file by path
+                    live.grew(len(chunk))
+            proc.wait()
+            if cancel is not None:
+                cancel.check()
+            if expired.is_set():
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if proc.returncode != 0:
+                errors.seek(0)
+                tail = errors.read().decode(errors="replace").strip()[-500:]
+                raise RuntimeError(f"ffmpeg exited with {proc.returncode}: {tail}")
+            return
+        except Exception as exc:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            if isinstance(exc, Cancelled):
+                raise
+            last_err = exc
+        finally:
+            watchdog.cancel()
+            proc.stdout.close()
+            errors.close()
+            if cancel is not None:
+                cancel.unregister(proc)
+    raise RuntimeError(f"preview build failed: {last_err}")
+
+
+def _run_preview_encode(attempts, part_path, cancel=None, timeout=180):
+    """Run the first of `attempts` (ffmpeg commands writing `part_path`) that
+    succeeds. A failed attempt's partial output is removed; Cancelled propagates.
+    """
+    last_err = None
+    for cmd in attempts:
+        # Own session, so a superseded build can be killed with its whole group.
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                start_new_session=True)
+        if cancel is not None:
+            cancel.register(proc)
+        try:
+            _, err = proc.communicate(timeout=timeout)
+            if cancel is not None:
+                cancel.check()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=err)
+            return
+        except Exception as exc:
+            if isinstance(exc, subprocess.TimeoutExpired):
+                _kill_group(proc)
+                proc.wait()
+            if os.path.isfile(part_path):
+                os.remove(part_path)  # don't cache a half-written block
+            if isinstance(exc, Cancelled):
+                raise
+            last_err = exc
+        finally:
+            if cancel is not None:
+                cancel.unregister(proc)
+    raise RuntimeError(f"preview build failed: {last_err}")
+
+
+# Blocks to build ahead of the playhead, and builds run at once. Each build is a
+# full decode + encode, so concurrency follows the core count.
+WINDOW_LOOKAHEAD = 2
+WINDOW_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+class WindowSuperseded(Exception):
+    """The block was dropped because every client that wanted it moved on."""
+
+
+class _WindowTask:
+    def __init__(self, key, out_path, priority):
+        self.key = key  # (path, idx, atrack)
+        self.out_path = out_path
+        self.priority = priority
+        self.owners = set()  # clients whose focus includes this block
+        self.waiters = 0  # anonymous requests blocked on it
+        self.state = "queued"  # -> "running" -> "done"
+        self.error = None
+        self.live = None  # _LiveFile while a streaming build runs
+        self.started = threading.Event()  # running (live is set) or done
+        self.done = threading.Event()
+        self.cancel = CancelToken(grace=1.0)
+
+
+class WindowScheduler:
+    """Owns every preview block (or HLS segment) build.
+
+    Each client (a browser tab) has a focus: the block under its playhead. The
+    focus queues that block first, then the next WINDOW_LOOKAHEAD blocks in
+    order, then the one behind. A fixed pool of workers takes the most urgent
+    queued block, and a block already queued or building is shared, never built
+    twice. When a client's focus moves, blocks that no client wants any more are
+    dropped from the queue, or killed mid-build, so fast scrubbing doesn't leave
+    a backlog of dead transcodes. Finished tasks leave the table (the result is
+    on disk), so it only ever holds what's queued or running.
+
+    `encode(path, idx, atrack, out_path, threads=, cancel=)` builds one unit of
+    `unit_sec` seconds; `path_for(path, idx, atrack)` is where it's cached. With
+    `streaming`, encode also gets `live=`, a _LiveFile readers can follow.
+    `count(path)` is how many units a file has (default: its duration over
+    `unit_sec`).
+    """
+
+    def __init__(self, encode, path_for, unit_sec, name="WINDOW",
+                 workers=WINDOW_WORKERS, lookahead=WINDOW_LOOKAHEAD, streaming=False,
+                 count=None):
+        self.encode = encode
+        self.count = count
+        self.streaming = streaming
+        self.path_for = path_for
+        self.unit_sec = unit_sec
+        self.name = name
+        self.workers = workers
+        self.lookahead = lookahead
+        self.threads_per_build = thread_budget(workers)
+        self._cv = threading.Condition()
+        self._heap = []  # (priority, seq, key); stale entries skipped on pop
+        self._seq = itertools.count()
+        self._tasks = {}
+        self._focus = {}  # client -> set of keys it owns
+        self._started = False
+
+    def _plan(self, path, idx):
+        """[(idx, priority)] for a focus at block `idx` of `path`."""
+        try:
+            if self.count is not None:
+                count = self.count(path)
+            else:
+                duration = probe_media(path).duration
+                count = int(math.ceil(duration / self.unit_sec)) if duration else None
+        except Exception:
+            count = None
+        last = count - 1 if count else None
+        plan = [(idx + i, i) for i in range(self.lookahead + 1)] + [
+            (idx - 1, self.lookahead + 1)]
+        return [(i, p) for i, p in plan if i >= 0 and (last is None or i <= last)]
+
+    def _submit(self, key, priority):
+        """Queue `key` (lock held). Returns its task, or None if already cached."""
+        task = self._tasks.get(key)
+        if task is not None and task.cancel.cancelled:
+            task = None  # being killed; wanted again, so build it afresh
+        if task is None:
+            out_path = self.path_for(*key)
+            if os.path.isfile(out_path):
+                return None
+            task = self._tasks[key] = _WindowTask(key, out_path, priority)
+        elif task.state != "queued" or priority >= task.priority:
+            return task
+        task.priority = priority
+        heapq.heappush(self._heap, (priority, next(self._seq), key))
+        self._ensure_workers()
+        self._cv.notify()
+        return task
+
+    def _release(self, task):
+        """Drop or kill `task` if nobody wants it any more (lock held)."""
+        if task.owners or task.waiters or task.state == "done":
+            return
+        if task.state == "queued":
+            self._tasks.pop(task.key, None)
+            task.state = "done"
+            task.error = "superseded"
+            task.started.set()
+            task.done.set()
+        else:
+            task.cancel.cancel()
+
+    def focus(self, client, path, idx, atrack=0):
+        """Point `client` at block `idx`; returns {idx: state} for its plan."""
+        plan = self._plan(path, idx)
+        states = {}
+        with self._cv:
+            keys = set()
+            for i, priority in plan:
+                key = (path, i, atrack)
+                task = self._submit(key, priority)
+                if task is None:
+                    states[i] = "ready"
+                    continue
+                task.owners.add(client)
+                keys.add(key)
+                states[i] = task.state
+            for key in self._focus.get(client, set()) - keys:
+                task = self._tasks.get(key)
+                if task is not None:
+                    task.owners.discard(client)
+                    self._release(task)
+            self._focus[client] = keys
+        return states
+
+    def claim(self, path, idx, atrack=0, client=None):
+        """Queue `idx` ahead of everything else; returns its task, or None if
+        it's already cached.
+
+        With a `client`, this is also a focus change, and the build is dropped
+        if that client moves on before it's done. Without one the claim itself
+        keeps the build alive until unclaim().
+        """
+        if client:
+            self.focus(client, path, idx, atrack)
+        with self._cv:
+            task = self._submit((path, idx, atrack), -1)
+            if task is not None and not client:
+                task.waiters += 1
+        return task
+
+    def unclaim(self, task, client=None):
+        if not client:
+            with self._cv:
+                task.waiters -= 1
+                self._release(task)
+
+    def get(self, path, idx, atrack=0, client=None):
+        """Block until `idx` is built and return its path (see claim).
+
+        Raises WindowSuperseded if the build was dropped first.
+        """
+        task = self.claim(path, idx, atrack, client)
+        if task is None:
+            return self.path_for(path, idx, atrack)
+        try:
+            task.done.wait()
+        finally:
+            self.unclaim(task, client)
+        return self.result(task)
+
+    @staticmethod
+    def result(task):
+        """A finished task's output path, or the reason it has none."""
+        if task.error == "superseded":
+            raise WindowSuperseded(f"block {task.key[1]} superseded")
+        if task.error:
+            raise RuntimeError(task.error)
+        return task.out_path
+
+    def forget(self, client):
+        with self._cv:
+            for key in self._focus.pop(client, set()):
+                task = self._tasks.get(key)
+                if task is not None:
+                    task.owners.discard(client)
+                    self._release(task)
+
+    def stats(self):
+        with self._cv:
+            states = [t.state for t in self._tasks.values()]
+            return {"workers": self.workers, "clients": len(self._focus),
+                    "queued": states.count("queued"),
+                    "running": states.count("running")}
+
+    def _ensure_workers(self):
+        if self._started:
+            return
+        self._started = True
+        for n in range(self.workers):
+            threading.Thread(target=self._work, name=f"{self.name.lower()}-{n}",
+                             daemon=True).start()
+
+    def _next_task(self):
+        with self._cv:
+            while True:
+                while not self._heap:
+                    self._cv.wait()
+                priority, _, key = heapq.heappop(self._heap)
+                task = self._tasks.get(key)
+                if task is not None and task.state == "queued" and task.priority == priority:
+                    task.state = "running"
+                    if self.streaming:
+                        task.live = _LiveFile()
+                    task.started.set()
+                    return task
+
+    def _work(self):
+        while True:
+            task = self._next_task()
+            path, idx, atrack = task.key
+            error = None
+            extra = {"live": task.live} if task.live is not None else {}
+            try:
+                self.encode(path, idx, atrack, task.out_path,
+                            threads=self.threads_per_build, cancel=task.cancel, **extra)
+            except Cancelled:
+                error = "superseded"
+                log.info("%s [%s idx=%d a=%d] dropped: scrubbed away", self.name,
+                         os.path.basename(path), idx, atrack)
+            except Exception as exc:
+                error = str(exc)
+                log.error("%s [%s idx=%d a=%d] FAILED: %s", self.name,
+                          os.path.basename(path), idx, atrack, exc)
+            with self._cv:
+                if self._tasks.get(task.key) is task:
+                    del self._tasks[task.key]
+                task.state = "done"
+                task.error = error
+            if task.live is not None:
+                task.live.finish(error is None)
+            task.done.set()
+
+
+windows = WindowScheduler(_encode_window, _window_path, WINDOW_SEC, streaming=True,
+                          count=_window_count)
+
+
+class ProxyBuilder:
+    """At most one whole-file preview proxy build at a time.
+
+    ffmpeg's segment muxer cuts the encode on the WINDOW_SEC grid and lists
+    each segment as it closes; every finished one is moved into the window cache
+    under its block's name, so the scheduler and /media/window treat it as
+    built. Blocks that exist already (built on demand) are left alone. Moving to
+    another file stops the current build; coming back resumes it from the first
+    block still missing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._builds = {}  # (path, atrack) -> state dict
+        self._current = None
+
+    def start(self, path, atrack=0):
+        if not app.config.get("BACKGROUND_PROXY", True):
+            return
+        key = (path, atrack)
+        with self._lock:
+            state = self._builds.get(key)
+            if state is not None and state["status"] in ("running", "done"):
+                return
+            if self._current is not None and self._current["status"] == "running":
+                self._current["cancel"].cancel()
+            # A finished entry only saves re-checking the cache; keep the latest.
+            self._builds.pop(key, None)
+            finished = [k for k, s in self._builds.items() if s["status"] != "running"]
+            for old in finished[:max(0, len(finished) - PROXY_KEEP_STATES)]:
+                del self._builds[old]
+            state = self._builds[key] = {
+                "status": "running", "progress": 0.0, "blocks": 0, "total": None,
+                "error": None, "cancel": CancelToken(),
+            }
+            self._current = state
+        threading.Thread(target=self._run, args=(path, atrack, state),
+                         name="proxy", daemon=True).start()
+
+    def status(self, path, atrack=0):
+        with self._lock:
+            state = self._builds.get((path, atrack))
+            if state is None:
+                return {"status": "none"}
+            return {k: v for k, v in state.items() if k != "cancel"}
+
+    def _run(self, path, atrack, state):
+        try:
+            total = _window_count(path) or 0
+            first = next((i for i in range(total)
+                          if not os.path.isfile(_window_path(path, i, atrack))), total)
+            state["total"] = total
+            state["blocks"] = first
+            if first >= total:
+                state["status"] = "done"
+                state["progress"] = 100.0
+                return
+            self._encode(path, atrack, first, state)
+        except Cancelled:
+            state["status"] = "stopped"
+            return
+        except Exception as exc:
+            log.info("PROXY [%s] failed: %s", os.path.basename(path), exc)
+            state["status"] = "failed"
+            state["error"] = str(exc)
+            return
+        state["status"] = "done"
+        state["progress"] = 100.0
+
+    def _encode(self, path, atrack, first, state):
+        path_hash = hashlib.md5(path.encode()).hexdigest()[:12]
+        stage = os.path.join(PROXY_DIR, f"{path_hash}_a{atrack}")
+        shutil.rmtree(stage, ignore_errors=True)
+        os.makedirs(stage)
+        list_path = os.path.join(stage, "segments.csv")
+        duration = probe_media(path).duration
+        start = first * WINDOW_SEC
+        # Same picture as an on-demand CPU block, with keyframes forced onto the
+        # grid so the file comes out as one segment per block. Timestamps
+        # restart in each segment, as they do in a block.
+        cmd = idle_prefix() + [
+            "ffmpeg", "-y", "-threads", str(PROXY_THREADS),
+            "-ss", f"{start:.3f}", "-i", path,
             "-map", "0:v:0", "-map", f"0:a:{atrack}?",
             "-vf", "scale='min(1280,iw)':-2",
             "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+            "-threads", str(PROXY_THREADS),
+            "-force_key_frames", f"expr:gte(t,n_forced*{WINDOW_SEC})",
             "-c:a", "aac", "-b:a", "128k", "-ac", "2",
-            "-movflags", "+faststart", out_path,
+            "-f", "segment", "-segment_time", str(WINDOW_SEC),
+            "-segment_start_number", str(first),
+            "-segment_list", list_path, "-segment_list_type", "csv",
+            "-reset_timestamps", "1",
+            "-segment_format", "mp4", "-segment_format_options", "movflags=+faststart",
+            os.path.join(stage, "%05d.mp4"),
         ]
-        attempts = [gpu_cmd, cpu_cmd] if HAS_NVENC else [cpu_cmd]
-
-        last_err = None
-        for cmd in attempts:
-            t0 = time.monotonic()
+        closed = set()
+        pending = []  # closed segments whose block isn't made yet, in order
+
+        def stitch(staged, following, out_path):
+            # An on-demand block runs WINDOW_OVERLAP past its slot, so the player
+            # can hand over to the next one; take that from the next segment,
+            # which starts on a keyframe, so a stream copy joins them cleanly.
+            concat_list = os.path.join(stage, "block.txt")
+            with open(concat_list, "w", encoding="utf-8") as f:
+                f.write(f"file '{staged}'\nfile '{following}'\n"
+                        f"outpoint {WINDOW_OVERLAP:.3f}\n")
+            part_path = f"{out_path}.{uuid.uuid4().hex[:8]}.part.mp4"
             try:
-                subprocess.run(cmd, check=True, capture_output=True, timeout=180)
-                log.info("WINDOW [%s idx=%d] built in %.1fs", os.path.basename(path),
-                         idx, time.monotonic() - t0)
-                return out_path
-            except Exception as exc:
-                last_err = exc
-                if os.path.isfile(out_path):
-                    os.remove(out_path)  # don't cache a half-written block
-        raise RuntimeError(f"window build failed: {last_err}")
+                run_cmd(idle_prefix() + [
+                    "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_list,
+                    "-map", "0", "-c", "copy", "-movflags", "+faststart",
+                    "-f", "mp4", part_path,
+                ], cancel=state["cancel"])
+                os.replace(part_path, out_path)
+            finally:
+                if os.path.isfile(part_path):
+                    os.remove(part_path)
+
+        def harvest(final=False):
+            # The list only names a segment once ffmpeg has closed it.
+            try:
+                with open(list_path, "r", encoding="utf-8") as f:
+                    names = [line.split(",", 1)[0] for line in f if line.strip()]
+            except OSError:
+                return
+            for name in names:
+                idx = int(os.path.splitext(name)[0])
+                if idx not in closed:
+                    closed.add(idx)
+                    pending.append(idx)
+            # A block needs the segment after it for its overlap; the file's
+            # last segment runs to the end, so it's a whole block by itself.
+            while pending and (pending[0] + 1 in closed or final):
+                idx = pending.pop(0)
+                staged = os.path.join(stage, f"{idx:05d}.mp4")
+                following = os.path.join(stage, f"{idx + 1:05d}.mp4")
+                out_path = _window_path(path, idx, atrack)
+                if not os.path.isfile(out_path):
+                    os.makedirs(WINDOW_DIR, exist_ok=True)
+                    if idx + 1 in closed:
+                        stitch(staged, following, out_path)
+                    else:
+                        os.replace(staged, out_path)
+                    cache.touch(out_path)
+                if os.path.isfile(staged):
+                    os.remove(staged)
+                state["blocks"] += 1
+
+        def on_progress(pct):
+            state["progress"] = round((start + pct / 100 * (duration - start))
+                                      / duration * 100, 1)
+            harvest()
+
+        t0 = time.monotonic()
+        log.info("PROXY [%s] from block %d, %d threads", os.path.basename(path),
+                 first, PROXY_THREADS)
+        try:
+            run_cmd_with_progress(cmd, duration - start, on_progress, cancel=state["cancel"])
+            harvest(final=True)
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
+        log.info("PROXY [%s] done in %.0fs", os.path.basename(path), time.monotonic() - t0)
+
+
+proxy = ProxyBuilder()
 
 
 @app.route("/media/window")
 def serve_window():
-    """Serve one preview block. Built on demand, then cached."""
+    """Serve one preview block, built through the scheduler, then cached.
+
+    `client` identifies the tab asking, so this request also moves that tab's
+    focus (see WindowScheduler).
+    """
     path = request.args.get("path", "")
+    client = request.args.get("client") or None
     try:
         idx = int(request.args.get("idx", "0"))
         atrack = int(request.args.get("atrack", "0"))
@@ -360,13 +1387,329 @@ def serve_window():
         return "Bad idx", 400
     if not path or not os.path.isfile(path) or idx < 0 or atrack < 0:
         return "Not found", 404
+    grid = _window_grid(path)
+    if grid is not None and idx >= len(grid):
+        return "Not found", 404
+
+    task = windows.claim(path, idx, atrack, client=client)
+    if task is None:
+        if grid is None:
+            proxy.start(path, atrack)
+        return _send_cached(_window_path(path, idx, atrack))
+    task.started.wait()
+    if task.live is None or task.done.is_set():
+        try:
+            task.done.wait()
+            out_path = windows.result(task)
+        except WindowSuperseded:
+            return "Superseded", 409
+        except Exception:
+            return "Window build failed", 500
+        finally:
+            windows.unclaim(task, client)
+        if grid is None:
+            proxy.start(path, atrack)
+        return _send_cached(out_path)
+
+    # Still encoding: stream what's there and follow the encoder. Any number of
+    # requests can read the same in-flight block this way; once it's finished
+    # and cached, later ones get plain send_media with range support.
+    then = (lambda: proxy.start(path, atrack)) if grid is None else None
+    response = Response(_follow_live(task, then), mimetype="video/mp4",
+                        headers={"Cache-Control": "no-store"})
+    # The claim is released with the response, not by the generator: a client
+    # that hangs up before the first chunk never starts it, so its finally
+    # would never run.
+    response.call_on_close(lambda: windows.unclaim(task, client))
+    return response
+
+
+def _follow_live(task, then=None):
+    live = task.live
+    try:
+        generation = live.generation
+        path, _, _, ok = live.wait(-1, generation)
+        if path is None or not ok:
+            return
+        offset = 0
+        with open(path, "rb") as f:
+            while True:
+                _, size, finished, ok = live.wait(offset, generation)
+                if not ok:
+                    return  # killed or restarted; the player will ask again
+                while offset < size:
+                    chunk = f.read(min(size - offset, 1 << 16))
+                    if not chunk:
+                        return
+                    offset += len(chunk)
+                    yield chunk
+                if finished and offset >= size:
+                    if then is not None:
+                        then()
+                    return
+    except OSError:
+        return
+
+
+@app.route("/api/proxy")
+def proxy_status():
+    """Progress of the background proxy of `path` for audio track `atrack`:
+    status (none / running / stopped / done / failed), progress %, and how many
+    of `total` blocks it has covered."""
+    path = request.args.get("path", "")
+    try:
+        atrack = int(request.args.get("atrack", "0"))
+    except ValueError:
+        return jsonify({"error": "Bad atrack"}), 400
+    return jsonify(proxy.status(path, atrack))
+
+
+@app.route("/api/window/grid")
+def window_grid():
+    """Where each preview block starts, when blocks stream-copy the video and so
+    begin on keyframes; `starts` is null when they sit on the WINDOW_SEC grid."""
+    path = request.args.get("path", "")
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "File not found"}), 404
+    return jsonify({"window_sec": WINDOW_SEC, "starts": _window_grid(path)})
+
+
+@app.route("/api/window/focus", methods=["POST"])
+def window_focus():
+    """Move a client's playhead focus: queue its block and the read-ahead, drop
+    what it no longer needs. Returns each planned block's state. idx=null
+    releases the client altogether."""
+    data = request.get_json(force=True)
+    path = data.get("path", "")
+    client = data.get("client")
+    if client and data.get("idx") is None:
+        windows.forget(client)  # tab closed
+        segments.forget(client)
+        return jsonify({"blocks": {}})
+    try:
+        idx = int(data.get("idx", 0))
+        atrack = int(data.get("atrack", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Bad idx"}), 400
+    if not client:
+        return jsonify({"error": "client required"}), 400
+    if not path or not os.path.isfile(path) or idx < 0 or atrack < 0:
+        return jsonify({"error": "Not found"}), 404
+    states = windows.focus(client, path, idx, atrack)
+    return jsonify({"blocks": {str(i): state for i, state in sorted(states.items())}})
+
+
+def _hls_stem(path, atrack):
+    # "_v2": earlier segments carried no real start time (every fragment said
+    # 0) and can't be mixed with these.
+    path_hash = hashlib.md5(path.encode()).hexdigest()[:12]
+    return os.path.join(HLS_DIR, f"{path_hash}_a{atrack}_v2")
+
+
+def _segment_path(path, n, atrack=0):
+    return f"{_hls_stem(path, atrack)}_{n:05d}.m4s"
+
+
+def _init_path(path, atrack=0):
+    return f"{_hls_stem(path, atrack)}_init.mp4"
 
+
+def _split_fmp4(data):
+    """Split a fragmented MP4 into (init, media): ftyp+moov, then the fragments.
+
+    Every segment is encoded as a complete little fMP4. With identical encoder
+    settings their moovs are interchangeable, so one serves as the playlist's
+    shared init (EXT-X-MAP) and the rest are served as bare moof/mdat.
+    """
+    init, media = [], []
+    off = 0
+    while off + 8 <= len(data):
+        size = int.from_bytes(data[off:off + 4], "big")
+        kind = data[off + 4:off + 8]
+        if size == 1:
+            size = int.from_bytes(data[off + 8:off + 16], "big")
+        elif size == 0:
+            size = len(data) - off
+        if size < 8:
+            raise ValueError("corrupt MP4 box")
+        box = data[off:off + size]
+        if kind in (b"ftyp", b"moov"):
+            init.append(box)
+        elif kind != b"mfra":  # whole-file index; meaningless in a segment
+            media.append(box)
+        off += size
+    if not init or not media:
+        raise ValueError("segment has no init or no media")
+    return b"".join(init), b"".join(media)
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _encode_segment(path, n, atrack, out_path, threads=None, cancel=None):
+    """Encode HLS segment `n` (and the shared init, if it's missing).
+
+    CPU only, on purpose: every segment must share one init, so they all need
+    the same encoder and the same scaled size — a GPU segment next to a CPU
+    fallback one would not. A few seconds of veryfast 720p is quick anyway.
+    Timestamps are the file's own (-copyts, counted from its start), and
+    frag_discont writes them into each fragment, so the fragments line up on
+    the playlist timeline; the track timescales are pinned to match.
+
+    Audio can't simply stop at the segment's seconds: AAC comes in 1024-sample
+    frames, and a fresh encoder starts with a frame of priming. So the audio is
+    read from a couple of frames early, encoded, and only the frames from the
+    first grid line at/after the segment start up to the first one at/after its
+    end are kept (the noise bitstream filter drops the rest). The next segment
+    starts on that same grid line, so its audio begins exactly where this one's
+    ends, with no priming in between.
+    """
+    os.makedirs(HLS_DIR, exist_ok=True)
+    part_path = f"{out_path}.{uuid.uuid4().hex[:8]}.part.mp4"
+    start = n * HLS_SEGMENT_SEC
+
+    def grid(t):
+        # First AAC frame boundary at/after t, in samples from the file start.
+        return math.ceil(round(t * HLS_AUDIO_RATE) / AAC_FRAME) * AAC_FRAME
+
+    a_start, a_end = grid(start), grid(start + HLS_SEGMENT_SEC)
+    a_read = max(0, a_start - HLS_AUDIO_PREROLL * AAC_FRAME)
+    # Packet times are compared half a frame early, so rounding can't matter.
+    keep_from = (a_start - AAC_FRAME / 2) / HLS_AUDIO_RATE
+    keep_to = (a_end - AAC_FRAME / 2) / HLS_AUDIO_RATE
+    cmd = [
+        "ffmpeg", "-y",
+    ] + (["-threads", str(threads)] if threads else []) + [
+        "-copyts", "-start_at_zero",
+        "-ss", f"{start:.3f}", "-t", f"{HLS_SEGMENT_SEC:.3f}", "-i", path,
+        "-ss", f"{a_read / HLS_AUDIO_RATE:.6f}",
+        "-t", f"{(a_end + HLS_AUDIO_PREROLL * AAC_FRAME - a_read) / HLS_AUDIO_RATE:.6f}",
+        "-i", path,
+        "-map", "0:v:0", "-map", f"1:a:{atrack}?",
+        "-vf", "scale='min(1280,iw)':-2", "-pix_fmt", "yuv420p",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+        "-profile:v", "high", "-level", "4.1", "-bf", "0",
+        "-g", "1000", "-force_key_frames", "expr:eq(n,0)",
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2", "-ar", str(HLS_AUDIO_RATE),
+        "-bsf:a", f"noise=drop='lt(pts*tb,{keep_from:.6f})+gte(pts*tb,{keep_to:.6f})'",
+        "-video_track_timescale", "90000",
+        "-use_editlist", "1",
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof+frag_discont",
+        "-f", "mp4", part_path,
+    ]
+    t0 = time.monotonic()
+    _run_preview_encode([cmd], part_path, cancel, timeout=60)
+    try:
+        with open(part_path, "rb") as f:
+            init, media = _split_fmp4(f.read())
+    finally:
+        os.remove(part_path)
+    init_path = _init_path(path, atrack)
+    if not os.path.isfile(init_path):
+        _write_atomic(init_path, init)
+    _write_atomic(out_path, media)
+    cache.touch(init_path)
+    cache.touch(out_path)
+    log.info("HLS [%s seg=%d a=%d] built in %.2fs", os.path.basename(path), n, atrack,
+             time.monotonic() - t0)
+    return out_path
+
+
+segments = WindowScheduler(_encode_segment, _segment_path, HLS_SEGMENT_SEC, name="HLS",
+                           lookahead=HLS_LOOKAHEAD)
+
+
+def _hls_args():
+    path = request.args.get("path", "")
     try:
-        out_path = build_window(path, idx, atrack)
+        atrack = int(request.args.get("atrack", "0"))
+    except ValueError:
+        atrack = -1
+    if not path or not os.path.isfile(path) or atrack < 0:
+        return None, None
+    return path, atrack
+
+
+@app.route("/media/hls/index.m3u8")
+def hls_playlist():
+    """VOD playlist covering the whole file in HLS_SEGMENT_SEC segments.
+
+    Nothing is encoded here; segments are built when the player asks for them.
+    """
+    path, atrack = _hls_args()
+    if path is None:
+        return "Not found", 404
+    try:
+        duration = probe_media(path).duration
     except Exception as exc:
-        log.error("WINDOW [%s idx=%d a=%d] FAILED: %s", os.path.basename(path), idx, atrack, exc)
-        return "Window build failed", 500
-    return send_file(out_path, conditional=True)
+        return f"Probe failed: {exc}", 500
+    if not duration:
+        return "Unknown duration", 500
+
+    query = {"path": path, "atrack": atrack}
+    client = request.args.get("client")
+    if client:
+        query["client"] = client
+    qs = urlencode(query)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{HLS_SEGMENT_SEC}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f'#EXT-X-MAP:URI="init.mp4?{urlencode({"path": path, "atrack": atrack})}"',
+    ]
+    count = int(math.ceil(duration / HLS_SEGMENT_SEC))
+    for n in range(count):
+        length = min(HLS_SEGMENT_SEC, duration - n * HLS_SEGMENT_SEC)
+        lines += [f"#EXTINF:{length:.3f},", f"seg.m4s?{qs}&n={n}"]
+    lines.append("#EXT-X-ENDLIST")
+    return Response("\n".join(lines) + "\n", mimetype="application/vnd.apple.mpegurl",
+                    headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/media/hls/init.mp4")
+def hls_init():
+    """The shared init segment, written alongside whichever segment built first."""
+    path, atrack = _hls_args()
+    if path is None:
+        return "Not found", 404
+    init_path = _init_path(path, atrack)
+    if not os.path.isfile(init_path):
+        # Segment 0 is cheap; if it's cached but the init was evicted, rebuild it
+        # to get the init back.
+        seg0 = _segment_path(path, 0, atrack)
+        if os.path.isfile(seg0):
+            os.remove(seg0)
+        try:
+            segments.get(path, 0, atrack)
+        except Exception:
+            return "Init build failed", 500
+    return _send_cached(init_path, mimetype="video/mp4")
+
+
+@app.route("/media/hls/seg.m4s")
+def hls_segment():
+    path, atrack = _hls_args()
+    client = request.args.get("client") or None
+    try:
+        n = int(request.args.get("n", ""))
+    except ValueError:
+        return "Bad segment", 400
+    if path is None or n < 0:
+        return "Not found", 404
+    try:
+        out_path = segments.get(path, n, atrack, client=client)
+    except WindowSuperseded:
+        return "Superseded", 409
+    except Exception:
+        return "Segment build failed", 500
+    return _send_cached(out_path, mimetype="video/iso.segment")
 
 
 @app.route("/media/wave")
@@ -384,10 +1727,14 @@ def serve_wave():
     path_hash = hashlib.md5(path.encode()).hexdigest()[:12]
     wave_path = os.path.join(WAVE_DIR, f"{path_hash}.png")
     if os.path.isfile(wave_path):
-        return send_file(wave_path, mimetype="image/png")
+        return _send_cached(wave_path, mimetype="image/png")
 
-    if not has_audio(path):
-        return "No audio", 404
+    try:
+        if not probe_media(path).has_audio:
+            return "No audio", 404
+    except Exception as exc:
+        log.warning("WAVE probe failed for %s: %s", os.path.basename(path), exc)
+        return "Waveform failed", 500
 
     cmd = [
         "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
@@ -402,7 +1749,186 @@ def serve_wave():
         return "Waveform failed", 500
 
     log.info("WAVE built -> %s", os.path.basename(wave_path))
-    return send_file(wave_path, mimetype="image/png")
+    return _send_cached(wave_path, mimetype="image/png")
+
+
+# Most buckets one /media/peaks slice returns (about 256 KB).
+PEAKS_MAX_SLICE = 1 << 17
+
+
+@app.route("/media/peaks")
+def serve_peaks():
+    """Waveform peaks for one audio track, from the file's peak pyramid.
+
+    Without `level`: JSON {duration, complete, progress, levels: [{bucket_seconds,
+    count}]}; the first call starts the build. With `level`, `from` and `to`
+    (seconds): the buckets of that level covering the range, as raw int8 (min,
+    max) pairs; X-Peaks-First is the index of the first one. While the build
+    runs (complete=false) both answer from what has been decoded so far, so the
+    page polls and the waveform fills in. 501 when the server can't build peaks
+    (no NumPy), so the page falls back to /media/wave.
+    """
+    path = request.args.get("path", "")
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "File not found"}), 404
+    if not peaks.available():
+        return jsonify({"error": "numpy not installed"}), 501
+    try:
+        atrack = int(request.args.get("atrack", "0"))
+        level = request.args.get("level")
+        level = int(level) if level is not None else None
+        start = float(request.args.get("from", "0"))
+        end = float(request.args.get("to", "0"))
+    except ValueError:
+        return jsonify({"error": "Bad parameters"}), 400
+    try:
+        media = probe_media(path)
+        if atrack < 0 or atrack >= max(1, len(media.audio_tracks)) or not media.has_audio:
+            return jsonify({"error": "No such audio track"}), 404
+        pyramid = peaks.load_peaks(path, atrack, duration=media.duration,
+                                   directory=WAVE_DIR, wait=False)
+    except Exception as exc:
+        log.warning("PEAKS failed for %s: %s", os.path.basename(path), exc)
+        return jsonify({"error": "Peaks failed"}), 500
+    if isinstance(pyramid, peaks.PeakPyramid):
+        cache.touch(peaks.pyramid_path(path, atrack, WAVE_DIR))
+
+    if level is None:
+        return jsonify(pyramid.describe())
+    if not 0 <= level < len(pyramid.levels):
+        return jsonify({"error": "Bad level"}), 400
+    end = min(end, start + PEAKS_MAX_SLICE * pyramid.bucket_seconds(level))
+    first, data = pyramid.slice(level, start, end)
+    return Response(data, mimetype="application/octet-stream",
+                    headers={"X-Peaks-First": str(first),
+                             "X-Peaks-Bucket-Seconds": repr(pyramid.bucket_seconds(level))})
+
+
+# Hover-scrub thumbnails: one tile every `interval` seconds, SPRITE_COLS x
+# SPRITE_ROWS tiles to a sheet. The interval stretches on long files so the
+# whole set stays around SPRITE_MAX_TILES.
+SPRITE_WIDTH = 160
+SPRITE_COLS = 10
+SPRITE_ROWS = 10
+SPRITE_MIN_INTERVAL = 2
+SPRITE_MAX_TILES = 600
+_sprite_locks = {}
+_sprite_locks_guard = threading.Lock()
+
+
+def _sprite_stem(path, interval):
+    path_hash = hashlib.md5(path.encode()).hexdigest()[:12]
+    return os.path.join(WAVE_DIR, f"{path_hash}_sprites_{interval}")
+
+
+def build_sprites(path, interval=None):
+    """Build (or load) the sprite sheets for `path`; returns their index dict.
+
+    One ffmpeg pass that decodes keyframes only (-skip_frame nokey), so it costs
+    a fraction of a full decode: each tile is the latest keyframe at or before
+    its time. The JSON index is written last, so its presence means the sheets
+    are complete.
+    """
+    media = probe_media(path)
+    if not media.duration or not media.width or not media.height:
+        raise ValueError("no video to thumbnail")
+    if interval is None:
+        interval = max(SPRITE_MIN_INTERVAL,
+                       int(math.ceil(media.duration / SPRITE_MAX_TILES)))
+    stem = _sprite_stem(path, interval)
+    index_path = stem + ".json"
+
+    with _sprite_locks_guard:
+        lock = _sprite_locks.setdefault(index_path, threading.Lock())
+    with lock:
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if all(os.path.isfile(os.path.join(WAVE_DIR, name)) for name in index["sheets"]):
+                cache.touch(index_path)
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+
+        os.makedirs(WAVE_DIR, exist_ok=True)
+        ext = "webp" if has_encoder("libwebp") else "jpg"
+        tile_h = max(2, int(round(SPRITE_WIDTH * media.height / media.width / 2)) * 2)
+        tmp_stem = f"{stem}.{uuid.uuid4().hex[:8]}.part"
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-skip_frame", "nokey", "-i", path, "-map", "0:v:0", "-an", "-sn",
+            "-vf", (f"fps=1/{interval},scale={SPRITE_WIDTH}:{tile_h},"
+                    f"tile={SPRITE_COLS}x{SPRITE_ROWS}"),
+        ] + (["-quality", "60"] if ext == "webp" else ["-q:v", "5"]) + [
+            f"{tmp_stem}.%03d.{ext}",
+        ]
+        t0 = time.monotonic()
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, timeout=600)
+            parts = sorted(n for n in os.listdir(WAVE_DIR)
+                           if n.startswith(os.path.basename(tmp_stem) + "."))
+            sheets = []
+            for n, name in enumerate(parts):
+                sheet = f"{os.path.basename(stem)}_{n:03d}.{ext}"
+                os.replace(os.path.join(WAVE_DIR, name), os.path.join(WAVE_DIR, sheet))
+                cache.touch(os.path.join(WAVE_DIR, sheet))
+                sheets.append(sheet)
+        finally:
+            for name in os.listdir(WAVE_DIR):
+                if name.startswith(os.path.basename(tmp_stem)):
+                    os.remove(os.path.join(WAVE_DIR, name))
+
+        index = {
+            "interval": interval,
+            "count": int(math.ceil(media.duration / interval)),
+            "tile_width": SPRITE_WIDTH,
+            "tile_height": tile_h,
+            "cols": SPRITE_COLS,
+            "rows": SPRITE_ROWS,
+            "sheets": sheets,
+        }
+        _write_atomic(index_path, json.dumps(index).encode())
+        cache.touch(index_path)
+        log.info("SPRITES [%s] %d sheets every %ds in %.1fs", os.path.basename(path),
+                 len(sheets), interval, time.monotonic() - t0)
+        return index
+
+
+@app.route("/media/sprites")
+def serve_sprites():
+    """Index of the hover-scrub sprite sheets for `path`.
+
+    Tile i covers [i * interval, (i + 1) * interval) and sits on sheet
+    i // (cols * rows), at column i % cols and row (i // cols) % rows. Sheets
+    come from /media/sprites/sheet?path=...&n=N.
+    """
+    path = request.args.get("path", "")
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        index = build_sprites(path)
+    except Exception as exc:
+        log.warning("SPRITES failed for %s: %s", os.path.basename(path), exc)
+        return jsonify({"error": "Sprites failed"}), 500
+    return jsonify(index)
+
+
+@app.route("/media/sprites/sheet")
+def serve_sprite_sheet():
+    path = request.args.get("path", "")
+    try:
+        n = int(request.args.get("n", ""))
+    except ValueError:
+        return "Bad sheet", 400
+    if not path or not os.path.isfile(path) or n < 0:
+        return "Not found", 404
+    try:
+        index = build_sprites(path)  # rebuilds if a sheet has been evicted
+    except Exception:
+        return "Sprites failed", 500
+    if n >= len(index["sheets"]):
+        return "Not found", 404
+    return _send_cached(os.path.join(WAVE_DIR, index["sheets"][n]))
 
 
 def _scene_cuts(source, start_s, dur_s, thresh=0.3):
@@ -428,13 +1954,29 @@ def _scene_cuts(source, start_s, dur_s, thresh=0.3):
     return cuts
 
 
+def _scene_index(path):
+    """The file's SceneIndex, or None while its background scan runs (which
+    this starts on first use)."""
+    try:
+        duration = probe_media(path).duration
+    except Exception:
+        duration = None
+    try:
+        index = scenes.load_scene_index(path, duration, wait=False)
+    except Exception as exc:
+        log.warning("SCENES failed for %s: %s", os.path.basename(path), exc)
+        return None
+    return index if isinstance(index, scenes.SceneIndex) else None
+
+
 @app.route("/api/snapcuts", methods=["POST"])
 def snap_cuts():
     """Snap a trim edge to the nearest hard scene cut within +/- WINDOW.
 
     Start lands one frame *after* the cut and end one frame *before* it, so the
     slice never includes a frame from the neighbouring shot (the "double-cut
-    flash").
+    flash"). Answered from the file's scene index once it's built; until then
+    by scene detection over the window itself.
     """
     data = request.get_json(force=True)
     path = data.get("path", "")
@@ -448,24 +1990,34 @@ def snap_cuts():
         return jsonify({"error": "File not found"}), 404
 
     WINDOW = 0.3  # seconds either side
+    start_s = max(0.0, edge_s - WINDOW)
+    index = _scene_index(path)
+    if index is not None:
+        # 0.3 is a hard cut. Softer material (screen caps, dim scenes) never
+        # trips it, so fall back to a looser threshold rather than reporting
+        # "no cut" on a cut.
+        cuts = (index.cuts_between(start_s, edge_s + WINDOW, scenes.HARD_CUT)
+                or index.cuts_between(start_s, edge_s + WINDOW, scenes.SOFT_CUT))
+        if not cuts:
+            return jsonify({"ok": True, "cut": None})
+        nearest = min(cuts, key=lambda c: abs(c - edge_s))
+        # Same one-frame margins as below, from the real frame times.
+        if edge == "start":
+            snapped = index.frame_after(nearest) or nearest
+        else:
+            snapped = index.frame_before(nearest) or 0.0
+        log.info("SNAP [%s] %.3f -> %.3f (index)", edge, edge_s, snapped)
+        return jsonify({"ok": True, "cut": nearest, "seconds": snapped})
+
     try:
-        info = probe_video_info(path)
-        fps = 30.0
-        rate = info.get("r_frame_rate") or ""
-        if "/" in rate:
-            num, den = rate.split("/")
-            if float(den):
-                fps = float(num) / float(den)
+        fps = probe_media(path).fps or 30.0
     except Exception:
         fps = 30.0
     frame = 1.0 / fps
 
-    start_s = max(0.0, edge_s - WINDOW)
-    # 0.3 is a hard cut. Softer material (screen caps, dim scenes) never trips it,
-    # so fall back to a looser threshold rather than reporting "no cut" on a cut.
-    cuts = _scene_cuts(path, start_s, WINDOW * 2, thresh=0.3)
+    cuts = _scene_cuts(path, start_s, WINDOW * 2, thresh=scenes.HARD_CUT)
     if not cuts:
-        cuts = _scene_cuts(path, start_s, WINDOW * 2, thresh=0.15)
+        cuts = _scene_cuts(path, start_s, WINDOW * 2, thresh=scenes.SOFT_CUT)
     if not cuts:
         return jsonify({"ok": True, "cut": None})
 
@@ -475,6 +2027,69 @@ def snap_cuts():
     return jsonify({"ok": True, "cut": nearest, "seconds": snapped})
 
 
+@app.route("/api/scenecut")
+def scene_cut():
+    """The next (dir=next) or previous (dir=prev) scene cut from `t` seconds,
+    at `threshold` (default a hard cut). While the scene index is still being
+    built this answers 202 with its progress."""
+    path = request.args.get("path", "")
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "File not found"}), 404
+    try:
+        t = float(request.args.get("t", ""))
+        threshold = float(request.args.get("threshold", scenes.HARD_CUT))
+    except ValueError:
+        return jsonify({"error": "t required"}), 400
+    index = _scene_index(path)
+    if index is None:
+        try:
+            build = scenes.load_scene_index(path, wait=False)
+        except Exception:
+            return jsonify({"error": "Scene scan failed"}), 500
+        progress = build.progress() if isinstance(build, scenes.SceneBuild) else None
+        return jsonify({"ok": False, "building": True, "progress": progress}), 202
+    if request.args.get("dir") == "prev":
+        cut = index.prev_cut(t, threshold)
+    else:
+        cut = index.next_cut(t, threshold)
+    return jsonify({"ok": True, "cut": cut})
+
+
+def _submit_job(job_id, record, path, worker, lane="cpu", priority=INTERACTIVE):
+    """Queue `worker` as job `job_id`. `path` is pinned against cache eviction
+    (an uploaded source must outlive the job, however full .uploads gets) from
+    now until the job is done with, including any wait in the queue."""
+    cache.acquire(path)
+    try:
+        job_queue.submit(job_id, record, worker, lane=lane, priority=priority,
+                         release=lambda: cache.release(path))
+    except QueueFull:
+        cache.release(path)
+        raise
+
+
+def _parse_audio_track(value):
+    """Which source audio stream to keep. None => all tracks (the historic
+    default); an int matches the track the user picked for preview."""
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def _output_path(input_path, start_tc, stop_tc, ext):
+    """Output named after the original file and the cut's timecodes."""
+    basename = os.path.splitext(os.path.basename(input_path))[0]
+    start_safe = sanitize_timecode_for_filename(start_tc)
+    stop_safe = sanitize_timecode_for_filename(stop_tc)
+    out_dir = resolve_output_dir(input_path)
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, f"{basename}_sliced_{start_safe}_{stop_safe}{ext}")
+
+
 @app.route("/api/slice", methods=["POST"])
 def start_slice():
     data = request.get_json(force=True)
@@ -482,19 +2097,10 @@ def start_slice():
     start_tc = data.get("start", "")
     stop_tc = data.get("stop", "")
     # "accurate" re-encodes the whole span: exact frame count, slower.
-    # "fast" stream-copies the bulk: quicker, but the cut snaps to keyframes and
-    # can run a couple of frames long.
+    # "fast" stream-copies whole GOPs and re-encodes only up to the keyframes
+    # either side of each cut (smart cut): much quicker on long spans.
     mode = data.get("mode", "accurate")
-    # Which source audio stream to keep. None => all tracks (the historic
-    # default); an int matches the track the user picked for preview.
-    audio_track = data.get("audio_track")
-    if audio_track is not None:
-        try:
-            audio_track = int(audio_track)
-            if audio_track < 0:
-                audio_track = None
-        except (TypeError, ValueError):
-            audio_track = None
+    audio_track = _parse_audio_track(data.get("audio_track"))
 
     if not input_path or not os.path.isfile(input_path):
         return jsonify({"error": "Input file not found"}), 404
@@ -518,112 +2124,317 @@ def start_slice():
     if end_seconds <= start_seconds:
         return jsonify({"error": "Stop time must be greater than start time"}), 400
 
-    # Name output after original file; container picked from the source codec.
-    basename = os.path.splitext(os.path.basename(input_path))[0]
-    start_safe = sanitize_timecode_for_filename(start_tc)
-    stop_safe = sanitize_timecode_for_filename(stop_tc)
+    # Probe once here and hand the result to the cut, rather than letting every
+    # stage re-run ffprobe against the source. A GIF needs neither. If the probe
+    # fails, name the output .mp4 and let the cut report what's wrong.
+    media = None
     if mode == "gif":
         ext = ".gif"
     else:
         try:
-            info = probe_video_info(slice_input)
-            ext = get_output_extension(info.get("codec_name"))
-        except Exception:
-            ext = ".mp4"
+            media = probe_media(slice_input)
+        except Exception as exc:
+            log.warning("SLICE probe failed for %s: %s", os.path.basename(input_path), exc)
+        ext = get_output_extension(media.codec_name) if media else ".mp4"
 
-    out_dir = resolve_output_dir(input_path)
-    os.makedirs(out_dir, exist_ok=True)
-    output_path = os.path.join(out_dir, f"{basename}_sliced_{start_safe}_{stop_safe}{ext}")
+    output_path = _output_path(input_path, start_tc, stop_tc, ext)
 
+    msg_for_mode = {
+        "gif": "Making GIF...",
+        "fast": "Cutting (fast)...",
+        "accurate": "Cutting (frame-accurate)...",
+    }
     job_id = str(uuid.uuid4())[:8]
-    with jobs_lock:
-        jobs[job_id] = {
-            "status": "running",
-            "message": "Starting slice...",
-            "output_path": output_path,
-            "error": None,
-            "progress": 0,
-        }
+    record = {
+        "kind": "slice",
+        "message": msg_for_mode.get(mode, "Cutting..."),
+        "output_path": output_path,
+        "error": None,
+        "progress": 0,
+    }
     log.info("SLICE [%s] %s mode=%s atrack=%s [%s -> %s] -> %s", job_id,
              os.path.basename(input_path), mode, audio_track, start_tc, stop_tc,
              os.path.basename(output_path))
 
     def on_progress(pct):
+        # ffmpeg reports many times a second; only a new whole percent is news.
         with jobs_lock:
-            jobs[job_id]["progress"] = round(pct)
-
-    msg_for_mode = {
-        "gif": "Making GIF...",
-        "fast": "Cutting (fast)...",
-        "accurate": "Cutting (frame-accurate)...",
-    }
+            if jobs[job_id]["progress"] != round(pct):
+                jobs[job_id]["progress"] = round(pct)
+                job_bus.publish(job_id)
 
     def worker():
+        token = jobs[job_id]["cancel"]
         try:
-            with jobs_lock:
-                jobs[job_id]["message"] = msg_for_mode.get(mode, "Cutting...")
             if mode == "gif":
                 make_gif(slice_input, output_path, start_seconds, end_seconds,
-                         progress_cb=on_progress)
+                         progress_cb=on_progress, cancel=token)
             elif mode == "fast":
-                boundary_slice(slice_input, output_path, start_seconds, end_seconds,
-                               audio_track=audio_track)
+                used = boundary_slice(slice_input, output_path, start_seconds,
+                                      end_seconds, audio_track=audio_track, media=media,
+                                      cancel=token)
+                log.info("SLICE [%s] fast cut via %s", job_id, used)
             else:
                 used = accurate_cut(slice_input, output_path, start_seconds,
-                                    end_seconds, progress_cb=on_progress,
-                                    audio_track=audio_track)
+                                    end_seconds, media=media, progress_cb=on_progress,
+                                    audio_track=audio_track, cancel=token)
                 log.info("SLICE [%s] encoded on %s", job_id, used.upper())
             with jobs_lock:
                 jobs[job_id]["status"] = "complete"
                 jobs[job_id]["message"] = "Complete"
+                job_bus.publish(job_id)
             log.info("SLICE [%s] complete -> %s", job_id, os.path.basename(output_path))
+        except Cancelled:
+            # Temp dirs are already gone (TemporaryDirectory unwinds with the
+            # exception); the output itself may be half-written.
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+            with jobs_lock:
+                jobs[job_id]["status"] = "cancelled"
+                jobs[job_id]["message"] = "Cancelled"
+                job_bus.publish(job_id)
+            log.info("SLICE [%s] cancelled", job_id)
         except Exception as exc:
             with jobs_lock:
                 jobs[job_id]["status"] = "error"
                 jobs[job_id]["message"] = str(exc)
                 jobs[job_id]["error"] = str(exc)
+                job_bus.publish(job_id)
             log.error("SLICE [%s] FAILED: %s", job_id, exc)
 
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
+    # Only an accurate cut encodes on NVENC; a fast cut re-encodes seconds.
+    # Don't hold the request up for capability detection: until it's done the
+    # cut queues on the CPU lane (accurate_cut still tries NVENC when it runs).
+    lane = ("gpu" if mode == "accurate" and capabilities.ready and has_nvenc()
+            else "cpu")
+    try:
+        _submit_job(job_id, record, slice_input, worker, lane=lane,
+                    priority=BULK if mode == "gif" else INTERACTIVE)
+    except QueueFull as exc:
+        return jsonify({"error": f"Too many jobs queued ({exc}); try again shortly"}), 503
+
+    return jsonify({"job_id": job_id})
+
+
+@app.route("/api/slice/batch", methods=["POST"])
+def start_batch_slice():
+    """Cut many ranges from one source as a single job.
+
+    Body: {"path", "ranges": [{"start", "stop"}, ...], "mode", "audio_track"}.
+    Nearby ranges share one decode (see batch_cut); "fast" also lets long ranges
+    stream-copy via smart cut. The job reports per-range progress and results
+    under "ranges".
+    """
+    data = request.get_json(force=True)
+    input_path = data.get("path", "")
+    mode = data.get("mode", "accurate")
+    audio_track = _parse_audio_track(data.get("audio_track"))
+
+    if not input_path or not os.path.isfile(input_path):
+        return jsonify({"error": "Input file not found"}), 404
+    raw_ranges = data.get("ranges") or []
+    if not isinstance(raw_ranges, list) or not raw_ranges:
+        return jsonify({"error": "No ranges given"}), 400
+
+    try:
+        media = probe_media(input_path)
+    except Exception as exc:
+        return jsonify({"error": f"Probe failed: {exc}"}), 500
+    ext = get_output_extension(media.codec_name)
+
+    ranges = []
+    for n, item in enumerate(raw_ranges, 1):
+        start_tc, stop_tc = item.get("start", ""), item.get("stop", "")
+        try:
+            start_seconds = parse_timecode(start_tc)
+            end_seconds = parse_timecode(stop_tc)
+        except ValueError as exc:
+            return jsonify({"error": f"Range {n}: invalid timecode: {exc}"}), 400
+        if end_seconds <= start_seconds:
+            return jsonify({"error": f"Range {n}: stop must be after start"}), 400
+        ranges.append((start_seconds, end_seconds,
+                       _output_path(input_path, start_tc, stop_tc, ext)))
+
+    job_id = str(uuid.uuid4())[:8]
+    job = {
+        "kind": "batch",
+        "message": f"Cutting {len(ranges)} clips...",
+        "output_path": None,
+        "error": None,
+        "progress": 0,
+        "ranges": [{"output_path": out, "progress": 0, "status": "running",
+                    "error": None} for _, _, out in ranges],
+    }
+    log.info("BATCH [%s] %s mode=%s atrack=%s ranges=%d", job_id,
+             os.path.basename(input_path), mode, audio_track, len(ranges))
 
+    def on_progress(i, pct):
+        with jobs_lock:
+            if job["ranges"][i]["progress"] == round(pct):
+                return
+            job["ranges"][i]["progress"] = round(pct)
+            job["progress"] = round(sum(r["progress"] for r in job["ranges"])
+                                    / len(job["ranges"]))
+            job_bus.publish(job_id)
+
+    def worker():
+        try:
+            results = batch_cut(input_path, ranges, media=media, smart=mode == "fast",
+                                audio_track=audio_track, progress_cb=on_progress,
+                                cancel=job["cancel"])
+        except Cancelled:
+            for _, _, out in ranges:
+                try:
+                    os.remove(out)
+                except OSError:
+                    pass
+            with jobs_lock:
+                job["status"] = "cancelled"
+                job["message"] = "Cancelled"
+                job_bus.publish(job_id)
+            log.info("BATCH [%s] cancelled", job_id)
+            return
+        except Exception as exc:
+            with jobs_lock:
+                job["status"] = "error"
+                job["message"] = str(exc)
+                job["error"] = str(exc)
+                job_bus.publish(job_id)
+            log.error("BATCH [%s] FAILED: %s", job_id, exc)
+            return
+
+        failed = 0
+        with jobs_lock:
+            for entry, result in zip(job["ranges"], results):
+                entry["method"] = result["method"]
+                entry["error"] = result["error"]
+                entry["status"] = "error" if result["error"] else "complete"
+                failed += bool(result["error"])
+            job["progress"] = 100
+            if failed == len(results):
+                job["status"] = "error"
+                job["error"] = job["message"] = "Every range failed"
+            else:
+                job["status"] = "complete"
+                job["message"] = (f"Complete ({failed} of {len(results)} failed)"
+                                  if failed else "Complete")
+            job_bus.publish(job_id)
+        log.info("BATCH [%s] done: %d ok, %d failed", job_id,
+                 len(results) - failed, failed)
+
+    try:
+        _submit_job(job_id, job, input_path, worker, priority=BULK)
+    except QueueFull as exc:
+        return jsonify({"error": f"Too many jobs queued ({exc}); try again shortly"}), 503
     return jsonify({"job_id": job_id})
 
 
+def _job_view(job):
+    """The client-facing part of a job (call with jobs_lock held)."""
+    view = {"status": job["status"], "message": job["message"],
+            "error": job["error"], "progress": job.get("progress"),
+            "output_path": job.get("output_path")}
+    if "ranges" in job:
+        view["ranges"] = [dict(r) for r in job["ranges"]]
+    return view
+
+
+@app.route("/api/cache")
+def cache_stats():
+    """Cache counters, so it's visible whether the caches are actually paying off."""
+    return jsonify({"probe": probe_cache_stats(), "capabilities": capabilities.as_dict(),
+                    "windows": windows.stats(), "hls": segments.stats(),
+                    "disk": cache.stats(), "jobs": job_queue.stats(),
+                    "media_index": media_index.stats()})
+
+
 @app.route("/api/job/<job_id>")
 def job_status(job_id):
     with jobs_lock:
         job = jobs.get(job_id)
-    if not job:
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        view = _job_view(job)
+    return jsonify(view)
+
+
+@app.route("/api/job/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        status = job["status"] if job else None
+    if status is None:
         return jsonify({"error": "Job not found"}), 404
-    return jsonify({
-        "status": job["status"],
-        "message": job["message"],
-        "error": job["error"],
-        "progress": job.get("progress"),
-        "output_path": job.get("output_path"),
-    })
+    if status in ("queued", "running"):
+        log.info("SLICE [%s] cancel requested", job_id)
+        job_queue.cancel(job_id)
+        with jobs_lock:
+            status = job["status"]
+    return jsonify({"status": status})
+
+
+def _cancel_if_orphaned(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        orphaned = (job and job["status"] in ("queued", "running")
+                    and job["watchers"] == 0)
+    if orphaned:
+        log.info("SLICE [%s] no clients left, cancelling", job_id)
+        job_queue.cancel(job_id)
 
 
 @app.route("/api/job/<job_id>/stream")
 def job_stream(job_id):
     def generate():
+        with jobs_lock:
+            job = jobs.get(job_id)
+            if job:
+                job["watchers"] += 1
+        if not job:
+            yield f"data: {json.dumps({'status': 'error', 'message': 'Job not found'})}\n\n"
+            return
         last_msg = None
-        while True:
+        last_sent = 0.0
+        seen = None
+        try:
+            while True:
+                with jobs_lock:
+                    # Sleeps until the job changes (or it's time for a keepalive).
+                    if seen is not None:
+                        job_bus.wait(job_id, seen, SSE_KEEPALIVE_SEC)
+                    seen = job_bus.version(job_id)
+                    msg = _job_view(job)
+                finished = msg["status"] in FINISHED
+                if msg != last_msg and not finished:
+                    # Let a burst of updates settle into its latest state.
+                    delay = last_sent + SSE_MIN_INTERVAL - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                        with jobs_lock:
+                            seen = job_bus.version(job_id)
+                            msg = _job_view(job)
+                        finished = msg["status"] in FINISHED
+                if msg != last_msg:
+                    yield f"data: {json.dumps(msg)}\n\n"
+                    last_msg = msg
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SEC:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+                if finished:
+                    break
+        finally:
+            # Runs on normal exit and when the client disconnects (the server
+            # closes the generator once a write fails).
             with jobs_lock:
-                job = jobs.get(job_id)
-            if not job:
-                yield f"data: {__import__('json').dumps({'status': 'error', 'message': 'Job not found'})}\n\n"
-                break
-            msg = {"status": job["status"], "message": job["message"],
-                   "error": job["error"], "progress": job.get("progress"),
-                   "output_path": job.get("output_path")}
-            if msg != last_msg:
-                yield f"data: {__import__('json').dumps(msg)}\n\n"
-                last_msg = msg
-            if job["status"] in ("complete", "error"):
-                break
-            time.sleep(0.5)
+                job["watchers"] -= 1
+                orphaned = job["watchers"] == 0 and job["status"] not in FINISHED
+            if orphaned and app.config.get("CANCEL_ORPHANED_JOBS"):
+                timer = threading.Timer(ORPHAN_GRACE_SEC, _cancel_if_orphaned, (job_id,))
+                timer.daemon = True
+                timer.start()
 
     return Response(generate(), mimetype="text/event-stream",
                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -637,7 +2448,9 @@ def job_download(job_id):
         return "Job not found", 404
     if job["status"] != "complete":
         return "Job not complete", 400
-    return send_file(job["output_path"], as_attachment=True)
+    if not job.get("output_path"):
+        return "Batch jobs have one file per range (see ranges[].output_path)", 400
+    return send_media(job["output_path"], as_attachment=True)
 
 
 def main():
@@ -649,7 +2462,58 @@ def main():
     parser.add_argument("--debug", action="store_true", help="Enable Flask debug mode")
     parser.add_argument("--i-know-its-exposed", action="store_true",
                         help="Required to bind a non-localhost host (see warning below)")
+    parser.add_argument("--cancel-orphaned-jobs", action="store_true",
+                        help="Cancel a running slice once every browser watching it "
+                             "has disconnected")
+    parser.add_argument("--preview", choices=PREVIEW_MODES, default="hls",
+                        help="How files the browser can't play are previewed: short "
+                             "on-demand HLS segments (default) or 60s blocks")
+    parser.add_argument("--no-background-proxy", action="store_true",
+                        help="Don't encode the rest of a block-previewed file in the "
+                             "background (blocks are then only built on demand)")
+    parser.add_argument("--cache-budget", action="append", default=[], metavar="SIZE",
+                        help="Disk budget for the caches: one SIZE (e.g. 20G) for each "
+                             f"of {'/'.join(CACHE_BUDGETS)}, or AREA=SIZE; repeatable. "
+                             "0 means unlimited.")
+    parser.add_argument("--cpu-jobs", type=int, default=CPU_JOBS, metavar="N",
+                        help=f"Cuts run at once on the CPU (default: {CPU_JOBS}); more "
+                             "wait in a queue, interactive cuts ahead of GIFs and batches")
+    parser.add_argument("--gpu-jobs", type=int, default=GPU_JOBS, metavar="N",
+                        help=f"Frame-accurate cuts run at once on NVENC (default: "
+                             f"{GPU_JOBS}); 0 sends them to the CPU queue")
+    parser.add_argument("--production", action="store_true",
+                        help="Serve with gunicorn (threaded, sendfile() for media) "
+                             "instead of Flask's development server")
+    parser.add_argument("--threads", type=int, default=PRODUCTION_THREADS, metavar="N",
+                        help="Request threads with --production (default: "
+                             f"{PRODUCTION_THREADS}); each open preview or progress "
+                             "stream holds one")
+    parser.add_argument("--x-accel-redirect", metavar="PREFIX",
+                        help="Behind nginx: answer file requests with an "
+                             "X-Accel-Redirect to PREFIX + the file's absolute path, "
+                             "for an internal location that aliases / (see README)")
     args = parser.parse_args()
+    app.config["CANCEL_ORPHANED_JOBS"] = args.cancel_orphaned_jobs
+    app.config["PREVIEW_MODE"] = args.preview
+    app.config["BACKGROUND_PROXY"] = not args.no_background_proxy
+    app.config["X_ACCEL_REDIRECT"] = args.x_accel_redirect
+
+    for spec in args.cache_budget:
+        for item in spec.split(","):
+            area, _, size = item.rpartition("=")
+            try:
+                budget = parse_size(size)
+            except ValueError as exc:
+                parser.error(f"--cache-budget: {exc}")
+            if area and area not in CACHE_BUDGETS:
+                parser.error(f"--cache-budget: unknown area {area!r} "
+                             f"(use {', '.join(CACHE_BUDGETS)})")
+            for name in [area] if area else CACHE_BUDGETS:
+                cache.set_budget(name, budget)
+    if args.cpu_jobs < 1:
+        parser.error("--cpu-jobs must be at least 1")
+    if args.threads < 1:
+        parser.error("--threads must be at least 1")
 
     # This server serves any file on disk by absolute path and has no auth — that
     # is fine bound to localhost, but binding to a public/LAN interface hands
@@ -668,8 +2532,55 @@ def main():
 
     log.info("Starting slice UI at http://%s:%s (logging to %s)",
              args.host, args.port, LOG_FILE)
-    log.info("Preview proxy acceleration: %s", "GPU (NVENC)" if HAS_NVENC else "CPU (libx264)")
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    if args.production:
+        _serve_production(args)
+    else:
+        _start_background(args)
+        app.run(host=args.host, port=args.port, debug=args.debug)
+
+
+def _start_background(args):
+    """Start the threads the app runs on: the cache scan, the job workers, the
+    media index refresh and ffmpeg capability detection."""
+    cache.start()
+    job_queue.start({"cpu": args.cpu_jobs, "gpu": args.gpu_jobs})
+    media_index.start(_locate_roots)
+    # Detection runs in the background (and is usually a disk-cache read), so
+    # the server is up before ffmpeg has even been asked.
+    capabilities.start(callback=lambda caps: log.info(
+        "Preview proxy acceleration: %s (ffmpeg capabilities from %s)",
+        "GPU (NVENC)" if gpu_preview_available() else "CPU (libx264)", caps.source))
+
+
+def _serve_production(args):
+    """Run under gunicorn's threaded worker.
+
+    One worker process: jobs, preview schedulers and the cache index live in
+    this process's memory, so requests scale across threads, not processes.
+    Threads don't survive the fork, so they're started in the worker.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:  # optional: only --production needs it
+        sys.exit("--production needs gunicorn (pip install gunicorn)")
+
+    class Server(BaseApplication):
+        def load_config(self):
+            host = f"[{args.host}]" if ":" in args.host else args.host
+            self.cfg.set("bind", [f"{host}:{args.port}"])
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("sendfile", True)
+            # Long cuts and SSE streams are normal; this only bounds a hung worker.
+            self.cfg.set("timeout", 120)
+            self.cfg.set("graceful_timeout", 10)
+            self.cfg.set("post_fork", lambda server, worker: _start_background(args))
+
+        def load(self):
+            return app
+
+    Server().run()
 
 
 if __name__ == "__main__":